@@ -8,7 +8,8 @@ setup(
         "fastapi>=0.95.0",
         "uvicorn>=0.22.0",
         "pydantic>=2.0.0",
-        "sqlalchemy>=2.0.0",
+        "sqlalchemy[asyncio]>=2.0.0",
+        "aiosqlite>=0.19.0",
         "requests>=2.31.0",
         "markdown>=3.5.1",
         "beautifulsoup4>=4.12.0",
@@ -1,19 +1,56 @@
+import re
+import threading
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
 from .models import TextChunk, ChunkWithEmbedding
+from .text_chunker import approximate_token_count, approximate_token_counts
+from .cache import LRUCache
+from .embedding_store import EmbeddingStore, EMBEDDING_STORE_ENABLED, get_embedding_store, text_hash
 from sentence_transformers import SentenceTransformer # 导入 SentenceTransformer
 
 # 这是一个示例配置，实际中你可能需要从配置文件或环境变量加载
 EMBEDDING_MODEL_CONFIG = {
     "provider": "sentence_transformers", # 'openai', 'sentence_transformers', etc.
-    "model_name": "all-MiniLM-L6-v2" # if sentence_transformers
+    "model_name": "all-MiniLM-L6-v2", # if sentence_transformers
+    "device": None # 推理设备 (e.g., 'cpu', 'cuda', 'mps')，None 表示由 sentence-transformers 自动选择
 }
 
+# 查询向量缓存的容量和存活秒数 (None 表示不过期)
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+QUERY_EMBEDDING_CACHE_TTL: Optional[float] = None
+# 批量向量化时每次送入模型的文本数
+EMBEDDING_BATCH_SIZE = 64
+
 class BaseEmbeddingModel(ABC):
+    @property
+    def model_id(self) -> str:
+        """模型标识，相同标识的模型对相同文本生成相同的向量 (用作查询向量缓存键)"""
+        return f"{type(self).__name__}:{id(self)}"
+
+    @property
+    def persistent(self) -> bool:
+        """model_id 是否跨进程稳定，只有这样的模型的向量才写入持久化向量缓存"""
+        return False
+
     @abstractmethod
     def get_embeddings(self, texts: List[str]) -> List[List[float]]:
         pass
 
+    def encode(self, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+        """批量生成向量，返回形状为 (len(texts), dim) 的 float32 数组"""
+        return np.asarray(self.get_embeddings(texts), dtype=np.float32)
+
+    def count_tokens(self, text: str) -> int:
+        """文本经模型分词后的 token 数 (不含特殊 token)，用于按 token 数分块"""
+        return approximate_token_count(text)
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """批量计算 token 数，与逐个调用 count_tokens 的结果相同"""
+        return approximate_token_counts(texts)
+
 class PlaceholderEmbeddingModel(BaseEmbeddingModel):
     """
     一个占位符嵌入模型，返回固定长度的零向量。
@@ -23,6 +60,10 @@ class PlaceholderEmbeddingModel(BaseEmbeddingModel):
         self.dimension = dimension
         print(f"WARNING: Using PlaceholderEmbeddingModel. Replace with a real embedding model for production.")
 
+    @property
+    def model_id(self) -> str:
+        return f"placeholder:{self.dimension}"
+
     def get_embeddings(self, texts: List[str]) -> List[List[float]]:
         return [[0.0] * self.dimension for _ in texts]
 
@@ -30,34 +71,119 @@ class SentenceTransformerEmbeddingModel(BaseEmbeddingModel):
     """
     使用 sentence-transformers 库的嵌入模型。
     """
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
-        print(f"Using SentenceTransformer model: {model_name}")
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", device: Optional[str] = None):
+        self.model = SentenceTransformer(model_name, device=device)
+        self.model_name = model_name
+        # 同一个模型实例在多个请求线程之间共享，分词器不支持并发调用，推理时串行执行
+        self._lock = threading.Lock()
+        print(f"Using SentenceTransformer model: {model_name} on {self.model.device}")
+
+    @property
+    def model_id(self) -> str:
+        # 推理设备不影响向量，同一模型在不同设备上共享缓存
+        return f"sentence_transformers:{self.model_name}"
+
+    @property
+    def persistent(self) -> bool:
+        return True
 
     def get_embeddings(self, texts: List[str]) -> List[List[float]]:
         # sentence-transformers 的 encode 方法直接返回 numpy 数组，需要转换为 List[List[float]]
-        embeddings = self.model.encode(texts).tolist()
-        return embeddings
+        with self._lock:
+            embeddings = self.model.encode(texts)
+        return embeddings.tolist()
+
+    def encode(self, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+        with self._lock:
+            embeddings = self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                           show_progress_bar=False)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def count_tokens(self, text: str) -> int:
+        with self._lock:
+            return len(self.model.tokenizer.tokenize(text))
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        # 一次加锁、一次分词器调用 (fast tokenizer 在内部批量处理)，不截断、不加特殊 token
+        if not texts:
+            return []
+        with self._lock:
+            encoded = self.model.tokenizer(texts, add_special_tokens=False, truncation=False,
+                                           return_attention_mask=False, return_token_type_ids=False)
+        return [len(input_ids) for input_ids in encoded["input_ids"]]
+
+
+# 进程级模型注册表，键为 (provider, model_name, device)，每个模型每个进程只加载一次
+_models: Dict[Tuple[str, str, Optional[str]], BaseEmbeddingModel] = {}
+_models_lock = threading.Lock()
+
+def get_embedding_model(provider: Optional[str] = None, model_name: Optional[str] = None,
+                        device: Optional[str] = None) -> BaseEmbeddingModel:
+    """
+    获取进程级共享的嵌入模型，首次调用时加载。
+
+    Args:
+        provider: 模型提供方，默认取 EMBEDDING_MODEL_CONFIG。
+        model_name: 模型名称，默认取 EMBEDDING_MODEL_CONFIG。
+        device: 推理设备，默认取 EMBEDDING_MODEL_CONFIG。
+
+    Returns:
+        已加载的模型实例，相同的 (provider, model_name, device) 总是返回同一个实例。
+    """
+    key = (
+        str(provider or EMBEDDING_MODEL_CONFIG.get("provider")),
+        str(model_name or EMBEDDING_MODEL_CONFIG.get("model_name")),
+        device or EMBEDDING_MODEL_CONFIG.get("device"),
+    )
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = _load_embedding_model(*key)
+                _models[key] = model
+    return model
+
+# 进程级查询向量缓存，键为 (model_id, 归一化的查询文本)，在所有 EmbeddingComponent 之间共享
+_query_cache = LRUCache(max_size=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL)
+_WHITESPACE = re.compile(r'\s+')
+
+def query_embedding_cache_stats() -> Dict[str, Any]:
+    """查询向量缓存的命中率等统计"""
+    return _query_cache.stats()
+
+def _load_embedding_model(provider: str, model_name: str, device: Optional[str]) -> BaseEmbeddingModel:
+    if provider == "openai":
+        # return OpenAIEmbeddingModel(model_name=model_name)
+        raise NotImplementedError("OpenAIEmbeddingModel not implemented yet.")
+    elif provider == "sentence_transformers":
+        return SentenceTransformerEmbeddingModel(model_name=model_name, device=device)
+    else:
+        return PlaceholderEmbeddingModel()
 
 class EmbeddingComponent:
     """
     向量嵌入组件，负责将文本块转化为向量。
     """
-    def __init__(self, embedding_model: Optional[BaseEmbeddingModel] = None):
+    def __init__(self, embedding_model: Optional[BaseEmbeddingModel] = None, device: Optional[str] = None,
+                 embedding_store: Optional[EmbeddingStore] = None):
+        """
+        Args:
+            embedding_model: 可选，直接使用的模型实例；不传时从进程级注册表获取 EMBEDDING_MODEL_CONFIG 配置的模型。
+            device: 可选，覆盖 EMBEDDING_MODEL_CONFIG 中的推理设备。
+            embedding_store: 可选，持久化向量缓存；不传时在 EMBEDDING_STORE_ENABLED 开启且模型标识稳定时使用进程级共享缓存。
+        """
         if embedding_model:
             self.model = embedding_model
         else:
-            provider = EMBEDDING_MODEL_CONFIG.get("provider")
-            model_name = EMBEDDING_MODEL_CONFIG.get("model_name")
-
-            if provider == "openai":
-                # self.model = OpenAIEmbeddingModel(model_name=model_name)
-                raise NotImplementedError("OpenAIEmbeddingModel not implemented yet.")
-            elif provider == "sentence_transformers":
-                self.model = SentenceTransformerEmbeddingModel(model_name=str(model_name))
-            else:
-                self.model = PlaceholderEmbeddingModel()
+            self.model = get_embedding_model(device=device)
+        if embedding_store is None and EMBEDDING_STORE_ENABLED and self.model.persistent:
+            embedding_store = get_embedding_store()
+        self.store = embedding_store
 
+    def warm_up(self):
+        """执行一次推理，让模型在服务启动时完成延迟初始化，而不是在第一个请求中"""
+        self.model.get_embeddings(["warm up"])
 
     def embed_chunks(self, chunks: List[TextChunk]) -> List[ChunkWithEmbedding]:
         """
@@ -73,7 +199,7 @@ class EmbeddingComponent:
             return []
 
         texts_to_embed = [chunk.text for chunk in chunks]
-        embeddings = self.model.get_embeddings(texts_to_embed)
+        embeddings = self.embed_texts(texts_to_embed).tolist()
 
         chunks_with_embeddings = []
         for chunk, embedding in zip(chunks, embeddings):
@@ -85,13 +211,71 @@ class EmbeddingComponent:
             )
         return chunks_with_embeddings
 
+    def embed_texts(self, texts: Sequence[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+        """
+        批量生成向量 (例如汇集了多个文档的全部块)。
+
+        先按 (model_id, 文本的 SHA-256) 查询持久化向量缓存，只有未命中的文本 (相同文本只算一次) 送入模型并写回缓存。
+        文本按长度排序后每 batch_size 个一批送入模型，同一批内的文本长度相近，填充 (padding) 的开销最小；
+        结果按输入顺序写回。
+
+        Args:
+            texts: 待向量化的文本。
+            batch_size: 每批送入模型的文本数。
+
+        Returns:
+            形状为 (len(texts), dim) 的 float32 数组，第 i 行对应 texts[i]。
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be a positive integer.")
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if self.store is None:
+            return self._encode_by_length(texts, batch_size)
+
+        model_id = self.model.model_id
+        hashes = [text_hash(text) for text in texts]
+        cached = self.store.get_many(model_id, hashes)
+        # 未命中的文本，按摘要去重
+        missing: Dict[bytes, str] = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in cached:
+                missing.setdefault(digest, text)
+        if missing:
+            computed = self._encode_by_length(list(missing.values()), batch_size)
+            self.store.put_many(model_id, list(missing), computed)
+            cached.update(zip(missing, computed))
+        return np.stack([cached[digest] for digest in hashes])
+
+    def _encode_by_length(self, texts: Sequence[str], batch_size: int) -> np.ndarray:
+        """按长度分桶送入模型，结果按输入顺序排列"""
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings: Optional[np.ndarray] = None
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            vectors = self.model.encode([texts[i] for i in bucket], batch_size=batch_size)
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            embeddings[bucket] = vectors
+        return embeddings
+
     def embed_query(self, query_text: str) -> List[float]:
         """
         将查询文本转化为向量。
+        相同模型对归一化后 (去掉首尾空白、合并连续空白) 相同的查询只计算一次，结果保存在进程级 LRU 缓存中。
         """
         if not query_text:
             return []
-        return self.model.get_embeddings([query_text])[0]
+        normalized = _WHITESPACE.sub(' ', query_text).strip()
+        if not normalized:
+            return []
+        key = (self.model.model_id, normalized)
+        embedding = _query_cache.get(key)
+        if embedding is None:
+            embedding = tuple(self.model.get_embeddings([normalized])[0])
+            _query_cache.put(key, embedding)
+        # 缓存中保存不可变的元组，返回副本，调用方修改结果不会影响缓存
+        return list(embedding)
 
 # TODO: 实现具体的 EmbeddingModel 类，例如:
 # class OpenAIEmbeddingModel(BaseEmbeddingModel): ...
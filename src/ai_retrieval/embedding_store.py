@@ -0,0 +1,143 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# 使用绝对路径，与 ChromaDB 数据放在同一目录下
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+EMBEDDING_STORE_PATH = os.path.join(project_root, "database/embedding_cache.sqlite3")
+# 是否在生成块向量前查询持久化向量缓存
+EMBEDDING_STORE_ENABLED = True
+# 每条 SELECT ... IN (...) 查询的哈希数，低于 SQLite 的参数个数上限
+_LOOKUP_BATCH = 500
+
+def text_hash(text: str) -> bytes:
+    """块文本的 SHA-256 摘要，作为缓存键的一部分"""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+class EmbeddingStore:
+    """
+    持久化的块向量缓存，键为 (model_id, 块文本的 SHA-256)，值为 float32 向量的原始字节。
+
+    重建向量集合、调整分块重叠或重新上传编辑过的页面时，未改变的块文本直接从这里读取向量，
+    只有新的文本才需要经过嵌入模型。
+    """
+    def __init__(self, path: str = EMBEDDING_STORE_PATH):
+        """
+        Args:
+            path: SQLite 数据库文件路径，不存在时自动创建。
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 连接在多个请求线程之间共享，由 _lock 串行化访问
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model_id TEXT NOT NULL,"
+            " text_hash BLOB NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model_id, text_hash)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+
+    def get_many(self, model_id: str, hashes: Iterable[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        批量读取向量。
+
+        Args:
+            model_id: 生成向量的模型标识。
+            hashes: 块文本的 SHA-256 摘要。
+
+        Returns:
+            命中的 {摘要: float32 向量}，未命中的摘要不在结果中。
+        """
+        hashes = list(dict.fromkeys(hashes))
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = hashes[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model_id = ? AND text_hash IN ({placeholders})",
+                    [model_id, *batch]
+                )
+                for digest, vector in rows:
+                    found[bytes(digest)] = np.frombuffer(vector, dtype=np.float32)
+            self._hits += len(found)
+            self._misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model_id: str, hashes: List[bytes], vectors: np.ndarray):
+        """
+        批量写入向量，已存在的键被覆盖。
+
+        Args:
+            model_id: 生成向量的模型标识。
+            hashes: 块文本的 SHA-256 摘要。
+            vectors: 形状为 (len(hashes), dim) 的数组，第 i 行对应 hashes[i]。
+        """
+        if not hashes:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model_id, text_hash, vector) VALUES (?, ?, ?)",
+                ((model_id, digest, vector.tobytes()) for digest, vector in zip(hashes, vectors))
+            )
+            self._conn.commit()
+            self._writes += len(hashes)
+
+    def clear(self, model_id: Optional[str] = None):
+        """删除缓存的向量；传入 model_id 时只删除该模型的向量"""
+        with self._lock:
+            if model_id is None:
+                self._conn.execute("DELETE FROM embeddings")
+            else:
+                self._conn.execute("DELETE FROM embeddings WHERE model_id = ?", (model_id,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """条目数、命中、未命中、写入次数和命中率"""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self._hits + self._misses
+            return {
+                "path": self.path,
+                "size": size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "writes": self._writes,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# 进程级向量缓存，键为数据库文件路径，同一文件只打开一个连接
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+def get_embedding_store(path: str = EMBEDDING_STORE_PATH) -> EmbeddingStore:
+    """获取进程级共享的持久化向量缓存，首次调用时打开"""
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(path)
+            if store is None:
+                store = EmbeddingStore(path)
+                _stores[path] = store
+    return store
@@ -1,41 +1,58 @@
 import os
 import shutil
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 
-from .models import TextChunk, ChunkWithEmbedding
-from .text_chunker import TextChunkingComponent, CharacterTextSplitter
-from .embedder import EmbeddingComponent # 移除 PlaceholderEmbeddingModel
-from .vector_db_manager import VectorDBManager, CHROMA_DB_PATH
+from .models import TextChunk
+from .text_chunker import TextChunkingComponent, SentenceTextSplitter
+from .embedder import EmbeddingComponent, EMBEDDING_BATCH_SIZE # 移除 PlaceholderEmbeddingModel
+from .vector_db_manager import ChunkWriteBuffer, VectorDBManager, CHROMA_DB_PATH
 
 class DocumentIngestor:
     """
     负责接收文档数据，进行分块、嵌入，并存储到向量数据库的组件。
     """
     def __init__(self,
-                 chunk_size: int = 100,
-                 chunk_overlap: int = 20,
-                 embedding_dimension: int = 768):
+                 chunk_size: int = 200,
+                 chunk_overlap: int = 32,
+                 embedding_dimension: int = 768,
+                 embedder: Optional[EmbeddingComponent] = None,
+                 db_manager: Optional[VectorDBManager] = None):
         """
         初始化文档摄取器。
 
         Args:
-            chunk_size (int): 文本分块的大小。
-            chunk_overlap (int): 文本分块的重叠大小。
+            chunk_size (int): 每块的最大 token 数 (按嵌入模型的分词器计算)。
+            chunk_overlap (int): 相邻块之间重叠的最大 token 数。
             embedding_dimension (int): 嵌入模型的维度。
+            embedder (EmbeddingComponent): 可选，复用已加载的嵌入组件。
+            db_manager (VectorDBManager): 可选，复用已打开的向量数据库管理器。
         """
-        self.chunker = TextChunkingComponent(splitter=CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap))
-        # 直接初始化 EmbeddingComponent，它会根据 EMBEDDING_MODEL_CONFIG 选择模型
-        self.embedder = EmbeddingComponent()
-        self.db_manager = VectorDBManager()
-
-    def ingest_document(self, document_text: str, document_id: str, document_metadata: Dict[str, Any]):
+        # 未传入时直接初始化 EmbeddingComponent，它会根据 EMBEDDING_MODEL_CONFIG 选择模型
+        self.embedder = embedder or EmbeddingComponent()
+        # 按句子和标题边界分块，块大小用嵌入模型的分词器计算，与模型的最大输入长度对应
+        self.chunker = TextChunkingComponent(splitter=SentenceTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=self.embedder.model.count_tokens,
+            batch_length_function=self.embedder.model.count_tokens_batch
+        ))
+        self.db_manager = db_manager or VectorDBManager()
+
+    def ingest_document(self, document_text: str, document_id: str, document_metadata: Dict[str, Any]) -> Dict[str, int]:
         """
         摄取单个文档，处理并存储到向量数据库。
 
+        块 ID 由文档 ID、块序号和块文本决定，重新摄取时与向量数据库中已有的块比较：
+        只为新增的块生成向量，删除不再存在的块，未改变的块只在元数据变化时更新元数据。
+        重复摄取同一内容不会产生重复的块。
+
         Args:
             document_text (str): 文档的原始文本内容。
             document_id (str): 文档的唯一标识符。
             document_metadata (Dict[str, Any]): 文档的元数据。
+
+        Returns:
+            新增、删除和保留的块数 {"added", "removed", "unchanged"}。
         """
         print(f"\n--- Ingesting Document: {document_id} ---")
 
@@ -48,16 +65,58 @@ class DocumentIngestor:
         )
         print(f"Generated {len(text_chunks)} text chunks.")
 
-        # 步骤 2: 生成嵌入
-        print("Step 2: Generating embeddings...")
-        chunks_with_embeddings: list[ChunkWithEmbedding] = self.embedder.embed_chunks(text_chunks)
-        print(f"Generated embeddings for {len(chunks_with_embeddings)} chunks.")
-
-        # 步骤 3: 添加到向量数据库
-        print("Step 3: Adding chunks to Vector DB...")
-        self.db_manager.add_chunks(chunks_with_embeddings)
-        print("Chunks added to DB successfully.")
+        # 步骤 2: 与向量数据库中已有的块比较
+        existing = self.db_manager.get_document_chunk_metadata(document_id)
+        new_ids = {chunk.id for chunk in text_chunks}
+        added = [chunk for chunk in text_chunks if chunk.id not in existing]
+        removed = [chunk_id for chunk_id in existing if chunk_id not in new_ids]
+        stale = [chunk for chunk in text_chunks
+                 if chunk.id in existing and existing[chunk.id] != self.db_manager.chunk_metadata(chunk)]
+        print(f"Chunks added: {len(added)}, removed: {len(removed)}, unchanged: {len(text_chunks) - len(added)}.")
+
+        # 步骤 3: 只为新增的块生成嵌入并写入，再删除旧块 (先写后删，文档在更新期间始终可检索)
+        if added:
+            print("Step 3: Generating embeddings for new chunks...")
+            embeddings = self.embedder.embed_texts([chunk.text for chunk in added])
+            self.db_manager.add_embeddings(added, embeddings)
+        self.db_manager.update_chunk_metadata(
+            [chunk.id for chunk in stale], [self.db_manager.chunk_metadata(chunk) for chunk in stale]
+        )
+        self.db_manager.delete_chunks(removed)
         print(f"--- Document {document_id} Ingestion Complete ---")
+        return {"added": len(added), "removed": len(removed), "unchanged": len(text_chunks) - len(added)}
+
+    def ingest_documents(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]],
+                         batch_size: int = EMBEDDING_BATCH_SIZE,
+                         writer: Optional[ChunkWriteBuffer] = None) -> List[str]:
+        """
+        批量摄取多个文档：汇集所有文档的块，按长度分桶批量生成向量，再一次写入向量数据库。
+
+        Args:
+            documents: (document_text, document_id, document_metadata)
+            batch_size: 每批送入嵌入模型的块数。
+            writer: 可选，跨多次调用累积写入的缓冲区；不传时直接写入向量数据库。
+
+        Returns:
+            已写入向量数据库 (或已加入 writer) 的文档 ID (没有文本的文档不产生块，也包含在内)。
+        """
+        chunks: list[TextChunk] = []
+        document_ids = []
+        for document_text, document_id, document_metadata in documents:
+            chunks.extend(self.chunker.chunk_document(
+                cleaned_text=document_text,
+                document_id=document_id,
+                document_metadata=document_metadata
+            ))
+            document_ids.append(document_id)
+        print(f"\n--- Ingesting {len(document_ids)} documents ({len(chunks)} chunks) ---")
+        if chunks:
+            embeddings = self.embedder.embed_texts([chunk.text for chunk in chunks], batch_size=batch_size)
+            if writer is not None:
+                writer.add(chunks, embeddings)
+            else:
+                self.db_manager.add_embeddings(chunks, embeddings)
+        return document_ids
 
 # 示例用法 (与 test_retrieval.py 类似，但通过 Ingestor 类调用)
 if __name__ == "__main__":
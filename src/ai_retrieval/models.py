@@ -1,12 +1,20 @@
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
+import hashlib
 import uuid
 
+def make_chunk_id(document_id: str, chunk_index: int, text: str) -> str:
+    """
+    由内容决定的块 ID：文档 ID、块序号和块文本摘要。
+    重新分块时位置和文本都未改变的块得到相同的 ID，可以据此只处理新增和删除的块。
+    """
+    return f"{document_id}:{chunk_index}:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+
 class TextChunk(BaseModel):
     """
     表示文档中的一个文本块。
     """
-    id: str = Field(default_factory=lambda: f"chunk_{uuid.uuid4()}")
+    id: str = Field(default_factory=lambda: f"chunk_{uuid.uuid4()}") # 分割器生成的块使用 make_chunk_id
     document_id: str  # 原始文档的ID
     text: str  # 文本块的内容
     metadata: Optional[Dict[str, Any]] = Field(default_factory=dict) # 可选的元数据，如原始文档的 source_type, 章节信息等
@@ -1,6 +1,29 @@
+import re
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any,Optional
-from .models import TextChunk
+from typing import Callable, Iterator, List, Dict, Any, NamedTuple, Optional
+from .models import TextChunk, make_chunk_id
+
+# 句子结束位置：中英文句末标点 (及其后的引号、括号)、后跟空白的英文句点、换行
+_SENTENCE_BOUNDARY = re.compile(r'[。！？!?；;…]+[”’"\'」』)）\]]*|\.(?=\s)|\n')
+# Markdown 标题行 (markitdown 转换后的文档标题)
+_HEADING = re.compile(r'#{1,6}\s')
+# 近似分词：每个 CJK 字符、每个由字母数字组成的词、每个其他非空白字符各计一个 token
+_APPROX_TOKEN = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]')
+# 切分超长句子时单个窗口的字符数上限 = chunk_size * 该值 (远大于常见分词器每个 token 的平均字符数)，限制每次试切时分词的文本长度
+_MAX_CHARS_PER_TOKEN = 16
+
+def approximate_token_count(text: str) -> int:
+    """不依赖分词器的近似 token 数"""
+    return len(_APPROX_TOKEN.findall(text))
+
+def approximate_token_counts(texts: List[str]) -> List[int]:
+    """approximate_token_count 的批量版本"""
+    return [approximate_token_count(text) for text in texts]
+
+class ChunkSpan(NamedTuple):
+    """块在文档文本中的位置，text[start:end] 即块的内容"""
+    start: int
+    end: int
 
 class BaseTextSplitter(ABC):
     """文本分割器的抽象基类"""
@@ -8,6 +31,11 @@ class BaseTextSplitter(ABC):
     def split_text(self, text: str, document_id: str, metadata: Optional[Dict[str, Any]] = None) -> List[TextChunk]:
         pass
 
+    @abstractmethod
+    def iter_spans(self, text: str) -> Iterator[ChunkSpan]:
+        """逐块生成 (start, end) 偏移，不复制文本"""
+        pass
+
 class CharacterTextSplitter(BaseTextSplitter):
     """
     基于字符数和重叠的简单文本分割器。
@@ -20,34 +48,191 @@ class CharacterTextSplitter(BaseTextSplitter):
 
     def split_text(self, text: str, document_id: str, metadata: Optional[Dict[str, Any]] = None) -> List[TextChunk]:
         chunks = []
-        if not text:
-            return chunks
-
-        start_index = 0
-        while start_index < len(text):
-            end_index = min(start_index + self.chunk_size, len(text))
-            chunk_text = text[start_index:end_index]
+        for span in self.iter_spans(text):
+            chunk_metadata = metadata.copy() if metadata else {}
+            chunk_metadata["chunk_index"] = len(chunks) # 块在文档中的序号，用于按顺序分页列出
+            chunk_text = text[span.start:span.end]
             
             chunks.append(
                 TextChunk(
+                    id=make_chunk_id(document_id, len(chunks), chunk_text),
                     document_id=document_id,
                     text=chunk_text,
-                    metadata=metadata.copy() if metadata else {}
+                    metadata=chunk_metadata
                 )
             )
             
+        return chunks
+
+    def iter_spans(self, text: str) -> Iterator[ChunkSpan]:
+        start_index = 0
+        while start_index < len(text):
+            end_index = min(start_index + self.chunk_size, len(text))
+            yield ChunkSpan(start_index, end_index)
             if end_index == len(text):
                 break
             start_index += (self.chunk_size - self.chunk_overlap)
-            
+
+class _Sentence(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    is_heading: bool
+
+class SentenceTextSplitter(BaseTextSplitter):
+    """
+    按句子和标题边界分割文本的分割器，块的大小以 token 数计。
+
+    句子依次装入当前块，直到再加一句会超过 chunk_size 个 token；下一块以上一块末尾不超过 chunk_overlap 个 token
+    的整句开始。Markdown 标题总是开始一个新块 (不带重叠)。单个句子超过 chunk_size 时按字符比例硬切。
+    """
+    def __init__(self, chunk_size: int = 200, chunk_overlap: int = 32,
+                 length_function: Optional[Callable[[str], int]] = None,
+                 batch_length_function: Optional[Callable[[List[str]], List[int]]] = None):
+        """
+        Args:
+            chunk_size: 每块的最大 token 数。
+            chunk_overlap: 相邻块之间重叠的最大 token 数。
+            length_function: 计算单个文本 token 数的函数，默认使用 approximate_token_count。
+            batch_length_function: 一次计算多个文本 token 数的函数 (例如嵌入模型分词器的批量接口)，
+                                   每个文档的全部句子只调用一次；未传入时对每个句子调用 length_function。
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError("Chunk overlap must be smaller than chunk size.")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_function = length_function or approximate_token_count
+        self.batch_length_function = batch_length_function
+
+    def split_text(self, text: str, document_id: str, metadata: Optional[Dict[str, Any]] = None) -> List[TextChunk]:
+        chunks = []
+        for index, span in enumerate(self.iter_spans(text)):
+            chunk_metadata = metadata.copy() if metadata else {}
+            chunk_metadata["chunk_index"] = index # 块在文档中的序号，用于按顺序分页列出
+            chunk_metadata["start_offset"] = span.start
+            chunk_metadata["end_offset"] = span.end
+            chunk_text = text[span.start:span.end]
+            chunks.append(
+                TextChunk(
+                    id=make_chunk_id(document_id, index, chunk_text),
+                    document_id=document_id,
+                    text=chunk_text,
+                    metadata=chunk_metadata
+                )
+            )
         return chunks
 
+    def iter_spans(self, text: str) -> Iterator[ChunkSpan]:
+        """
+        逐块生成 (start, end) 偏移，不复制文本。
+
+        Args:
+            text: 文档文本。
+
+        Returns:
+            按顺序排列的块位置。
+        """
+        current: List[_Sentence] = []
+        current_tokens = 0
+        emitted = 0 # current 中已经作为上一块的一部分输出过的句子数 (重叠部分)
+        for sentence in self._iter_sentences(text):
+            if sentence.is_heading and len(current) > emitted:
+                yield ChunkSpan(current[0].start, current[-1].end)
+                current, current_tokens, emitted = [], 0, 0
+            elif sentence.is_heading:
+                current, current_tokens, emitted = [], 0, 0
+
+            if sentence.tokens > self.chunk_size:
+                if len(current) > emitted:
+                    yield ChunkSpan(current[0].start, current[-1].end)
+                yield from self._split_long_sentence(text, sentence)
+                current, current_tokens, emitted = [], 0, 0
+                continue
+
+            if current and current_tokens + sentence.tokens > self.chunk_size:
+                if len(current) > emitted:
+                    yield ChunkSpan(current[0].start, current[-1].end)
+                # 保留末尾不超过 chunk_overlap 的整句作为下一块的开头，且保证能装下当前句子
+                while current and (current_tokens > self.chunk_overlap
+                                   or current_tokens + sentence.tokens > self.chunk_size):
+                    current_tokens -= current.pop(0).tokens
+                emitted = len(current)
+            current.append(sentence)
+            current_tokens += sentence.tokens
+
+        if len(current) > emitted:
+            yield ChunkSpan(current[0].start, current[-1].end)
+
+    def _iter_sentences(self, text: str) -> Iterator[_Sentence]:
+        """按句子边界切分文本，去掉每句首尾的空白；整篇文档的句子一次性计算 token 数"""
+        start = 0
+        bounds = []
+        boundaries = [match.end() for match in _SENTENCE_BOUNDARY.finditer(text)]
+        for end in boundaries + [len(text)]:
+            if end <= start:
+                continue
+            sentence_start, sentence_end = start, end
+            while sentence_start < sentence_end and text[sentence_start].isspace():
+                sentence_start += 1
+            while sentence_end > sentence_start and text[sentence_end - 1].isspace():
+                sentence_end -= 1
+            start = end
+            if sentence_start < sentence_end:
+                bounds.append((sentence_start, sentence_end))
+        sentence_texts = [text[sentence_start:sentence_end] for sentence_start, sentence_end in bounds]
+        if self.batch_length_function is not None:
+            token_counts = self.batch_length_function(sentence_texts) if sentence_texts else []
+        else:
+            token_counts = [self.length_function(sentence_text) for sentence_text in sentence_texts]
+        for (sentence_start, sentence_end), sentence_text, tokens in zip(bounds, sentence_texts, token_counts):
+            yield _Sentence(sentence_start, sentence_end, max(tokens, 1), bool(_HEADING.match(sentence_text)))
+
+    def _split_long_sentence(self, text: str, sentence: _Sentence) -> Iterator[ChunkSpan]:
+        """
+        将超长句子切成不超过 chunk_size 个 token 的片段，相邻片段重叠不超过 chunk_overlap 个 token。
+
+        每个窗口都用 length_function 实际计算 token 数 (二分查找能装下的最长窗口)，
+        中英文混排时各部分每个 token 的字符数差别很大，按整句的平均比例切分会得到远超上限的片段。
+        """
+        start = sentence.start
+        while True:
+            end = self._fit_end(text, start, sentence.end)
+            yield ChunkSpan(start, end)
+            if end == sentence.end:
+                break
+            start = self._overlap_start(text, start, end)
+
+    def _fit_end(self, text: str, start: int, limit: int) -> int:
+        """最大的 end (start < end <= limit)，使 text[start:end] 不超过 chunk_size 个 token"""
+        high = min(limit, start + self.chunk_size * _MAX_CHARS_PER_TOKEN)
+        if self.length_function(text[start:high]) <= self.chunk_size:
+            return high
+        low = start + 1 # 单个字符总能装下
+        while low < high - 1:
+            middle = (low + high) // 2
+            if self.length_function(text[start:middle]) <= self.chunk_size:
+                low = middle
+            else:
+                high = middle
+        return low
+
+    def _overlap_start(self, text: str, start: int, end: int) -> int:
+        """下一个窗口的起点：最小的 s (start < s <= end)，使 text[s:end] 不超过 chunk_overlap 个 token"""
+        low, high = start + 1, end
+        while low < high:
+            middle = (low + high) // 2
+            if self.length_function(text[middle:end]) <= self.chunk_overlap:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
 class TextChunkingComponent:
     """
     文本分块组件，负责将文档文本分割成小块。
     """
     def __init__(self, splitter: Optional[BaseTextSplitter] = None):
-        self.splitter = splitter or CharacterTextSplitter() # 默认使用字符分割器
+        self.splitter = splitter or SentenceTextSplitter() # 默认按句子边界分割
 
     def chunk_document(self, cleaned_text: str, document_id: str, document_metadata: Optional[Dict[str, Any]] = None) -> List[TextChunk]:
         """
@@ -73,4 +258,12 @@ class TextChunkingComponent:
         
         return self.splitter.split_text(text=cleaned_text, document_id=document_id, metadata=chunk_base_metadata)
 
+    def iter_spans(self, cleaned_text: str) -> Iterator[ChunkSpan]:
+        """
+        逐块生成 (start, end) 偏移而不复制文本。
+        """
+        if not cleaned_text:
+            return iter(())
+        return self.splitter.iter_spans(cleaned_text)
+
 # TODO: 实现其他分块策略，如基于语义/结构或递归分割。
\ No newline at end of file
@@ -1,10 +1,12 @@
 import chromadb
 from chromadb.utils import embedding_functions
-from typing import List, Dict, Any, Optional
-from .models import ChunkWithEmbedding
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Tuple
+from .models import TextChunk, ChunkWithEmbedding
+from .cache import corpus_version
 import numpy as np # <--- 添加导入
 
 import os
+import time
 
 # 使用绝对路径
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -12,6 +14,8 @@ CHROMA_DB_PATH = os.path.join(project_root, "database/chroma_db_data")
 # ChromaDB 配置
 # CHROMA_DB_PATH = "../chroma_db_data" # 持久化路径
 CHROMA_COLLECTION_NAME = "document_chunks"
+# 客户端未提供 max_batch_size (旧版本 ChromaDB) 时单次写入的最大块数
+CHROMA_MAX_BATCH_SIZE = 5000
 
 class VectorDBManager:
     """
@@ -32,6 +36,8 @@ class VectorDBManager:
             name=collection_name
             # embedding_function=self.embedding_function # 如果ChromaDB负责嵌入，则需要
         )
+        # 单次 add/upsert 的块数上限，超出时 ChromaDB 会拒绝写入
+        self.max_batch_size = getattr(self.client, "max_batch_size", None) or CHROMA_MAX_BATCH_SIZE
         print(f"ChromaDB collection '{collection_name}' loaded/created at path '{db_path}'.")
 
     def add_chunks(self, chunks_with_embeddings: List[ChunkWithEmbedding]):
@@ -44,48 +50,94 @@ class VectorDBManager:
         if not chunks_with_embeddings:
             return
 
-        ids = [chunk.id for chunk in chunks_with_embeddings]
-        # 将 List[List[float]] 转换为 numpy.ndarray of float32
-        embeddings_list = [chunk.embedding for chunk in chunks_with_embeddings]
-        if not all(isinstance(emb, list) and all(isinstance(val, float) for val in emb) for emb in embeddings_list):
-            print("Warning: Some embeddings are not in List[float] format. Skipping conversion for safety.")
-            # Decide on fallback or error handling if embeddings are not as expected
-            # For now, we'll proceed with the original list if there's a format issue,
-            # though this might not satisfy the type checker or ChromaDB.
-            # A more robust solution would be to ensure embeddings are always correctly formatted upstream.
-            final_embeddings = embeddings_list
-        else:
-            try:
-                final_embeddings = np.array(embeddings_list, dtype=np.float32)
-            except Exception as e:
-                print(f"Error converting embeddings to numpy array: {e}. Using original list.")
-                final_embeddings = embeddings_list
-
-        documents = [chunk.text for chunk in chunks_with_embeddings]
-        
-        metadatas = []
-        for chunk in chunks_with_embeddings:
-            meta = chunk.metadata.copy() if chunk.metadata else {}
-            meta["document_id"] = chunk.document_id 
-            # ChromaDB 的元数据值必须是 str, int, float, or bool
-            # 确保所有元数据值符合要求
-            for k, v in meta.items():
-                if not isinstance(v, (str, int, float, bool)):
-                    meta[k] = str(v) # 转换为字符串作为后备
-            metadatas.append(meta)
-
         try:
-            self.collection.add(
-                ids=ids,
-                embeddings=final_embeddings.tolist() if isinstance(final_embeddings, np.ndarray) else [emb.tolist() if isinstance(emb, np.ndarray) else emb for emb in final_embeddings], # 确保嵌入向量格式符合 ChromaDB 要求
-                documents=documents,
-                metadatas=metadatas
-            )
-            print(f"Added {len(ids)} chunks to ChromaDB collection '{self.collection.name}'.")
+            embeddings = np.asarray([chunk.embedding for chunk in chunks_with_embeddings], dtype=np.float32)
+            self.add_embeddings(chunks_with_embeddings, embeddings)
         except Exception as e:
             print(f"Error adding chunks to ChromaDB: {e}")
             # Consider more specific error handling or re-raising
 
+    def add_embeddings(self, chunks: List[TextChunk], embeddings: np.ndarray):
+        """
+        将文本块和批量生成的向量一起写入向量数据库 (向量无需先转换为逐块的 List[float])。
+        块 ID 由内容决定，已存在的块被覆盖，重复写入是幂等的。
+
+        Args:
+            chunks: 文本块。
+            embeddings: 形状为 (len(chunks), dim) 的 float32 数组，第 i 行对应 chunks[i]。
+        """
+        if not chunks:
+            return
+        self.upsert_embeddings(
+            [chunk.id for chunk in chunks],
+            embeddings,
+            [chunk.text for chunk in chunks],
+            [self.chunk_metadata(chunk) for chunk in chunks]
+        )
+        print(f"Added {len(chunks)} chunks to ChromaDB collection '{self.collection.name}'.")
+
+    @staticmethod
+    def chunk_metadata(chunk: TextChunk) -> Dict[str, Any]:
+        """块的元数据，附带 document_id"""
+        meta = chunk.metadata.copy() if chunk.metadata else {}
+        meta["document_id"] = chunk.document_id 
+        # ChromaDB 的元数据值必须是 str, int, float, or bool
+        # 确保所有元数据值符合要求
+        for k, v in meta.items():
+            if not isinstance(v, (str, int, float, bool)):
+                meta[k] = str(v) # 转换为字符串作为后备
+        return meta
+
+    def upsert_embeddings(self, ids: List[str], embeddings: np.ndarray, documents: List[str],
+                          metadatas: List[Dict[str, Any]]):
+        """
+        按 ID 写入或覆盖已经计算好的块 (例如从快照导入)，不经过嵌入模型。
+        超过 max_batch_size 时分多次写入。
+
+        Args:
+            ids: 块 ID。
+            embeddings: 形状为 (len(ids), dim) 的 float32 数组。
+            documents: 块文本。
+            metadatas: 块元数据 (需包含 document_id)。
+        """
+        if not ids:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        try:
+            for start in range(0, len(ids), self.max_batch_size):
+                end = start + self.max_batch_size
+                self.collection.upsert(
+                    ids=ids[start:end],
+                    embeddings=embeddings[start:end].tolist(), # ChromaDB 只接受嵌套列表，整块转换一次
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end]
+                )
+        finally:
+            corpus_version.bump()
+
+    def iter_chunks(self, batch_size: int = 500, include_embeddings: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        分批遍历集合中的全部块。
+
+        Yields:
+            {"ids": [...], "documents": [...], "metadatas": [...], "embeddings": float32 数组或 None}
+        """
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        offset = 0
+        while True:
+            result = self.collection.get(include=include, limit=batch_size, offset=offset)
+            ids = result.get('ids') or []
+            if not ids:
+                return
+            embeddings = result.get('embeddings') if include_embeddings else None
+            yield {
+                "ids": ids,
+                "documents": result.get('documents') or [None] * len(ids),
+                "metadatas": result.get('metadatas') or [{} for _ in ids],
+                "embeddings": np.asarray(embeddings, dtype=np.float32) if embeddings is not None else None,
+            }
+            offset += len(ids)
+
     def search_similar_chunks(self, query_embedding: List[float], top_k: int = 5, filter_metadata: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         根据查询向量从数据库中检索相似的文本块。
@@ -119,6 +171,50 @@ class VectorDBManager:
                 })
         return results
 
+    def search_best_chunk_per_document(self, query_embedding: List[float], document_ids: List[str],
+                                       overfetch: int = 3, max_rounds: int = 2) -> List[Dict[str, Any]]:
+        """
+        在一组文档中检索与查询向量最相似的块，每个文档只保留最相似的一个块。
+
+        每轮只发起一次带 $in 过滤的查询，n_results 为待查文档数的 overfetch 倍；
+        个别文档的块全部被其他文档的块挤出结果时，下一轮只为这些文档再查询一次 (n_results 翻倍)。
+
+        Args:
+            query_embedding: 查询向量 (复用初步检索时已计算的向量)。
+            document_ids: 文档 ID。
+            overfetch: 第一轮每个文档平均取回的块数。
+            max_rounds: 最多查询的轮数。
+
+        Returns:
+            与 search_similar_chunks 格式相同的结果列表，按距离升序。
+        """
+        if not query_embedding or not document_ids:
+            return []
+        best: Dict[str, Dict[str, Any]] = {}
+        remaining = sorted({str(document_id) for document_id in document_ids})
+        per_document = max(1, overfetch)
+        for _ in range(max_rounds):
+            where = {"document_id": remaining[0]} if len(remaining) == 1 else {"document_id": {"$in": remaining}}
+            results = self.search_similar_chunks(query_embedding, top_k=len(remaining) * per_document,
+                                                 filter_metadata=where)
+            if not results:
+                break
+            for result in results:
+                document_id = (result.get('metadata') or {}).get('document_id')
+                if document_id is None:
+                    continue
+                current = best.get(document_id)
+                if current is None or (result.get('distance') or 0.0) < (current.get('distance') or 0.0):
+                    best[document_id] = result
+            # 结果数少于请求数说明这些文档的块已经全部返回，剩下的文档没有块
+            if len(results) < len(remaining) * per_document:
+                break
+            remaining = [document_id for document_id in remaining if document_id not in best]
+            if not remaining:
+                break
+            per_document *= 2
+        return sorted(best.values(), key=lambda result: result.get('distance') or 0.0)
+
     def delete_chunks_by_document_id(self, document_id: str):
         """
         删除与特定 document_id 相关的所有块。
@@ -129,6 +225,50 @@ class VectorDBManager:
             print(f"Deleted chunks for document_id '{document_id}' from ChromaDB.")
         except Exception as e:
             print(f"Error deleting chunks for document_id '{document_id}': {e}")
+        corpus_version.bump()
+
+    def delete_chunks_by_document_ids(self, document_ids: Iterable[str], batch_size: int = 500):
+        """批量删除多个文档的全部块，每批一次带 $in 过滤的删除"""
+        document_ids = list(document_ids)
+        if not document_ids:
+            return
+        try:
+            for start in range(0, len(document_ids), batch_size):
+                batch = document_ids[start:start + batch_size]
+                where = {"document_id": batch[0]} if len(batch) == 1 else {"document_id": {"$in": batch}}
+                self.collection.delete(where=where)
+            print(f"Deleted chunks for {len(document_ids)} documents from ChromaDB.")
+        finally:
+            corpus_version.bump()
+
+    def get_document_chunk_metadata(self, document_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        获取文档已有块的元数据 (不读取文本和向量)。
+
+        Returns:
+            {块 ID: 元数据}
+        """
+        result = self.collection.get(where={"document_id": document_id}, include=["metadatas"])
+        return dict(zip(result.get("ids") or [], result.get("metadatas") or []))
+
+    def update_chunk_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """只更新块的元数据，文本和向量保持不变"""
+        if not ids:
+            return
+        try:
+            self.collection.update(ids=ids, metadatas=metadatas)
+        finally:
+            corpus_version.bump() # 检索结果中带有块元数据，缓存的结果随之失效
+
+    def delete_chunks(self, ids: List[str]):
+        """按 ID 删除块"""
+        if not ids:
+            return
+        try:
+            self.collection.delete(ids=ids)
+            print(f"Deleted {len(ids)} chunks from ChromaDB.")
+        finally:
+            corpus_version.bump()
 
     def get_chunk_by_id(self, chunk_id: str) -> Optional[Dict[str, Any]]:
         """获取特定 ID 的块"""
@@ -142,25 +282,169 @@ class VectorDBManager:
             }
         return None
 
+    def list_chunks(self, document_id: str, after: Optional[str] = None, limit: int = 50,
+                    include_text: bool = False) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        按块序号分页列出文档的块。
+
+        游标是上一页最后一个块的 chunk_index，每页用 chunk_index 的区间过滤 [after + 1, after + 1 + limit)
+        只读取这一页的块 (以及一次判断是否还有下一页的 limit=1 查询)，开销与页大小有关，与翻页深度和文档的块数无关。
+        没有 chunk_index 的旧数据退回到读取文档全部块元数据后在内存中排序，此时游标为块 ID。
+
+        Args:
+            document_id: 文档 ID。
+            after: 上一页返回的游标，None 表示第一页。
+            limit: 每页的块数量。
+            include_text: 是否返回块的文本。
+
+        Returns:
+            (块列表, 下一页游标)，没有下一页时游标为 None。
+        """
+        include = ["metadatas", "documents"] if include_text else ["metadatas"]
+        if after is None:
+            start = 0
+        elif after.isdigit():
+            start = int(after) + 1
+        else:
+            return self._list_legacy_chunks(document_id, after, limit, include)
+
+        result = self.collection.get(where={"$and": [
+            {"document_id": document_id}, {"chunk_index": {"$gte": start}}, {"chunk_index": {"$lt": start + limit}}
+        ]}, include=include)
+        page = self._chunk_items(result, include_text)
+        last_index = start + limit - 1
+        has_more = bool(self.collection.get(where={"$and": [
+            {"document_id": document_id}, {"chunk_index": {"$gt": last_index}}
+        ]}, limit=1, include=[]).get('ids'))
+        if not page and not has_more and after is None:
+            # 文档没有带 chunk_index 的块 (旧数据)
+            return self._list_legacy_chunks(document_id, None, limit, include)
+        page.sort(key=lambda item: item["chunk_index"])
+        return page, str(last_index) if has_more else None
+
+    def _list_legacy_chunks(self, document_id: str, after: Optional[str], limit: int,
+                            include: List[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """没有 chunk_index 的旧数据：读取文档全部块后按 ID 排序分页，游标为块 ID"""
+        items = sorted(self._chunk_items(
+            self.collection.get(where={"document_id": document_id}, include=include), "documents" in include
+        ), key=lambda item: item["id"])
+        start = 0
+        if after is not None:
+            positions = [item["id"] for item in items]
+            if after not in positions:
+                raise ValueError(f"Unknown cursor '{after}' for document '{document_id}'.")
+            start = positions.index(after) + 1
+        page = items[start:start + limit]
+        return page, page[-1]["id"] if page and start + limit < len(items) else None
+
+    @staticmethod
+    def _chunk_items(result: Dict[str, Any], include_text: bool) -> List[Dict[str, Any]]:
+        ids = result.get('ids') or []
+        metadatas = result.get('metadatas') or [{} for _ in ids]
+        documents = result.get('documents') or [None for _ in ids]
+        return [
+            {
+                "id": chunk_id,
+                "chunk_index": metadata.get("chunk_index") if metadata else None,
+                "metadata": metadata,
+                "text": text if include_text else None,
+            }
+            for chunk_id, metadata, text in zip(ids, metadatas, documents)
+        ]
+
     def document_exists_in_vector_db(self, document_id: str) -> bool:
         """
         检查给定 document_id 的文档是否已存在于向量数据库中。
-        通过查询是否存在任何关联到该 document_id 的块来判断。
+        通过元数据过滤查找是否存在任何关联到该 document_id 的块来判断，不计算查询向量。
         """
         try:
-            # 尝试查询与该 document_id 关联的任何块
-            # n_results=1 意味着我们只需要知道是否存在至少一个块
-            results = self.collection.query(
-                query_texts=[""], # 空查询文本，因为我们只关心元数据过滤
-                n_results=1,
-                where={"document_id": document_id},
-                include=[] # 不需要返回文档、嵌入或距离，只关心是否存在
-            )
-            # 如果 ids 列表中有任何结果，则表示文档存在
-            return bool(results and results.get('ids') and results['ids'][0])
+            results = self.collection.get(where={"document_id": document_id}, limit=1, include=[])
+            return bool(results and results.get('ids'))
         except Exception as e:
             print(f"Error checking document existence for {document_id}: {e}")
             return False
 
+    def existing_document_ids(self, document_ids: Iterable[str], batch_size: int = 500) -> Set[str]:
+        """
+        批量检查文档是否已存在于向量数据库中，每 batch_size 个文档只发起一次按元数据过滤的 get。
+
+        Args:
+            document_ids: 文档 ID。
+            batch_size: 每次查询的文档数。
+
+        Returns:
+            向量数据库中至少有一个块的文档 ID。
+        """
+        pending = sorted({str(document_id) for document_id in document_ids})
+        existing: Set[str] = set()
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            where = {"document_id": batch[0]} if len(batch) == 1 else {"document_id": {"$in": batch}}
+            result = self.collection.get(where=where, include=["metadatas"])
+            for metadata in result.get("metadatas") or []:
+                if metadata and metadata.get("document_id") is not None:
+                    existing.add(str(metadata["document_id"]))
+        return existing
+
+class ChunkWriteBuffer:
+    """
+    跨文档累积待写入的块和向量，攒够 max_chunks 个块或距第一个待写块超过 max_delay 秒时一次性写入。
+
+    用作上下文管理器，退出时写入剩余的块：
+
+        with ChunkWriteBuffer(vector_db_manager) as writer:
+            writer.add(chunks, embeddings)
+    """
+    def __init__(self, db_manager: VectorDBManager, max_chunks: int = 5000, max_delay: Optional[float] = 10.0):
+        """
+        Args:
+            db_manager: 写入的向量数据库。
+            max_chunks: 累积的块数达到该值时写入。
+            max_delay: 距第一个待写块的秒数超过该值时写入 (在下一次 add 时检查)，None 表示不限时。
+        """
+        if max_chunks <= 0:
+            raise ValueError("max_chunks must be a positive integer.")
+        self.db_manager = db_manager
+        self.max_chunks = max_chunks
+        self.max_delay = max_delay
+        self._chunks: List[TextChunk] = []
+        self._embeddings: List[np.ndarray] = []
+        self._first_added: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def __enter__(self) -> "ChunkWriteBuffer":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def add(self, chunks: List[TextChunk], embeddings: np.ndarray):
+        """
+        加入待写入的块。
+
+        Args:
+            chunks: 文本块。
+            embeddings: 形状为 (len(chunks), dim) 的 float32 数组，第 i 行对应 chunks[i]。
+        """
+        if not chunks:
+            return
+        if self._first_added is None:
+            self._first_added = time.monotonic()
+        self._chunks.extend(chunks)
+        self._embeddings.append(np.asarray(embeddings, dtype=np.float32))
+        if len(self._chunks) >= self.max_chunks or (
+                self.max_delay is not None and time.monotonic() - self._first_added >= self.max_delay):
+            self.flush()
+
+    def flush(self):
+        """写入全部待写入的块"""
+        if not self._chunks:
+            return
+        chunks, embeddings = self._chunks, np.concatenate(self._embeddings)
+        self._chunks, self._embeddings, self._first_added = [], [], None
+        self.db_manager.add_embeddings(chunks, embeddings)
+
 # TODO: 添加更新块的逻辑，可能涉及先删除再添加。
 # TODO: 考虑更复杂的错误处理和日志记录。
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from datetime import datetime
 
 class IngestRequest(BaseModel):
     """
@@ -17,4 +18,76 @@ class IngestResponse(BaseModel):
     message: str # 状态消息
     # 可以添加其他字段，例如是否触发了后续处理 (检查、构建依赖)
 
+class KeywordSearchHit(BaseModel):
+    """
+    关键词检索命中的文档
+    """
+    document_id: str # 文档 ID
+    title: Optional[str] = None # 文档标题
+    score: float # 相关度，越大越相关
+
+class KeywordSearchResponse(BaseModel):
+    """
+    关键词检索响应模型
+    """
+    query: str # 检索词
+    results: List[KeywordSearchHit] # 按相关度排序的结果
+
+class DocumentSummary(BaseModel):
+    """
+    文档列表中的一项，只包含轻量字段
+    """
+    id: str
+    title: Optional[str] = None
+    source_type: Optional[str] = None
+    source_identifier: Optional[str] = None
+    is_vectorized: Optional[bool] = None
+    updated_date: Optional[datetime] = None
+
+class DocumentPage(BaseModel):
+    """
+    文档列表的一页，next_cursor 为 None 表示没有下一页
+    """
+    items: List[DocumentSummary]
+    next_cursor: Optional[str] = None
+
+class ChunkSummary(BaseModel):
+    """
+    向量数据库中文档块列表的一项
+    """
+    id: str
+    chunk_index: Optional[int] = None
+    metadata: Optional[Dict[str, Any]] = None
+    text: Optional[str] = None # 只有 include_text=true 时返回
+
+class ChunkPage(BaseModel):
+    """
+    文档块列表的一页，next_cursor 为 None 表示没有下一页
+    """
+    items: List[ChunkSummary]
+    next_cursor: Optional[str] = None
+
+class DuplicateDocument(BaseModel):
+    """
+    近似重复报告中的一篇文档
+    """
+    document_id: str
+    title: Optional[str] = None
+    similarity: Optional[float] = None # 与规范文档的估计 Jaccard 相似度
+
+class DuplicateGroup(BaseModel):
+    """
+    一组近似重复文档及其规范文档
+    """
+    canonical_id: str
+    canonical_title: Optional[str] = None
+    duplicates: List[DuplicateDocument]
+
+class DuplicateReport(BaseModel):
+    """
+    近似重复报告的一页，next_cursor 为 None 表示没有下一页
+    """
+    groups: List[DuplicateGroup]
+    next_cursor: Optional[str] = None
+
 # TODO: 添加其他文档相关的模型，例如 DocumentDetail, DocumentList, DependencyGraph 等
\ No newline at end of file
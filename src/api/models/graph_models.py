@@ -0,0 +1,30 @@
+from typing import List, Literal, Optional
+from pydantic import BaseModel
+
+# 查询方向：out = 该文档依赖的文档，in = 依赖该文档的文档，both = 两者
+GraphDirection = Literal["out", "in", "both"]
+
+class GraphNode(BaseModel):
+    """
+    依赖图查询结果中的一个文档及其与起点的距离 (跳数)
+    """
+    document_id: str
+    distance: int
+
+class NeighborhoodResponse(BaseModel):
+    """
+    多跳邻居 / 影响分析的响应
+    """
+    document_id: str
+    direction: GraphDirection
+    depth: Optional[int] = None # None 表示不限层数
+    nodes: List[GraphNode]
+
+class PathResponse(BaseModel):
+    """
+    最短路径查询的响应，不可达时 path 为 None
+    """
+    source_id: str
+    target_id: str
+    direction: GraphDirection
+    path: Optional[List[str]] = None
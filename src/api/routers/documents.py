@@ -1,14 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 # 导入数据库会话依赖
-from ...documentRepository.database_models import SessionLocal
+from ...documentRepository.database_models import SessionLocal, DocumentDB
+from ...documentRepository.async_database import get_async_db
 # 导入文档相关的模型
-from ..models.document_models import IngestRequest, IngestResponse
+from ..models.document_models import (
+    IngestRequest, IngestResponse, KeywordSearchHit, KeywordSearchResponse,
+    DocumentSummary, DocumentPage, ChunkSummary, ChunkPage,
+    DuplicateDocument, DuplicateGroup, DuplicateReport,
+)
 # 导入摄取协调器和文档存储
 from ...purseContent.ingestion_coordinator import IngestionCoordinator
 from ...documentRepository.document_storage import DocumentStorage
+from ...documentRepository.fulltext_index import FullTextIndex
+from ...documentRepository.near_duplicate_index import NearDuplicateIndex
 # 导入规范检查器和依赖构建器 (后续会用到)
 from ...norms_checker import NormsChecker
 from ...relationshipExtractor.dependency_builder import DependencyBuilder
@@ -29,6 +40,7 @@ def get_db():
         db.close()
 
 # 文档摄取端点
+# 摄取、规范检查和依赖构建都是同步的 CPU/IO 操作，声明为普通 def，由 FastAPI 放到线程池中执行
 @router.post("/ingest", response_model=IngestResponse, status_code=status.HTTP_201_CREATED)
 def ingest_document(request: IngestRequest, db: Session = Depends(get_db)):
     """
@@ -92,9 +104,130 @@ def ingest_document(request: IngestRequest, db: Session = Depends(get_db)):
             detail=f"Document '{document.title}' ({document.id}) failed norm check. Summary: {check_result.summary}"
         )
 
+# 关键词检索端点，使用全文索引匹配标题、正文和元数据关键词
+@router.get("/search", response_model=KeywordSearchResponse)
+async def search_documents(
+    q: str = Query(..., min_length=1, description="检索词，多个词以空格分隔，需要同时命中"),
+    fields: List[str] = Query(default=["title", "cleaned_text", "keywords"], description="检索的字段"),
+    limit: int = Query(default=20, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    在文档标题、正文和关键词中进行关键词检索
+    """
+    try:
+        # run_sync 让同步的全文索引代码通过异步连接执行，不阻塞事件循环；
+        # 索引表在服务启动时创建并回填，检索请求中只读取
+        hits = await db.run_sync(
+            lambda session: FullTextIndex(session).search(q, fields=fields, limit=limit)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return KeywordSearchResponse(query=q, results=[KeywordSearchHit(**hit) for hit in hits])
+
+# 近似重复报告端点，按规范文档 ID 游标分页
+@router.get("/duplicates", response_model=DuplicateReport)
+async def list_duplicates(
+    cursor: Optional[str] = Query(default=None, description="上一页返回的 next_cursor"),
+    limit: int = Query(default=50, ge=1, le=500, description="每页的分组数"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    列出入库时检测到的近似重复文档，按规范文档分组
+    """
+    groups = await db.run_sync(
+        lambda session: NearDuplicateIndex(session).duplicate_groups(after=cursor, limit=limit)
+    )
+    document_ids = {group["canonical_id"] for group in groups}
+    document_ids.update(duplicate["document_id"] for group in groups for duplicate in group["duplicates"])
+    titles = dict((await db.execute(
+        select(DocumentDB.id, DocumentDB.title).where(DocumentDB.id.in_(document_ids))
+    )).all()) if document_ids else {}
+    items = [
+        DuplicateGroup(
+            canonical_id=group["canonical_id"],
+            canonical_title=titles.get(group["canonical_id"]),
+            duplicates=[
+                DuplicateDocument(title=titles.get(duplicate["document_id"]), **duplicate)
+                for duplicate in group["duplicates"]
+            ],
+        )
+        for group in groups
+    ]
+    next_cursor = groups[-1]["canonical_id"] if len(groups) == limit else None
+    return DuplicateReport(groups=items, next_cursor=next_cursor)
+
+# 文档列表端点，按文档 ID 游标分页
+@router.get("/", response_model=DocumentPage)
+async def list_documents(
+    source_type: Optional[str] = None,
+    is_vectorized: Optional[bool] = None,
+    updated_since: Optional[datetime] = None,
+    cursor: Optional[str] = Query(default=None, description="上一页返回的 next_cursor"),
+    limit: int = Query(default=50, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    列出文档，只返回轻量字段 (不包含正文和元数据)
+    """
+    # 游标是上一页最后一个文档的 ID，按主键定位，查询开销与翻页深度无关
+    stmt = select(
+        DocumentDB.id,
+        DocumentDB.title,
+        DocumentDB.source_type,
+        DocumentDB.source_identifier,
+        DocumentDB.is_Vectorlized,
+        DocumentDB.updated_date,
+    ).order_by(DocumentDB.id).limit(limit + 1)
+    if source_type is not None:
+        stmt = stmt.where(DocumentDB.source_type == source_type)
+    if is_vectorized is not None:
+        stmt = stmt.where(DocumentDB.is_Vectorlized == is_vectorized)
+    if updated_since is not None:
+        stmt = stmt.where(DocumentDB.updated_date >= updated_since)
+    if cursor is not None:
+        stmt = stmt.where(DocumentDB.id > cursor)
+
+    rows = (await db.execute(stmt)).all()
+    # 多取一行用于判断是否还有下一页
+    page = rows[:limit]
+    items = [
+        DocumentSummary(
+            id=row.id,
+            title=row.title,
+            source_type=row.source_type,
+            source_identifier=row.source_identifier,
+            is_vectorized=row.is_Vectorlized,
+            updated_date=row.updated_date,
+        )
+        for row in page
+    ]
+    next_cursor = page[-1].id if len(rows) > limit else None
+    return DocumentPage(items=items, next_cursor=next_cursor)
+
+# 文档块列表端点，按块序号游标分页
+@router.get("/{document_id}/chunks", response_model=ChunkPage)
+async def list_document_chunks(
+    document_id: str,
+    request: Request,
+    cursor: Optional[str] = Query(default=None, description="上一页返回的 next_cursor"),
+    limit: int = Query(default=50, ge=1, le=500),
+    include_text: bool = False,
+):
+    """
+    列出文档在向量数据库中的块，默认只返回块 ID、序号和元数据
+    """
+    vector_db_manager = request.app.state.services.vector_db_manager
+    try:
+        items, next_cursor = await run_in_threadpool(
+            vector_db_manager.list_chunks, document_id, cursor, limit, include_text
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return ChunkPage(items=[ChunkSummary(**item) for item in items], next_cursor=next_cursor)
+
 # TODO: 添加其他端点，例如：
 # - GET /documents/{document_id} - 获取文档详情
-# - GET /documents/ - 列出所有文档
 # - POST /documents/{document_id}/check - 手动触发规范检查
 # - POST /documents/{document_id}/build_dependencies - 手动触发依赖构建
 # - GET /documents/{document_id}/violations - 获取文档的规范违规列表
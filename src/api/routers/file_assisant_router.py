@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any, Optional
 
-from src.file_assiant import FileAssiant
+from src.file_assiant import FileAssiant, rule_added_message, rule_status_message, search_cache_stats
 from src.api.models.rule_models import RuleCreate, RuleUpdate # 确保这些模型存在或根据需要创建
+from src.documentRepository.rule_storage import RuleStorage
+from src.documentRepository.async_database import get_async_db
+from src.ai_retrieval.embedder import query_embedding_cache_stats
+from src.ai_retrieval.embedding_store import get_embedding_store
 
 
 # 创建 FastAPI 路由器
@@ -14,14 +20,21 @@ router = APIRouter(
 )
 
 # 依赖注入，获取 FileAssiant 实例
-def get_file_assiant():
-    return FileAssiant()
+# 复用 lifespan 中创建的进程级服务，每个请求只创建自己的数据库会话，请求结束后关闭
+# FileAssiant 的方法都是阻塞的 (数据库、模型推理、向量库)，在 async 端点中通过 run_in_threadpool 调用
+def get_file_assiant(request: Request):
+    with request.app.state.services.file_assiant() as file_assiant:
+        yield file_assiant
 
 # 定义请求体模型
 class UploadFileRequest(BaseModel):
     source_type: str
     file_path: str
 
+class BatchUploadSourceRequest(BaseModel):
+    source_type: str
+    source_identifier: str
+
 class UploadTextRequest(BaseModel):
     text_content: str
     title: str
@@ -37,6 +50,7 @@ class SetRuleStatusRequest(BaseModel):
 class SearchRequest(BaseModel):
     query: str
     top_k: Optional[int] = 3
+    centrality_weight: Optional[float] = None
 
 
 @router.post("/upload_file", summary="上传文件到知识库和数据库")
@@ -47,9 +61,20 @@ async def upload_file_api(request: UploadFileRequest, file_assiant: FileAssiant
     - **source_type**: 文件来源类型 [local_file, confluence]
     - **file_path**: 文件路径
     """
-    result = file_assiant.upload_file(request.source_type, request.file_path)
+    result = await run_in_threadpool(file_assiant.upload_file, request.source_type, request.file_path)
     return {"message": result}
 
+@router.post("/batch_upload_source", summary="批量上传数据源中的所有文件")
+async def batch_upload_source_api(request: BatchUploadSourceRequest, file_assiant: FileAssiant = Depends(get_file_assiant)):
+    """
+    批量上传数据源中的所有文件，例如整个 Confluence 空间。
+
+    - **source_type**: 数据来源类型 [confluence]
+    - **source_identifier**: 数据源标识符 (Confluence 空间 key)
+    """
+    results = await run_in_threadpool(file_assiant.batch_upload_source, request.source_type, request.source_identifier)
+    return {"results": results}
+
 @router.post("/upload_text", summary="上传文字到知识库")
 async def upload_text_api(request: UploadTextRequest, file_assiant: FileAssiant = Depends(get_file_assiant)):
     """
@@ -58,7 +83,7 @@ async def upload_text_api(request: UploadTextRequest, file_assiant: FileAssiant
     - **text_content**: 文字内容
     - **title**: 文字标题
     """
-    result = file_assiant.upload_text(request.text_content, request.title)
+    result = await run_in_threadpool(file_assiant.upload_text, request.text_content, request.title)
     return {"message": result}
 
 @router.post("/check_file", summary="检查文件是否符合规范")
@@ -69,44 +94,93 @@ async def check_file_api(request: CheckFileRequest, file_assiant: FileAssiant =
     - **source_type**: 文件来源类型 [local_file, confluence]
     - **file_path**: 文件路径
     """
-    result = file_assiant.check_file_type(request.source_type, request.file_path)
+    result = await run_in_threadpool(file_assiant.check_file_type, request.source_type, request.file_path)
     return {"message": result}
 
 @router.post("/upload_rule", summary="上传规则")
-async def upload_rule_api(rule: RuleCreate, file_assiant: FileAssiant = Depends(get_file_assiant)):
+async def upload_rule_api(rule: RuleCreate, db: AsyncSession = Depends(get_async_db)):
     """
     上传新的规则。
 
     - **rule**: 规则内容 (JSON 对象)
     """
-    result = file_assiant.add_rule(rule.dict())
-    return {"message": result}
+    db_rule = await db.run_sync(lambda session: RuleStorage(session).add_rule(rule))
+    return {"message": rule_added_message(db_rule)}
 
 @router.post("/set_rule_status", summary="设置规则的激活状态")
-async def set_rule_status_api(request: SetRuleStatusRequest, file_assiant: FileAssiant = Depends(get_file_assiant)):
+async def set_rule_status_api(request: SetRuleStatusRequest, db: AsyncSession = Depends(get_async_db)):
     """
     设置规则的激活状态。
 
     - **rule_name**: 规则名称
     - **is_active**: 激活状态 (true/false)
     """
-    result = file_assiant.set_rule_status(request.rule_name, request.is_active)
-    return {"message": result}
+    db_rule = await db.run_sync(
+        lambda session: RuleStorage(session).set_rule_status(request.rule_name, request.is_active)
+    )
+    return {"message": rule_status_message(request.rule_name, request.is_active, db_rule is not None)}
 
 @router.post("/build_dependency", summary="构建数据库中所有数据的依赖关系")
 async def build_dependency_api(file_assiant: FileAssiant = Depends(get_file_assiant)):
     """
     构建数据库中所有数据的依赖关系。
     """
-    result = file_assiant.build_all_dependency()
+    result = await run_in_threadpool(file_assiant.build_all_dependency)
+    return {"message": result}
+
+@router.post("/compute_centrality", summary="计算依赖图中心性")
+async def compute_centrality_api(personalize_by_source_type: bool = False, file_assiant: FileAssiant = Depends(get_file_assiant)):
+    """
+    在依赖图上计算 PageRank 并保存，检索时用于提升被广泛引用的文档的排序。
+
+    - **personalize_by_source_type**: 是否同时为每种来源类型计算个性化 PageRank
+    """
+    result = await run_in_threadpool(file_assiant.compute_centrality, personalize_by_source_type)
     return {"message": result}
 
+@router.post("/detect_duplicates", summary="重建近似重复索引")
+async def detect_duplicates_api(file_assiant: FileAssiant = Depends(get_file_assiant)):
+    """
+    为数据库中的全部文档重新计算 MinHash 签名并检测近似重复 (新入库的文档会自动检测)。
+    """
+    result = await run_in_threadpool(file_assiant.detect_duplicates)
+    return {"message": result}
+
+@router.delete("/documents/{document_id}", summary="删除文档")
+async def delete_document_api(document_id: str, file_assiant: FileAssiant = Depends(get_file_assiant)):
+    """
+    从数据库和向量数据库中删除文档，并删除与它相关的依赖关系。
+    """
+    result = await run_in_threadpool(file_assiant.delete_document, document_id)
+    return {"message": result}
+
+@router.get("/metrics/embedding_cache", summary="查询向量缓存统计")
+def embedding_cache_metrics_api():
+    """
+    返回查询向量 LRU 缓存的容量、命中/未命中/淘汰次数和命中率。
+    """
+    return query_embedding_cache_stats()
+
+@router.get("/metrics/search_cache", summary="检索结果缓存统计")
+def search_cache_metrics_api():
+    """
+    返回检索结果缓存的命中率等统计，以及当前的语料版本号。
+    """
+    return search_cache_stats()
+
+@router.get("/metrics/embedding_store", summary="持久化块向量缓存统计")
+def embedding_store_metrics_api():
+    """
+    返回持久化块向量缓存的条目数、命中/未命中/写入次数和命中率。
+    """
+    return get_embedding_store().stats()
+
 @router.post("/build_vector_db", summary="构建向量数据库")
 async def build_vector_db_api(file_assiant: FileAssiant = Depends(get_file_assiant)):
     """
     构建向量数据库。
     """
-    result = file_assiant.vectorize_all_documents()
+    result = await run_in_threadpool(file_assiant.vectorize_all_documents)
     return {"message": result}
 
 @router.post("/update_vector_db", summary="更新向量数据库")
@@ -114,7 +188,7 @@ async def update_vector_db_api(file_assiant: FileAssiant = Depends(get_file_assi
     """
     更新向量数据库。
     """
-    result = file_assiant.update_vec_database()
+    result = await run_in_threadpool(file_assiant.update_vec_database)
     return {"message": result}
 
 @router.post("/search", summary="从向量数据库中搜索")
@@ -124,8 +198,14 @@ async def search_api(request: SearchRequest, file_assiant: FileAssiant = Depends
 
     - **query**: 搜索关键词
     - **top_k**: 返回结果的数量 (可选，默认为3)
+    - **centrality_weight**: 文档中心性在排序中的权重 (可选，默认为 0，即只按向量距离排序)
     """
     top_k_value = request.top_k if request.top_k is not None else 5 
-    results = file_assiant.retrieve_with_dependencies(request.query, top_k_value)
+    if request.centrality_weight is None:
+        results = await run_in_threadpool(file_assiant.retrieve_with_dependencies, request.query, top_k_value)
+    else:
+        results = await run_in_threadpool(
+            file_assiant.retrieve_with_dependencies, request.query, top_k_value, request.centrality_weight
+        )
     return {"results": results}
 
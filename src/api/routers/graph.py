@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Query, Request
+from typing import Dict, Optional
+
+from ..models.graph_models import GraphDirection, GraphNode, NeighborhoodResponse, PathResponse
+
+# 创建 FastAPI 路由器
+router = APIRouter(
+    prefix="/graph",
+    tags=["graph"],
+    responses={404: {"description": "Not found"}},
+)
+
+# 依赖图在进程内常驻 (由服务容器在启动时加载)，查询是纯内存操作；
+# 有未应用的边变更时查询前会访问数据库刷新，因此端点声明为普通 def，由 FastAPI 放到线程池中执行
+
+def _to_nodes(distances: Dict[str, int]):
+    return [GraphNode(document_id=document_id, distance=distance) for document_id, distance in distances.items()]
+
+# 多跳邻居
+@router.get("/{document_id}/neighbors", response_model=NeighborhoodResponse)
+def get_neighbors(
+    document_id: str,
+    request: Request,
+    depth: int = Query(default=1, ge=1, le=10),
+    direction: GraphDirection = "out",
+    limit: int = Query(default=200, ge=1, le=10000),
+):
+    """
+    查询文档 k 跳以内的依赖 (out)、被依赖 (in) 或两者 (both)
+    """
+    graph = request.app.state.services.dependency_graph
+    distances = graph.neighborhood(document_id, depth=depth, direction=direction, limit=limit)
+    return NeighborhoodResponse(document_id=document_id, direction=direction, depth=depth, nodes=_to_nodes(distances))
+
+# 影响分析：哪些文档 (直接或间接) 依赖该文档
+@router.get("/{document_id}/impact", response_model=NeighborhoodResponse)
+def get_impact(
+    document_id: str,
+    request: Request,
+    max_depth: Optional[int] = Query(default=None, ge=1),
+):
+    """
+    反向依赖闭包：修改该文档可能影响到的所有文档
+    """
+    graph = request.app.state.services.dependency_graph
+    distances = graph.reverse_closure(document_id, max_depth=max_depth)
+    return NeighborhoodResponse(document_id=document_id, direction="in", depth=max_depth, nodes=_to_nodes(distances))
+
+# 最短路径
+@router.get("/path", response_model=PathResponse)
+def get_path(
+    request: Request,
+    source_id: str,
+    target_id: str,
+    direction: GraphDirection = "out",
+    max_depth: Optional[int] = Query(default=None, ge=1),
+):
+    """
+    查询两个文档之间按跳数计算的最短依赖路径
+    """
+    graph = request.app.state.services.dependency_graph
+    path = graph.shortest_path(source_id, target_id, direction=direction, max_depth=max_depth)
+    return PathResponse(source_id=source_id, target_id=target_id, direction=direction, path=path)
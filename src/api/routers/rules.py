@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
 # 导入数据库模型和 Pydantic 模型
-from ...documentRepository.database_models import RuleDB, SessionLocal
+from ...documentRepository.database_models import RuleDB
+from ...documentRepository.async_database import get_async_db
+from ...documentRepository.rule_storage import RuleStorage
 from ..models.rule_models import Rule, RuleCreate, RuleUpdate
 
 # 创建 FastAPI 路由器
@@ -13,48 +16,36 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# 依赖项：获取数据库会话
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # 创建规则
 @router.post("/", response_model=Rule, status_code=status.HTTP_201_CREATED)
-def create_rule(rule: RuleCreate, db: Session = Depends(get_db)):
-    db_rule = RuleDB(
-        name=rule.name,
-        description=rule.description,
-        type=rule.type,
-        pattern_config=rule.pattern_config,
-        severity=rule.severity,
-        is_active=rule.is_active
-    )
-    db.add(db_rule)
-    db.commit()
-    db.refresh(db_rule)
-    return db_rule
+async def create_rule(rule: RuleCreate, db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda session: RuleStorage(session).add_rule(rule))
 
 # 读取所有规则
+# 传入 after_id (上一页最后一条规则的 ID) 时按主键游标分页，翻页深度不影响查询开销；skip 仅为兼容旧调用保留
 @router.get("/", response_model=List[Rule])
-def read_rules(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    rules = db.query(RuleDB).offset(skip).limit(limit).all()
-    return rules
+async def read_rules(skip: int = 0, limit: int = 100, after_id: Optional[int] = None,
+                     db: AsyncSession = Depends(get_async_db)):
+    stmt = select(RuleDB).order_by(RuleDB.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.where(RuleDB.id > after_id)
+    elif skip:
+        stmt = stmt.offset(skip)
+    result = await db.execute(stmt)
+    return result.scalars().all()
 
 # 读取单个规则
 @router.get("/{rule_id}", response_model=Rule)
-def read_rule(rule_id: int, db: Session = Depends(get_db)):
-    db_rule = db.query(RuleDB).filter(RuleDB.id == rule_id).first()
+async def read_rule(rule_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_rule = await db.get(RuleDB, rule_id)
     if db_rule is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rule not found")
     return db_rule
 
 # 更新规则
 @router.put("/{rule_id}", response_model=Rule)
-def update_rule(rule_id: int, rule: RuleUpdate, db: Session = Depends(get_db)):
-    db_rule = db.query(RuleDB).filter(RuleDB.id == rule_id).first()
+async def update_rule(rule_id: int, rule: RuleUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_rule = await db.get(RuleDB, rule_id)
     if db_rule is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rule not found")
 
@@ -64,20 +55,20 @@ def update_rule(rule_id: int, rule: RuleUpdate, db: Session = Depends(get_db)):
         setattr(db_rule, key, value)
 
     db.add(db_rule)
-    db.commit()
-    db.refresh(db_rule)
+    await db.commit()
+    await db.refresh(db_rule)
     return db_rule
 
 # 删除规则
 @router.delete("/{rule_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_rule(rule_id: int, db: Session = Depends(get_db)):
-    db_rule = db.query(RuleDB).filter(RuleDB.id == rule_id).first()
+async def delete_rule(rule_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_rule = await db.get(RuleDB, rule_id)
     if db_rule is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rule not found")
 
-    db.delete(db_rule)
-    db.commit()
+    await db.delete(db_rule)
+    await db.commit()
     return {"ok": True} # 返回一个简单的成功响应
 
 # 使用说明
-# curl -X DELETE http://localhost:8000/rules/2 删除 ID 为 2 的规则
\ No newline at end of file
+# curl -X DELETE http://localhost:8000/rules/2 删除 ID 为 2 的规则
@@ -0,0 +1,31 @@
+# src/documentRepository/async_database.py
+# 异步数据库会话，供 FastAPI 的 async 端点使用，避免阻塞事件循环
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from .database_models import DATABASE_URL
+
+# 同步驱动到异步驱动的映射
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def to_async_url(url: str) -> str:
+    """将同步数据库连接字符串转换为对应的异步驱动连接字符串"""
+    scheme, separator, rest = url.partition("://")
+    backend = scheme.split("+")[0]
+    return f"{ASYNC_DRIVERS.get(backend, scheme)}{separator}{rest}"
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+# 表结构由同步的 database_models 创建，这里只负责连接
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+# expire_on_commit=False: 提交后仍可直接读取对象属性 (用于序列化响应)，不会触发隐式 IO
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False, autoflush=False)
+
+# 依赖项：获取异步数据库会话
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,78 @@
+# src/documentRepository/centrality_storage.py
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from .database_models import DocumentCentrality
+
+class CentralityStorage:
+    """
+    负责 document_centrality 表的批量读写
+    """
+
+    def __init__(self, db_session: Session, batch_size: int = 500):
+        self.db_session = db_session
+        self.batch_size = batch_size
+
+    def replace_scores(self, scores: Dict[str, Iterable[Tuple[str, float]]], commit: bool = True) -> int:
+        """
+        整体替换若干分数类型的全部分数，删除与写入在同一个事务中完成。
+
+        Args:
+            scores: {score_type: [(document_id, score), ...]}
+            commit: 是否在写入后提交事务。
+
+        Returns:
+            写入的行数。
+        """
+        now = datetime.utcnow()
+        count = 0
+        try:
+            for score_type, rows in scores.items():
+                self.db_session.query(DocumentCentrality).filter(
+                    DocumentCentrality.score_type == score_type
+                ).delete(synchronize_session=False)
+                batch = []
+                for document_id, score in rows:
+                    batch.append(dict(document_id=document_id, score_type=score_type, score=float(score), computed_at=now))
+                    if len(batch) >= self.batch_size:
+                        self.db_session.execute(DocumentCentrality.__table__.insert(), batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    self.db_session.execute(DocumentCentrality.__table__.insert(), batch)
+                    count += len(batch)
+            if commit:
+                self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+        return count
+
+    def load_scores(self, score_types: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, float]]:
+        """
+        读取分数。
+
+        Returns:
+            {score_type: {document_id: score}}
+        """
+        query = self.db_session.query(
+            DocumentCentrality.score_type, DocumentCentrality.document_id, DocumentCentrality.score
+        )
+        if score_types is not None:
+            query = query.filter(DocumentCentrality.score_type.in_(list(score_types)))
+        scores: Dict[str, Dict[str, float]] = {}
+        for score_type, document_id, score in query.yield_per(self.batch_size):
+            scores.setdefault(score_type, {})[document_id] = score
+        return scores
+
+    def delete_documents(self, document_ids: Iterable[str], commit: bool = True):
+        """删除文档的全部分数"""
+        document_ids = list(document_ids)
+        for start in range(0, len(document_ids), self.batch_size):
+            self.db_session.query(DocumentCentrality).filter(
+                DocumentCentrality.document_id.in_(document_ids[start:start + self.batch_size])
+            ).delete(synchronize_session=False)
+        if commit:
+            self.db_session.commit()
@@ -1,7 +1,7 @@
 # src/storage/database_models.py (示例文件路径)
 import json
 # 导入 ForeignKey
-from sqlalchemy import create_engine, Column, String, Text, DateTime, JSON, BigInteger, ForeignKey, UniqueConstraint, Integer, Boolean
+from sqlalchemy import create_engine, Column, String, Text, DateTime, JSON, BigInteger, ForeignKey, UniqueConstraint, Integer, Boolean, Float, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -22,7 +22,7 @@ class DocumentDB(Base):
     __tablename__ = 'documents'
 
     id = Column(String, primary_key=True) # 使用文档的唯一ID作为主键
-    source_type = Column(String)
+    source_type = Column(String, index=True)
     source_identifier = Column(String)
     title = Column(String)
     raw_content = Column(Text)
@@ -30,8 +30,8 @@ class DocumentDB(Base):
     document_metadata = Column(JSON) # 将 metadata 列名修改为 document_metadata
     dependencies = Column(JSON) # 使用 JSON 类型存储依赖关系
     ingestion_timestamp = Column(DateTime, default=datetime.utcnow) # 摄取时间戳
-    updated_date = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # 更新时间戳
-    is_Vectorlized = Column(Boolean, default=False) # 是否向向量数据库中添加
+    updated_date = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # 更新时间戳
+    is_Vectorlized = Column(Boolean, default=False, index=True) # 是否向向量数据库中添加
 
     def __repr__(self):
         return f"<DocumentDB(id='{self.id}', title='{self.title}')>"
@@ -40,6 +40,7 @@ class DocumentDependency(Base):
     """
     映射到 document_dependencies 表的 SQLAlchemy 模型。
     存储文档之间的依赖关系。
+    已被 DocumentEdge 取代，只保留用于迁移旧数据。
     """
     __tablename__ = 'document_dependencies'
     # id = Column(Integer, primary_key=True, autoincrement=True) # 表的自增主键
@@ -52,6 +53,72 @@ class DocumentDependency(Base):
     __table_args__ = (
     )
 
+class DocumentEdge(Base):
+    """
+    映射到 document_edges 表的 SQLAlchemy 模型。
+    每行是一条有向依赖边 source -> target，正向由主键覆盖，反向由 target 索引覆盖。
+    """
+    __tablename__ = 'document_edges'
+
+    source_id = Column(String, ForeignKey('documents.id'), primary_key=True) # 引用方文档 ID
+    target_id = Column(String, ForeignKey('documents.id'), primary_key=True) # 被引用文档 ID
+    relation_type = Column(String, primary_key=True) # 依赖类型 (e.g., 'reference', 'meta_keyword')
+    weight = Column(Float, nullable=False, default=1.0) # 权重，同一类型的引用出现的次数
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_document_edges_target_source', 'target_id', 'source_id'), # 反向查询 (谁引用了 target)
+    )
+
+    def __repr__(self):
+        return f"<DocumentEdge(source_id='{self.source_id}', target_id='{self.target_id}', relation_type='{self.relation_type}')>"
+
+class DocumentCentrality(Base):
+    """
+    映射到 document_centrality 表的 SQLAlchemy 模型。
+    存储依赖图上离线计算的文档中心性分数 (例如 PageRank)，供检索排序使用。
+    """
+    __tablename__ = 'document_centrality'
+
+    document_id = Column(String, ForeignKey('documents.id'), primary_key=True)
+    score_type = Column(String, primary_key=True) # 分数类型 (e.g., 'pagerank', 'pagerank:confluence')
+    score = Column(Float, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<DocumentCentrality(document_id='{self.document_id}', score_type='{self.score_type}', score={self.score})>"
+
+class DocumentSignature(Base):
+    """
+    映射到 document_signatures 表的 SQLAlchemy 模型。
+    存储文档正文的 MinHash 签名，以及近似重复文档所指向的规范文档。
+    """
+    __tablename__ = 'document_signatures'
+
+    document_id = Column(String, ForeignKey('documents.id'), primary_key=True)
+    signature = Column(LargeBinary, nullable=False) # MinHash 签名 (uint32 数组的字节)
+    canonical_id = Column(String, index=True) # 近似重复时指向的规范文档 ID，自身是规范文档时为 NULL
+    similarity = Column(Float) # 与规范文档的估计 Jaccard 相似度
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<DocumentSignature(document_id='{self.document_id}', canonical_id='{self.canonical_id}')>"
+
+class DocumentLshBand(Base):
+    """
+    映射到 document_lsh_bands 表的 SQLAlchemy 模型。
+    MinHash 签名按 band 切分后的 LSH 桶，同一 (band, bucket) 中的文档是近似重复的候选。
+    """
+    __tablename__ = 'document_lsh_bands'
+
+    band = Column(Integer, primary_key=True) # band 序号
+    bucket = Column(BigInteger, primary_key=True) # band 内签名值的 64 位哈希
+    document_id = Column(String, ForeignKey('documents.id'), primary_key=True)
+
+    __table_args__ = (
+        Index('ix_document_lsh_bands_document', 'document_id'), # 按文档删除
+    )
+
 # 新增 RuleDB 模型
 class RuleDB(Base):
     """
@@ -77,4 +144,12 @@ engine = create_engine(DATABASE_URL)
 # 在应用启动时运行一次，创建表（如果不存在）
 # Base.metadata.create_all(engine) 需要更新以包含新的 RuleDB 模型
 Base.metadata.create_all(engine)
+
+def ensure_indexes(bind):
+    """为已存在的表补建模型中新增的索引 (create_all 不会修改已存在的表)"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+ensure_indexes(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
\ No newline at end of file
@@ -0,0 +1,258 @@
+# src/documentRepository/dependency_storage.py
+import json
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Set, Tuple
+
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert # 导入 PostgreSQL 的 ON CONFLICT 语法
+
+from .database_models import DocumentDependency, DocumentEdge
+
+# 依赖边: (source_id, target_id, relation_type, weight)
+Edge = Tuple[str, str, str, float]
+
+class EdgeListener(Protocol):
+    """依赖边变更监听器，在事务提交后被调用 (例如刷新内存中的依赖图)"""
+    def on_edges_changed(self, source_ids: Set[str], target_ids: Set[str], all_edges: bool) -> None: ...
+
+# 已注册的监听器，键为数据库 URL
+_edge_listeners: Dict[str, List[EdgeListener]] = {}
+# 会话中尚未提交的边变更记录在 session.info 的这个键下
+_PENDING_KEY = "pending_edge_changes"
+
+def register_edge_listener(database_url: str, listener: EdgeListener):
+    """注册依赖边变更监听器"""
+    _edge_listeners.setdefault(database_url, []).append(listener)
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_edge_changes(session: Session):
+    """事务提交后通知监听器本事务中变更过的边"""
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for listener in _edge_listeners.get(str(session.get_bind().url), []):
+        try:
+            listener.on_edges_changed(pending["source_ids"], pending["target_ids"], pending["all_edges"])
+        except Exception as e:
+            print(f"Error notifying edge listener {listener!r}: {e}")
+
+@event.listens_for(Session, "after_rollback")
+def _discard_edge_changes(session: Session):
+    """回滚后丢弃未提交的边变更记录"""
+    session.info.pop(_PENDING_KEY, None)
+
+class DependencyStorage:
+    """
+    负责 document_edges 表的批量读写
+    """
+
+    def __init__(self, db_session: Session, batch_size: int = 500):
+        self.db_session = db_session
+        self.batch_size = batch_size
+
+    def insert_edges(self, edges: Iterable[tuple], commit: bool = True) -> int:
+        """
+        批量插入依赖边，已存在的边更新权重。
+
+        Args:
+            edges: (source_id, target_id, relation_type) 或 (source_id, target_id, relation_type, weight)；
+                   同一条边出现多次时权重累加，自环会被丢弃。
+            commit: 是否在写入后提交事务。
+
+        Returns:
+            写入的边数量。
+        """
+        rows = self._edge_rows(edges)
+        row_iter = iter(rows)
+        try:
+            while True:
+                batch = list(islice(row_iter, self.batch_size))
+                if not batch:
+                    break
+                insert_stmt = insert(DocumentEdge).values(batch)
+                self.db_session.execute(insert_stmt.on_conflict_do_update(
+                    index_elements=['source_id', 'target_id', 'relation_type'],
+                    set_=dict(weight=insert_stmt.excluded.weight)
+                ))
+            self._record_changes(source_ids=(row['source_id'] for row in rows))
+            if commit:
+                self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+        return len(rows)
+
+    def replace_outgoing_edges(self, source_ids: Iterable[str], edges: Iterable[tuple],
+                               relation_types: Optional[Sequence[str]] = None, commit: bool = True) -> int:
+        """
+        用新的边集合替换指定文档的全部出边。
+
+        Args:
+            source_ids: 需要替换出边的文档 ID。
+            edges: 新的出边。
+            relation_types: 只替换这些类型的边，其他构建器产生的边保持不变；None 表示全部类型。
+            commit: 是否在写入后提交事务。
+        """
+        source_ids = list(source_ids)
+        try:
+            for start in range(0, len(source_ids), self.batch_size):
+                query = self.db_session.query(DocumentEdge).filter(
+                    DocumentEdge.source_id.in_(source_ids[start:start + self.batch_size])
+                )
+                if relation_types is not None:
+                    query = query.filter(DocumentEdge.relation_type.in_(list(relation_types)))
+                query.delete(synchronize_session=False)
+            self._record_changes(source_ids=source_ids)
+            count = self.insert_edges(edges, commit=False)
+            if commit:
+                self.db_session.commit()
+            return count
+        except Exception:
+            self.db_session.rollback()
+            raise
+
+    def replace_incoming_edges(self, target_ids: Iterable[str], edges: Iterable[tuple],
+                               relation_types: Optional[Sequence[str]] = None, commit: bool = True) -> int:
+        """
+        用新的边集合替换指定文档的全部入边 (自环除外，自环不会被存储)。
+
+        Args:
+            target_ids: 需要替换入边的文档 ID。
+            edges: 新的入边。
+            relation_types: 只替换这些类型的边；None 表示全部类型。
+            commit: 是否在写入后提交事务。
+        """
+        target_ids = list(target_ids)
+        try:
+            for start in range(0, len(target_ids), self.batch_size):
+                query = self.db_session.query(DocumentEdge).filter(
+                    DocumentEdge.target_id.in_(target_ids[start:start + self.batch_size])
+                )
+                if relation_types is not None:
+                    query = query.filter(DocumentEdge.relation_type.in_(list(relation_types)))
+                query.delete(synchronize_session=False)
+            self._record_changes(target_ids=target_ids)
+            count = self.insert_edges(edges, commit=False)
+            if commit:
+                self.db_session.commit()
+            return count
+        except Exception:
+            self.db_session.rollback()
+            raise
+
+    def replace_all_edges(self, edges: Iterable[tuple], relation_types: Optional[Sequence[str]] = None,
+                          commit: bool = True) -> int:
+        """
+        用新的边集合替换全部的边 (全量重建)，删除与写入在同一个事务中完成。
+
+        Args:
+            edges: 新的边。
+            relation_types: 只替换这些类型的边；None 表示全部类型。
+            commit: 是否在写入后提交事务。
+        """
+        try:
+            query = self.db_session.query(DocumentEdge)
+            if relation_types is not None:
+                query = query.filter(DocumentEdge.relation_type.in_(list(relation_types)))
+            query.delete(synchronize_session=False)
+            # 旧边已全部删除，不会发生冲突，使用 executemany 的普通 INSERT，比逐批 ON CONFLICT 快得多
+            rows = self._edge_rows(edges)
+            if rows:
+                self.db_session.execute(DocumentEdge.__table__.insert(), rows)
+            self._record_changes(all_edges=True)
+            if commit:
+                self.db_session.commit()
+            return len(rows)
+        except Exception:
+            self.db_session.rollback()
+            raise
+
+    def _edge_rows(self, edges: Iterable[tuple]) -> List[Dict]:
+        """将边聚合为 document_edges 表的行"""
+        return [
+            dict(source_id=source_id, target_id=target_id, relation_type=relation_type, weight=weight)
+            for (source_id, target_id, relation_type), weight in self._aggregate(edges).items()
+        ]
+
+    def get_outgoing_edges(self, document_ids: Iterable[str]) -> List[Edge]:
+        """查询文档的出边 (这些文档引用了谁)"""
+        return self._query_edges(DocumentEdge.source_id, document_ids)
+
+    def get_incoming_edges(self, document_ids: Iterable[str]) -> List[Edge]:
+        """查询文档的入边 (谁引用了这些文档)"""
+        return self._query_edges(DocumentEdge.target_id, document_ids)
+
+    def delete_edges_for_documents(self, document_ids: Iterable[str], commit: bool = True):
+        """删除与文档相关的所有边 (出边和入边)"""
+        document_ids = list(document_ids)
+        for start in range(0, len(document_ids), self.batch_size):
+            batch = document_ids[start:start + self.batch_size]
+            self.db_session.query(DocumentEdge).filter(
+                or_(DocumentEdge.source_id.in_(batch), DocumentEdge.target_id.in_(batch))
+            ).delete(synchronize_session=False)
+        self._record_changes(source_ids=document_ids, target_ids=document_ids)
+        if commit:
+            self.db_session.commit()
+
+    def iter_edges(self) -> Iterator[Edge]:
+        """流式遍历全部依赖边，按 source_id 排序"""
+        query = self.db_session.query(
+            DocumentEdge.source_id, DocumentEdge.target_id, DocumentEdge.relation_type, DocumentEdge.weight
+        ).order_by(DocumentEdge.source_id, DocumentEdge.target_id)
+        for row in query.yield_per(self.batch_size):
+            yield (row.source_id, row.target_id, row.relation_type, row.weight)
+
+    def migrate_legacy_dependencies(self, relation_type: str = 'meta_legacy') -> int:
+        """
+        将旧 document_dependencies 表 (每个来源一行，目标 ID 为 JSON 字符串) 迁移到 document_edges。
+        只在 document_edges 为空时执行。
+        """
+        if self.db_session.query(DocumentEdge.source_id).first() is not None:
+            return 0
+        edges = []
+        for source_id, target_ids_json in self.db_session.query(
+            DocumentDependency.source_document_id, DocumentDependency.target_document_ids
+        ):
+            try:
+                target_ids = json.loads(target_ids_json or "[]")
+            except (TypeError, ValueError):
+                print(f"Skipping malformed legacy dependency row for {source_id}")
+                continue
+            edges.extend((source_id, target_id, relation_type) for target_id in target_ids)
+        if not edges:
+            return 0
+        count = self.insert_edges(edges)
+        print(f"Migrated {count} legacy dependency edges to document_edges.")
+        return count
+
+    def _query_edges(self, column, document_ids: Iterable[str]) -> List[Edge]:
+        document_ids = list(set(document_ids))
+        edges: List[Edge] = []
+        for start in range(0, len(document_ids), self.batch_size):
+            rows = self.db_session.query(
+                DocumentEdge.source_id, DocumentEdge.target_id, DocumentEdge.relation_type, DocumentEdge.weight
+            ).filter(column.in_(document_ids[start:start + self.batch_size])).all()
+            edges.extend((row.source_id, row.target_id, row.relation_type, row.weight) for row in rows)
+        return edges
+
+    def _record_changes(self, source_ids: Iterable[str] = (), target_ids: Iterable[str] = (), all_edges: bool = False):
+        """记录本事务中变更的边，提交后由 _dispatch_edge_changes 通知监听器"""
+        pending = self.db_session.info.setdefault(
+            _PENDING_KEY, {"source_ids": set(), "target_ids": set(), "all_edges": False}
+        )
+        pending["source_ids"].update(source_ids)
+        pending["target_ids"].update(target_ids)
+        pending["all_edges"] = pending["all_edges"] or all_edges
+
+    @staticmethod
+    def _aggregate(edges: Iterable[tuple]) -> Dict[Tuple[str, str, str], float]:
+        """合并重复的边，权重累加，并丢弃自环和空目标"""
+        weights: Dict[Tuple[str, str, str], float] = defaultdict(float)
+        for edge in edges:
+            source_id, target_id, relation_type = edge[0], edge[1], edge[2]
+            if not target_id or source_id == target_id:
+                continue
+            weights[(source_id, target_id, relation_type)] += edge[3] if len(edge) > 3 else 1.0
+        return weights
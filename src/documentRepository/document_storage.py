@@ -1,11 +1,30 @@
 # src/storage/document_storage.py (示例文件路径)
 import hashlib
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Protocol, Tuple
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import insert # 导入 PostgreSQL 的 ON CONFLICT 语法
 from ..purseContent.document_model import Document # 导入标准文档模型
 from .database_models import DocumentDB, SessionLocal # 导入数据库模型和会话工厂
+from .dependency_storage import DependencyStorage
+from .centrality_storage import CentralityStorage
+from .fulltext_index import FullTextIndex
+from .near_duplicate_index import NearDuplicateIndex
 from datetime import datetime
 
+class DocumentListener(Protocol):
+    """文档写入/删除监听器，在事务提交后被调用 (例如维护内存索引)"""
+    def on_documents_upserted(self, rows: List[Dict[str, Any]]) -> None: ...
+    def on_documents_deleted(self, document_ids: List[str]) -> None: ...
+
+# 已注册的监听器，键为数据库 URL，只通知写入同一数据库的变更
+_document_listeners: Dict[str, List[DocumentListener]] = {}
+
+def register_document_listener(database_url: str, listener: DocumentListener):
+    """注册文档写入/删除监听器"""
+    _document_listeners.setdefault(database_url, []).append(listener)
+
 class DocumentStorage:
     """
     负责将标准文档对象存储到数据库
@@ -26,40 +45,16 @@ class DocumentStorage:
         document.id = self.generate_id(document.source_identifier)
         print(f"=========================== start upsert_document: {document.id} ===========================")
         try:
+            self.fulltext_index() # 确保全文索引表存在 (可能会提交事务，因此放在写入之前)
             # 方式 B: 使用 ON CONFLICT (PostgreSQL 特有，效率高)
-            # 构建插入语句
-            insert_stmt = insert(DocumentDB).values(
-                id=document.id,
-                source_type=document.source_type,
-                source_identifier=document.source_identifier,
-                title=document.title,
-                raw_content=document.raw_content,
-                cleaned_text=document.cleaned_text,
-                document_metadata=document.metadata, # SQLAlchemy 会自动处理 Python dict 到 JSON
-                dependencies=document.dependencies,
-                ingestion_timestamp=datetime.utcnow(), # 插入时记录当前时间
-                updated_date=datetime.utcnow() # 插入和更新时都记录当前时间
-            )
+            row = self._document_to_row(document, datetime.utcnow())
+            upsert_stmt = self._build_upsert_statement([row])
 
-            # 定义冲突时更新的字段
-            on_conflict_stmt = insert_stmt.on_conflict_do_update(
-                index_elements=['id'], # 指定冲突发生的列
-                set_=dict(
-                    source_type=insert_stmt.excluded.source_type,
-                    source_identifier=insert_stmt.excluded.source_identifier,
-                    title=insert_stmt.excluded.title,
-                    raw_content=insert_stmt.excluded.raw_content,
-                    cleaned_text=insert_stmt.excluded.cleaned_text,
-                    document_metadata=insert_stmt.excluded.document_metadata,
-                    dependencies=insert_stmt.excluded.dependencies,
-                    updated_date=datetime.utcnow() # 冲突时更新时间戳
-                    # ingestion_timestamp 不更新，因为它记录的是首次摄取时间
-                )
-            )
-
-            # 执行语句
-            self.db_session.execute(on_conflict_stmt)
+            # 执行语句，全文索引和近似重复索引与文档在同一个事务中更新
+            self.db_session.execute(upsert_stmt)
+            self._index_rows([row])
             self.db_session.commit()
+            self._notify_upserted([row])
             print(f"Successfully upserted document: {document.id}")
 
         except Exception as e:
@@ -67,6 +62,282 @@ class DocumentStorage:
             print(f"Error upserting document {document.id}: {str(e)}")
             # 这里可以添加更详细的日志记录或错误处理逻辑
 
+    def upsert_documents(self, documents: Iterable[Document], batch_size: int = 200) -> Iterator[Tuple[Document, bool, Optional[str]]]:
+        """
+        批量插入或更新文档记录。
+
+        输入按 batch_size 分块消费，每块使用一条多行 INSERT ... ON CONFLICT 语句并在一个事务中提交，
+        内存占用只与 batch_size 有关，可以直接传入惰性生成器。
+        某块整体写入失败时，回退为逐条写入以定位具体失败的文档。
+
+        Args:
+            documents: 待写入的文档 (任意可迭代对象)。
+            batch_size: 每个事务写入的文档数量。
+
+        Yields:
+            (document, success, error) 三元组，与输入文档一一对应。
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be a positive integer.")
+
+        self.fulltext_index() # 确保全文索引表存在 (可能会提交事务，因此放在写入之前)
+        document_iter = iter(documents)
+        while True:
+            batch = list(islice(document_iter, batch_size))
+            if not batch:
+                break
+            yield from self._upsert_batch(batch)
+
+    def _upsert_batch(self, batch: List[Document]) -> Iterator[Tuple[Document, bool, Optional[str]]]:
+        """在一个事务中写入一批文档"""
+        now = datetime.utcnow()
+        # 同一批次内重复的 ID 只保留最后一条，否则 ON CONFLICT 会在同一语句中两次更新同一行
+        rows: Dict[str, Dict[str, Any]] = {}
+        for document in batch:
+            document.id = self.generate_id(document.source_identifier)
+            rows[document.id] = self._document_to_row(document, now)
+
+        try:
+            self.db_session.execute(self._build_upsert_statement(list(rows.values())))
+            self._index_rows(rows.values())
+            self.db_session.commit()
+            self._notify_upserted(list(rows.values()))
+        except Exception as e:
+            self.db_session.rollback()
+            print(f"Error upserting batch of {len(rows)} documents, retrying one by one: {str(e)}")
+            errors = self._upsert_rows_one_by_one(rows)
+            for document in batch:
+                error = errors.get(document.id)
+                yield document, error is None, error
+            return
+
+        print(f"Successfully upserted batch of {len(rows)} documents.")
+        for document in batch:
+            yield document, True, None
+
+    def _upsert_rows_one_by_one(self, rows: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        """逐条写入，返回失败文档 ID 到错误信息的映射"""
+        errors: Dict[str, str] = {}
+        for document_id, row in rows.items():
+            try:
+                self.db_session.execute(self._build_upsert_statement([row]))
+                self._index_rows([row])
+                self.db_session.commit()
+                self._notify_upserted([row])
+            except Exception as e:
+                self.db_session.rollback()
+                errors[document_id] = str(e)
+                print(f"Error upserting document {document_id}: {str(e)}")
+        return errors
+
+    def import_rows(self, rows: Iterable[Dict[str, Any]], batch_size: int = 500) -> int:
+        """
+        按原样写入 documents 表的行 (例如从快照导入)，保留 ID、时间戳和向量化状态，已存在的行被覆盖。
+
+        Args:
+            rows: 包含 documents 表全部列的字典。
+            batch_size: 每个事务写入的行数。
+
+        Returns:
+            写入的行数。
+        """
+        self.fulltext_index() # 确保全文索引表存在 (可能会提交事务，因此放在写入之前)
+        count = 0
+        row_iter = iter(rows)
+        while True:
+            batch = list(islice(row_iter, batch_size))
+            if not batch:
+                break
+            insert_stmt = insert(DocumentDB).values(batch)
+            upsert_stmt = insert_stmt.on_conflict_do_update(
+                index_elements=['id'],
+                set_={column.name: insert_stmt.excluded[column.name]
+                      for column in DocumentDB.__table__.columns if column.name != 'id'}
+            )
+            try:
+                self.db_session.execute(upsert_stmt)
+                self._index_rows(batch)
+                self.db_session.commit()
+            except Exception as e:
+                self.db_session.rollback()
+                print(f"Error importing batch of {len(batch)} documents: {str(e)}")
+                raise
+            self._notify_upserted(batch)
+            count += len(batch)
+        return count
+
+    def delete_documents(self, document_ids: List[str]):
+        """
+        删除文档，同时删除其依赖边、中心性分数、全文索引和近似重复索引条目
+        """
+        document_ids = list(document_ids)
+        fulltext_index = self.fulltext_index()
+        try:
+            DependencyStorage(self.db_session).delete_edges_for_documents(document_ids, commit=False)
+            CentralityStorage(self.db_session).delete_documents(document_ids, commit=False)
+            fulltext_index.delete_documents(document_ids)
+            NearDuplicateIndex(self.db_session).delete_documents(document_ids)
+            for start in range(0, len(document_ids), 500):
+                self.db_session.query(DocumentDB).filter(
+                    DocumentDB.id.in_(document_ids[start:start + 500])
+                ).delete(synchronize_session=False)
+            self.db_session.commit()
+            print(f"Successfully deleted {len(document_ids)} documents.")
+        except Exception as e:
+            self.db_session.rollback()
+            print(f"Error deleting documents {document_ids}: {str(e)}")
+            raise
+        for listener in self._listeners():
+            listener.on_documents_deleted(document_ids)
+
+    def _listeners(self) -> List[DocumentListener]:
+        return _document_listeners.get(str(self.db_session.get_bind().url), [])
+
+    def _notify_upserted(self, rows: List[Dict[str, Any]]):
+        """通知监听器文档已写入；监听器出错不影响已提交的写入"""
+        for listener in self._listeners():
+            try:
+                listener.on_documents_upserted(rows)
+            except Exception as e:
+                print(f"Error notifying document listener {listener!r}: {str(e)}")
+
+    def fulltext_index(self) -> FullTextIndex:
+        """获取全文索引；索引表首次创建时回填已有文档"""
+        index = FullTextIndex(self.db_session)
+        if index.ensure_schema():
+            self.rebuild_fulltext_index(index)
+        return index
+
+    def rebuild_fulltext_index(self, index: Optional[FullTextIndex] = None):
+        """清空并根据 documents 表重建全文索引"""
+        index = index or self.fulltext_index()
+        print("Rebuilding full-text index...")
+        try:
+            index.clear()
+            index.index_documents(
+                (row.id, row.title, row.cleaned_text, row.document_metadata)
+                for row in self.iter_documents(DocumentDB.title, DocumentDB.cleaned_text, DocumentDB.document_metadata)
+            )
+            self.db_session.commit()
+        except Exception as e:
+            self.db_session.rollback()
+            print(f"Error rebuilding full-text index: {str(e)}")
+
+    def rebuild_near_duplicate_index(self, batch_size: int = 500) -> int:
+        """
+        清空并根据 documents 表重建近似重复索引 (例如为索引上线前已有的文档回填)。
+        按文档 ID 顺序处理，每组近似重复文档中 ID 最小的一篇成为规范文档。
+
+        Returns:
+            近似重复文档 (非规范文档) 的数量。
+        """
+        print("Rebuilding near-duplicate index...")
+        index = NearDuplicateIndex(self.db_session)
+        duplicate_count = 0
+        try:
+            index.clear()
+            self.db_session.commit()
+            batch = []
+            for row in self.iter_documents(DocumentDB.cleaned_text, batch_size=batch_size):
+                batch.append((row.id, row.cleaned_text))
+                if len(batch) >= batch_size:
+                    duplicate_count += self._index_duplicate_batch(index, batch)
+                    batch = []
+            duplicate_count += self._index_duplicate_batch(index, batch)
+        except Exception as e:
+            self.db_session.rollback()
+            print(f"Error rebuilding near-duplicate index: {str(e)}")
+            raise
+        print(f"Near-duplicate index rebuilt, {duplicate_count} near-duplicate documents found.")
+        return duplicate_count
+
+    def _index_duplicate_batch(self, index: NearDuplicateIndex, batch: List[Tuple[str, Optional[str]]]) -> int:
+        canonical_ids = index.index_documents(batch)
+        self.db_session.commit()
+        return sum(1 for canonical_id in canonical_ids.values() if canonical_id is not None)
+
+    def _index_rows(self, rows: Iterable[Dict[str, Any]]):
+        """
+        更新文档行对应的全文索引和近似重复索引条目 (不提交事务)，全文索引表需已通过 fulltext_index() 创建
+        """
+        rows = list(rows)
+        FullTextIndex(self.db_session).index_documents(
+            (row['id'], row['title'], row['cleaned_text'], row['document_metadata']) for row in rows
+        )
+        NearDuplicateIndex(self.db_session).index_documents((row['id'], row['cleaned_text']) for row in rows)
+
+    def _document_to_row(self, document: Document, now: datetime) -> Dict[str, Any]:
+        """将 Document 转换为 documents 表的一行"""
+        return dict(
+            id=document.id,
+            source_type=document.source_type,
+            source_identifier=document.source_identifier,
+            title=document.title,
+            raw_content=document.raw_content,
+            cleaned_text=document.cleaned_text,
+            document_metadata=document.metadata, # SQLAlchemy 会自动处理 Python dict 到 JSON
+            dependencies=document.dependencies,
+            ingestion_timestamp=now, # 插入时记录当前时间
+            updated_date=now # 插入和更新时都记录当前时间
+        )
+
+    def _build_upsert_statement(self, rows: List[Dict[str, Any]]):
+        """构建 (多行) INSERT ... ON CONFLICT DO UPDATE 语句"""
+        insert_stmt = insert(DocumentDB).values(rows)
+
+        # 定义冲突时更新的字段
+        return insert_stmt.on_conflict_do_update(
+            index_elements=['id'], # 指定冲突发生的列
+            set_=dict(
+                source_type=insert_stmt.excluded.source_type,
+                source_identifier=insert_stmt.excluded.source_identifier,
+                title=insert_stmt.excluded.title,
+                raw_content=insert_stmt.excluded.raw_content,
+                cleaned_text=insert_stmt.excluded.cleaned_text,
+                document_metadata=insert_stmt.excluded.document_metadata,
+                dependencies=insert_stmt.excluded.dependencies,
+                updated_date=insert_stmt.excluded.updated_date # 冲突时更新时间戳
+                # ingestion_timestamp 不更新，因为它记录的是首次摄取时间
+            )
+        )
+
+    def iter_documents(self, *columns, criteria: Iterable = (), batch_size: int = 500) -> Iterator[Row]:
+        """
+        流式遍历 documents 表，只加载需要的列。
+
+        按主键做 keyset 分页，每页是一条独立的 LIMIT 查询，内存占用只与 batch_size 有关；
+        与单个长时间打开的服务端游标不同，调用方在迭代过程中可以随时提交事务。
+
+        Args:
+            *columns: 除 id 之外需要加载的列，例如 DocumentDB.cleaned_text。
+            criteria: 额外的过滤条件。
+            batch_size: 每页读取的行数。
+
+        Yields:
+            只包含 id 和指定列的 Row，可以按列名访问属性。
+        """
+        criteria = list(criteria)
+        last_id = None
+        while True:
+            query = self.db_session.query(DocumentDB.id, *columns).filter(*criteria)
+            if last_id is not None:
+                query = query.filter(DocumentDB.id > last_id)
+            rows = query.order_by(DocumentDB.id).limit(batch_size).all()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1].id
+
+    def mark_vectorized(self, document_ids: List[str], vectorized: bool = True):
+        """批量将文档标记为已向量化 (vectorized 为 False 时标记为未向量化)"""
+        if not document_ids:
+            return
+        for start in range(0, len(document_ids), 500):
+            self.db_session.query(DocumentDB).filter(DocumentDB.id.in_(document_ids[start:start + 500])).update(
+                {DocumentDB.is_Vectorlized: vectorized}, synchronize_session=False
+            )
+        self.db_session.commit()
+
     # 方式 A: 查询后判断 (ORM 方式) - 备选，如果不用 ON CONFLICT
     # def upsert_document_orm(self, document: Document):
     #     existing_doc = self.db_session.query(DocumentDB).filter_by(id=document.id).first()
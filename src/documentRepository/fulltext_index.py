@@ -0,0 +1,308 @@
+# src/documentRepository/fulltext_index.py
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import or_, text
+from sqlalchemy.orm import Session
+
+from .database_models import DocumentDB
+
+FTS_TABLE_NAME = "documents_fts"
+# SQLite: 文档 ID -> FTS5 rowid 的映射表，按 rowid 删除索引条目 (doc_id 列不建索引，按它删除需要扫描整张表)
+FTS_ROWID_TABLE_NAME = "documents_fts_rowids"
+# 可检索的字段
+FTS_FIELDS = ("title", "cleaned_text", "keywords")
+
+# 每个进程只检查一次索引表是否存在，键为数据库 URL
+_schema_state: Dict[str, bool] = {}
+
+# 全文索引中的一行: (document_id, title, cleaned_text, document_metadata)
+IndexRow = Tuple[str, Optional[str], Optional[str], Optional[Dict[str, Any]]]
+
+class FullTextIndex:
+    """
+    documents 表的全文索引，覆盖 title、cleaned_text 和元数据中的关键词。
+
+    - SQLite: FTS5 虚拟表，优先使用 trigram 分词器，中英文都支持子串匹配 (>= 3 个字符)；
+    - PostgreSQL: 每个字段一个 tsvector 列并建立 GIN 索引；
+    - 其他数据库或索引不可用时，退化为在 documents 表上的 LIKE 查询。
+    """
+
+    def __init__(self, db_session: Session, batch_size: int = 500):
+        self.db_session = db_session
+        self.batch_size = batch_size
+        bind = db_session.get_bind()
+        self.dialect = bind.dialect.name
+        # 同一个数据库的同步 (sqlite://) 和异步 (sqlite+aiosqlite://) 连接共享同一个状态
+        self._state_key = str(bind.url.set(drivername=bind.url.get_backend_name()))
+
+    @property
+    def available(self) -> bool:
+        """
+        索引表是否已创建并可用。
+        本进程尚未检查过时只检查索引表是否存在，不创建也不回填 (由启动时的 ensure_schema 负责)。
+        """
+        if self._state_key not in _schema_state:
+            try:
+                exists = self._sqlite_schema_exists() if self.dialect == "sqlite" else (
+                    self.dialect == "postgresql" and self._postgresql_schema_exists())
+            except Exception as e:
+                print(f"Error checking full-text index: {e}")
+                return False
+            if not exists:
+                return False
+            _schema_state[self._state_key] = True
+        return _schema_state[self._state_key]
+
+    def ensure_schema(self) -> bool:
+        """
+        创建索引表 (如果不存在)。
+
+        Returns:
+            本次调用是否新建了索引表；新建时调用方需要回填已有文档。
+        """
+        if self._state_key in _schema_state:
+            return False
+        created = False
+        try:
+            if self.dialect == "sqlite":
+                created = self._ensure_sqlite_schema()
+            elif self.dialect == "postgresql":
+                created = self._ensure_postgresql_schema()
+            else:
+                print(f"Full-text index is not supported on '{self.dialect}', falling back to LIKE queries.")
+                _schema_state[self._state_key] = False
+                return False
+            self.db_session.commit()
+            _schema_state[self._state_key] = True
+        except Exception as e:
+            self.db_session.rollback()
+            print(f"Error creating full-text index, falling back to LIKE queries: {e}")
+            _schema_state[self._state_key] = False
+        return created
+
+    def index_documents(self, rows: Iterable[IndexRow]):
+        """
+        写入或替换文档的索引条目，不提交事务，由调用方与文档写入一起提交。
+        """
+        if not self.available:
+            return
+        row_iter = iter(rows)
+        while True:
+            batch = list(islice(row_iter, self.batch_size))
+            if not batch:
+                break
+            params = [
+                {
+                    "doc_id": document_id,
+                    "title": title or "",
+                    "cleaned_text": cleaned_text or "",
+                    "keywords": self._extract_keywords(metadata),
+                }
+                for document_id, title, cleaned_text, metadata in batch
+            ]
+            if self.dialect == "sqlite":
+                self._delete_ids([p["doc_id"] for p in params])
+                self.db_session.execute(text(
+                    f"INSERT OR IGNORE INTO {FTS_ROWID_TABLE_NAME} (doc_id) VALUES (:doc_id)"
+                ), params)
+                self.db_session.execute(text(
+                    f"INSERT INTO {FTS_TABLE_NAME} (rowid, doc_id, title, cleaned_text, keywords) "
+                    f"SELECT fts_rowid, doc_id, :title, :cleaned_text, :keywords FROM {FTS_ROWID_TABLE_NAME} "
+                    "WHERE doc_id = :doc_id"
+                ), params)
+            else:
+                self.db_session.execute(text(
+                    f"INSERT INTO {FTS_TABLE_NAME} (doc_id, title, title_tsv, cleaned_text_tsv, keywords_tsv) "
+                    "VALUES (:doc_id, :title, to_tsvector('simple', :title), "
+                    "to_tsvector('simple', :cleaned_text), to_tsvector('simple', :keywords)) "
+                    "ON CONFLICT (doc_id) DO UPDATE SET title = EXCLUDED.title, title_tsv = EXCLUDED.title_tsv, "
+                    "cleaned_text_tsv = EXCLUDED.cleaned_text_tsv, keywords_tsv = EXCLUDED.keywords_tsv"
+                ), params)
+
+    def delete_documents(self, document_ids: Iterable[str]):
+        """删除文档的索引条目，不提交事务"""
+        if not self.available:
+            return
+        document_ids = list(document_ids)
+        for start in range(0, len(document_ids), self.batch_size):
+            self._delete_ids(document_ids[start:start + self.batch_size])
+
+    def clear(self):
+        """清空索引，不提交事务"""
+        if self.available:
+            self.db_session.execute(text(f"DELETE FROM {FTS_TABLE_NAME}"))
+            if self.dialect == "sqlite":
+                self.db_session.execute(text(f"DELETE FROM {FTS_ROWID_TABLE_NAME}"))
+
+    def search(self, query: str, fields: Sequence[str] = FTS_FIELDS, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        关键词检索，多个以空格分隔的词需要同时命中。
+
+        Returns:
+            按相关度排序的结果列表，例如 [{"document_id": ..., "title": ..., "score": ...}, ...]
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        fields = self._check_fields(fields)
+        if not self.available:
+            return self._search_like(terms, fields, limit)
+        if self.dialect == "sqlite":
+            return self._search_sqlite(terms, fields, limit)
+        return self._search_postgresql(terms, fields, limit)
+
+    # ---------------- SQLite ----------------
+
+    def _sqlite_schema_exists(self) -> bool:
+        count = self.db_session.execute(
+            text("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (:fts, :rowids)"),
+            {"fts": FTS_TABLE_NAME, "rowids": FTS_ROWID_TABLE_NAME}
+        ).scalar()
+        return count == 2
+
+    def _ensure_sqlite_schema(self) -> bool:
+        if self._sqlite_schema_exists():
+            return False
+        # 旧版本创建的索引表没有 rowid 映射，删除后重建并回填
+        self.db_session.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE_NAME}"))
+        try:
+            # trigram 分词器 (SQLite >= 3.34) 支持中文等无空格文本的子串匹配
+            self.db_session.execute(text(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE_NAME} USING fts5("
+                "doc_id UNINDEXED, title, cleaned_text, keywords, tokenize = 'trigram')"
+            ))
+        except Exception:
+            self.db_session.rollback()
+            self.db_session.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE_NAME}"))
+            self.db_session.execute(text(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE_NAME} USING fts5("
+                "doc_id UNINDEXED, title, cleaned_text, keywords)"
+            ))
+        self.db_session.execute(text(f"DROP TABLE IF EXISTS {FTS_ROWID_TABLE_NAME}"))
+        self.db_session.execute(text(
+            f"CREATE TABLE {FTS_ROWID_TABLE_NAME} (fts_rowid INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE)"
+        ))
+        print(f"Created SQLite FTS5 table '{FTS_TABLE_NAME}'.")
+        return True
+
+    def _sqlite_condition(self, terms: List[str], fields: Sequence[str]) -> Tuple[str, Dict[str, Any]]:
+        """
+        构建 WHERE 条件：>= 3 个字符的词使用 MATCH 走索引；
+        更短的词 trigram 无法索引 (FTS5 会拦截 LIKE 并返回空结果)，使用 instr 在索引表上逐行过滤。
+        """
+        conditions = []
+        params: Dict[str, Any] = {}
+        phrases = []
+        for i, term in enumerate(terms):
+            if len(term) >= 3:
+                phrases.append('"' + term.replace('"', '""') + '"')
+            else:
+                params[f"term_{i}"] = term.lower()
+                conditions.append("(" + " OR ".join(f"instr(lower({field}), :term_{i}) > 0" for field in fields) + ")")
+        if phrases:
+            params["match"] = "{" + " ".join(fields) + "} : (" + " AND ".join(phrases) + ")"
+            conditions.insert(0, f"{FTS_TABLE_NAME} MATCH :match")
+        return " AND ".join(conditions), params
+
+    def _search_sqlite(self, terms: List[str], fields: Sequence[str], limit: int) -> List[Dict[str, Any]]:
+        where, params = self._sqlite_condition(terms, fields)
+        params["limit"] = limit
+        # MATCH 查询按 bm25 排序 (标题权重最高)，只有短词时没有相关度
+        order = "bm25(" + FTS_TABLE_NAME + ", 0.0, 10.0, 1.0, 5.0)" if "match" in params else "doc_id"
+        rows = self.db_session.execute(text(
+            f"SELECT doc_id, title, {order} AS score FROM {FTS_TABLE_NAME} "
+            f"WHERE {where} ORDER BY score LIMIT :limit"
+        ), params)
+        # bm25 越小越相关，取反后越大越相关
+        return [
+            {"document_id": row[0], "title": row[1], "score": -row[2] if "match" in params else 0.0}
+            for row in rows
+        ]
+
+    # ---------------- PostgreSQL ----------------
+
+    def _postgresql_schema_exists(self) -> bool:
+        return self.db_session.execute(text("SELECT to_regclass(:name)"), {"name": FTS_TABLE_NAME}).scalar() is not None
+
+    def _ensure_postgresql_schema(self) -> bool:
+        if self._postgresql_schema_exists():
+            return False
+        self.db_session.execute(text(
+            f"CREATE TABLE {FTS_TABLE_NAME} (doc_id TEXT PRIMARY KEY, title TEXT, "
+            "title_tsv TSVECTOR, cleaned_text_tsv TSVECTOR, keywords_tsv TSVECTOR)"
+        ))
+        for field in FTS_FIELDS:
+            self.db_session.execute(text(
+                f"CREATE INDEX ix_{FTS_TABLE_NAME}_{field} ON {FTS_TABLE_NAME} USING GIN ({field}_tsv)"
+            ))
+        print(f"Created PostgreSQL tsvector table '{FTS_TABLE_NAME}'.")
+        return True
+
+    def _postgresql_condition(self, terms: List[str], fields: Sequence[str]) -> Tuple[str, Dict[str, Any]]:
+        params = {"query": " ".join(terms)}
+        where = " OR ".join(f"{field}_tsv @@ plainto_tsquery('simple', :query)" for field in fields)
+        return f"({where})", params
+
+    def _search_postgresql(self, terms: List[str], fields: Sequence[str], limit: int) -> List[Dict[str, Any]]:
+        where, params = self._postgresql_condition(terms, fields)
+        params["limit"] = limit
+        weights = {"title": 1.0, "keywords": 0.5, "cleaned_text": 0.1}
+        score = " + ".join(
+            f"{weights[field]} * ts_rank({field}_tsv, plainto_tsquery('simple', :query))" for field in fields
+        )
+        rows = self.db_session.execute(text(
+            f"SELECT doc_id, title, {score} AS score FROM {FTS_TABLE_NAME} "
+            f"WHERE {where} ORDER BY score DESC LIMIT :limit"
+        ), params)
+        return [{"document_id": row[0], "title": row[1], "score": float(row[2])} for row in rows]
+
+    # ---------------- 通用 ----------------
+
+    def _search_like(self, terms: List[str], fields: Sequence[str], limit: Optional[int]) -> List[Dict[str, Any]]:
+        """索引不可用时的退化实现：在 documents 表上做 LIKE 查询"""
+        columns = {
+            "title": DocumentDB.title,
+            "cleaned_text": DocumentDB.cleaned_text,
+            "keywords": DocumentDB.document_metadata,
+        }
+        query = self.db_session.query(DocumentDB.id, DocumentDB.title)
+        for term in terms:
+            query = query.filter(or_(*[columns[field].like(f"%{term}%") for field in fields]))
+        if limit is not None:
+            query = query.limit(limit)
+        return [{"document_id": row.id, "title": row.title, "score": 0.0} for row in query]
+
+    def _delete_ids(self, document_ids: List[str]):
+        if not document_ids:
+            return
+        params = {f"id_{i}": document_id for i, document_id in enumerate(document_ids)}
+        placeholders = ", ".join(f":{key}" for key in params)
+        if self.dialect == "sqlite":
+            # 按 rowid 删除走 FTS5 的 rowid 查找，映射表中的条目保留，重新写入时复用同一个 rowid
+            self.db_session.execute(text(
+                f"DELETE FROM {FTS_TABLE_NAME} WHERE rowid IN "
+                f"(SELECT fts_rowid FROM {FTS_ROWID_TABLE_NAME} WHERE doc_id IN ({placeholders}))"
+            ), params)
+        else:
+            self.db_session.execute(text(f"DELETE FROM {FTS_TABLE_NAME} WHERE doc_id IN ({placeholders})"), params)
+
+    @staticmethod
+    def _check_fields(fields: Sequence[str]) -> Sequence[str]:
+        unknown = set(fields) - set(FTS_FIELDS)
+        if unknown or not fields:
+            raise ValueError(f"Unknown full-text fields: {sorted(unknown)}; expected a subset of {FTS_FIELDS}.")
+        return fields
+
+    @staticmethod
+    def _extract_keywords(metadata: Optional[Dict[str, Any]]) -> str:
+        """从 document_metadata['reference']['keywords'] 中取出关键词，以空格拼接"""
+        if not isinstance(metadata, dict):
+            return ""
+        reference = metadata.get('reference', {})
+        if not isinstance(reference, dict):
+            return ""
+        keywords = reference.get('keywords', [])
+        if not isinstance(keywords, list):
+            return ""
+        return " ".join(str(keyword) for keyword in keywords)
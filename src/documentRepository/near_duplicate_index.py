@@ -0,0 +1,298 @@
+# src/documentRepository/near_duplicate_index.py
+import hashlib
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from .database_models import DocumentDB, DocumentLshBand, DocumentSignature
+
+# 字符 shingle 的长度 (按字符切分，中英文都适用)
+SHINGLE_SIZE = 5
+# MinHash 签名长度 = LSH_BANDS * 每个 band 的行数
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16
+# 估计的 Jaccard 相似度达到该阈值时视为近似重复
+# (16 个 band × 8 行时，相似度 0.8 的文档对被选为候选的概率约为 0.9996)
+DUPLICATE_THRESHOLD = 0.8
+
+_ROWS_PER_BAND = NUM_PERMUTATIONS // LSH_BANDS
+# 每次计算最小值时处理的 shingle 数量，限制中间矩阵 (NUM_PERMUTATIONS × block) 的内存占用
+_SHINGLE_BLOCK = 4096
+_WHITESPACE = re.compile(r'\s+')
+
+# 固定种子的 multiply-add-shift 哈希族：h(x) = (a * x + b) mod 2^64 >> 32，签名在不同进程之间可比较
+_rng = np.random.default_rng(20240611)
+_HASH_A = _rng.integers(1, 2 ** 63, size=NUM_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_HASH_B = _rng.integers(0, 2 ** 63, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_ROLLING_BASE = np.uint64(1099511628211)
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """文本 (忽略大小写，空白归一) 的全部字符 shingle 的 32 位哈希，去重"""
+    text = _WHITESPACE.sub(' ', text).strip().lower()
+    codepoints = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(codepoints) == 0:
+        return np.empty(0, dtype=np.uint64)
+    size = min(SHINGLE_SIZE, len(codepoints))
+    count = len(codepoints) - size + 1
+    # 多项式滚动哈希，uint64 溢出即取模 2^64
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        hashes = hashes * _ROLLING_BASE + codepoints[offset:offset + count]
+    return np.unique((hashes >> np.uint64(32)) ^ (hashes & np.uint64(0xFFFFFFFF)))
+
+def minhash_signature(text: Optional[str]) -> Optional[np.ndarray]:
+    """
+    计算文本的 MinHash 签名。
+
+    Returns:
+        长度为 NUM_PERMUTATIONS 的 uint32 数组；文本为空时为 None。
+    """
+    if not text:
+        return None
+    shingles = _shingle_hashes(text)
+    if len(shingles) == 0:
+        return None
+    signature = np.full(NUM_PERMUTATIONS, np.iinfo(np.uint32).max, dtype=np.uint64)
+    for start in range(0, len(shingles), _SHINGLE_BLOCK):
+        block = shingles[start:start + _SHINGLE_BLOCK]
+        permuted = (_HASH_A[:, None] * block[None, :] + _HASH_B[:, None]) >> np.uint64(32)
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+def estimate_similarity(signature: np.ndarray, other: np.ndarray) -> float:
+    """两个签名估计的 Jaccard 相似度"""
+    return float(np.count_nonzero(signature == other)) / len(signature)
+
+def band_buckets(signature: np.ndarray) -> List[Tuple[int, int]]:
+    """签名按 band 切分后每个 band 的桶 [(band, bucket)]，bucket 为有符号 64 位整数"""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND].tobytes()
+        digest = hashlib.blake2b(rows, digest_size=8).digest()
+        buckets.append((band, int.from_bytes(digest, 'little', signed=True)))
+    return buckets
+
+class NearDuplicateIndex:
+    """
+    documents 表正文的近似重复索引 (MinHash + LSH)，持久化在 document_signatures 和 document_lsh_bands 表中。
+
+    文档写入时与文档在同一个事务中更新：计算签名，在 LSH 桶中查找候选并用签名估计相似度，
+    相似度达到 DUPLICATE_THRESHOLD 时将文档链接到候选所属的规范文档 (最先写入的那一篇)。
+    规范文档始终只有一层，不会出现重复文档指向另一篇重复文档的链。
+    """
+
+    def __init__(self, db_session: Session, batch_size: int = 500, threshold: float = DUPLICATE_THRESHOLD):
+        self.db_session = db_session
+        self.batch_size = batch_size
+        self.threshold = threshold
+
+    def index_documents(self, rows: Iterable[Tuple[str, Optional[str]]]) -> Dict[str, Optional[str]]:
+        """
+        写入或替换文档的签名和 LSH 桶，不提交事务，由调用方与文档写入一起提交。
+        文档正文变化时，原先以它为规范文档的重复文档按各自的签名重新查找规范文档。
+
+        Args:
+            rows: (document_id, cleaned_text)
+
+        Returns:
+            {document_id: canonical_id}，不是近似重复的文档为 None。
+        """
+        now = datetime.utcnow()
+        canonical_ids: Dict[str, Optional[str]] = {}
+        for document_id, cleaned_text in rows:
+            signature = minhash_signature(cleaned_text)
+            previous = self.db_session.query(DocumentSignature.signature, DocumentSignature.canonical_id).filter(
+                DocumentSignature.document_id == document_id
+            ).first()
+            if previous is not None and signature is not None and bytes(previous.signature) == signature.tobytes():
+                # 签名未变，保留原有条目和链接
+                canonical_ids[document_id] = previous.canonical_id
+                continue
+            # 先移除旧条目，文档不会匹配到自己的旧签名
+            self._delete_entries([document_id])
+            if signature is None:
+                canonical_ids[document_id] = None
+            else:
+                canonical_ids[document_id] = self._insert_signature(document_id, signature, now)
+            self._reresolve_duplicates_of(document_id, now)
+        return canonical_ids
+
+    def delete_documents(self, document_ids: Iterable[str]) -> List[str]:
+        """
+        删除文档的签名和 LSH 桶，不提交事务。
+        被删除的规范文档的重复文档中，ID 最小的一篇成为新的规范文档，并重新排入向量化队列
+        (近似重复文档入库时跳过了向量化)。
+
+        Returns:
+            成为新规范文档的文档 ID。
+        """
+        document_ids = list(document_ids)
+        if not document_ids:
+            return []
+        deleted = set(document_ids)
+        self._delete_entries(document_ids)
+        orphans: Dict[str, List[str]] = {}
+        for start in range(0, len(document_ids), self.batch_size):
+            for document_id, canonical_id in self.db_session.query(
+                DocumentSignature.document_id, DocumentSignature.canonical_id
+            ).filter(DocumentSignature.canonical_id.in_(document_ids[start:start + self.batch_size])):
+                if document_id not in deleted:
+                    orphans.setdefault(canonical_id, []).append(document_id)
+        promoted = []
+        for members in orphans.values():
+            members.sort()
+            new_canonical, others = members[0], members[1:]
+            self.db_session.query(DocumentSignature).filter(DocumentSignature.document_id == new_canonical).update(
+                {DocumentSignature.canonical_id: None, DocumentSignature.similarity: None}, synchronize_session=False
+            )
+            for start in range(0, len(others), self.batch_size):
+                self.db_session.query(DocumentSignature).filter(
+                    DocumentSignature.document_id.in_(others[start:start + self.batch_size])
+                ).update({DocumentSignature.canonical_id: new_canonical}, synchronize_session=False)
+            promoted.append(new_canonical)
+        self._queue_for_vectorization(promoted)
+        return promoted
+
+    def clear(self):
+        """清空索引，不提交事务"""
+        self.db_session.query(DocumentLshBand).delete(synchronize_session=False)
+        self.db_session.query(DocumentSignature).delete(synchronize_session=False)
+
+    def canonical_ids(self, document_ids: Iterable[str]) -> Dict[str, str]:
+        """
+        查询近似重复文档的规范文档。
+
+        Returns:
+            {document_id: canonical_id}，只包含近似重复的文档。
+        """
+        document_ids = list(document_ids)
+        result: Dict[str, str] = {}
+        for start in range(0, len(document_ids), self.batch_size):
+            result.update(self.db_session.query(DocumentSignature.document_id, DocumentSignature.canonical_id).filter(
+                DocumentSignature.document_id.in_(document_ids[start:start + self.batch_size]),
+                DocumentSignature.canonical_id.isnot(None)
+            ).all())
+        return result
+
+    def duplicate_groups(self, after: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        近似重复报告：按规范文档分组，按规范文档 ID 游标分页。
+
+        Args:
+            after: 上一页最后一个规范文档的 ID。
+            limit: 每页的分组数。
+
+        Returns:
+            [{"canonical_id": ..., "duplicates": [{"document_id": ..., "similarity": ...}]}]
+        """
+        canonical_query = self.db_session.query(DocumentSignature.canonical_id).filter(
+            DocumentSignature.canonical_id.isnot(None)
+        )
+        if after is not None:
+            canonical_query = canonical_query.filter(DocumentSignature.canonical_id > after)
+        canonical_ids = [row.canonical_id for row in canonical_query.distinct().order_by(
+            DocumentSignature.canonical_id
+        ).limit(limit)]
+        if not canonical_ids:
+            return []
+        groups: Dict[str, List[Dict[str, Any]]] = {canonical_id: [] for canonical_id in canonical_ids}
+        for document_id, canonical_id, similarity in self.db_session.query(
+            DocumentSignature.document_id, DocumentSignature.canonical_id, DocumentSignature.similarity
+        ).filter(DocumentSignature.canonical_id.in_(canonical_ids)).order_by(DocumentSignature.document_id):
+            groups[canonical_id].append({"document_id": document_id, "similarity": similarity})
+        return [{"canonical_id": canonical_id, "duplicates": duplicates} for canonical_id, duplicates in groups.items()]
+
+    def _find_canonical(self, document_id: str, signature: np.ndarray,
+                        buckets: List[Tuple[int, int]]) -> Tuple[Optional[str], Optional[float]]:
+        """在 LSH 候选中找到相似度最高且达到阈值的文档，返回它的规范文档和相似度"""
+        candidate_ids = {row.document_id for row in self.db_session.query(DocumentLshBand.document_id).filter(
+            tuple_(DocumentLshBand.band, DocumentLshBand.bucket).in_(buckets)
+        )}
+        if not candidate_ids:
+            return None, None
+        best: Optional[Tuple[float, str, Optional[str]]] = None
+        for candidate_id, candidate_signature, canonical_id in self.db_session.query(
+            DocumentSignature.document_id, DocumentSignature.signature, DocumentSignature.canonical_id
+        ).filter(DocumentSignature.document_id.in_(list(candidate_ids))):
+            similarity = estimate_similarity(signature, np.frombuffer(candidate_signature, dtype=np.uint32))
+            if similarity < self.threshold:
+                continue
+            # 相似度相同时选择 ID 较小的文档，结果与候选的返回顺序无关
+            if best is None or similarity > best[0] or (similarity == best[0] and candidate_id < best[1]):
+                best = (similarity, candidate_id, canonical_id)
+        if best is None:
+            return None, None
+        similarity, candidate_id, canonical_id = best
+        # 候选原先是该文档的重复文档时，候选成为新的规范文档
+        if canonical_id is None or canonical_id == document_id:
+            return candidate_id, similarity
+        return canonical_id, similarity
+
+    def _insert_signature(self, document_id: str, signature: np.ndarray, now: datetime) -> Optional[str]:
+        """写入文档的签名和 LSH 桶并链接到规范文档 (文档的旧条目需已删除)，返回规范文档 ID"""
+        buckets = band_buckets(signature)
+        canonical_id, similarity = self._find_canonical(document_id, signature, buckets)
+        self.db_session.execute(DocumentSignature.__table__.insert(), [dict(
+            document_id=document_id, signature=signature.tobytes(),
+            canonical_id=canonical_id, similarity=similarity, computed_at=now
+        )])
+        self.db_session.execute(DocumentLshBand.__table__.insert(), [
+            dict(band=band, bucket=bucket, document_id=document_id) for band, bucket in buckets
+        ])
+        if canonical_id is not None:
+            # 原先以该文档为规范文档的重复文档改为指向新的规范文档
+            self.db_session.query(DocumentSignature).filter(
+                DocumentSignature.canonical_id == document_id
+            ).update({DocumentSignature.canonical_id: canonical_id}, synchronize_session=False)
+            # 新的规范文档可能原先就是该文档的重复文档，此时它不再指向任何文档，并补做向量化
+            if self.db_session.query(DocumentSignature).filter(
+                DocumentSignature.document_id == canonical_id, DocumentSignature.canonical_id.isnot(None)
+            ).update({DocumentSignature.canonical_id: None, DocumentSignature.similarity: None},
+                     synchronize_session=False):
+                self._queue_for_vectorization([canonical_id])
+        return canonical_id
+
+    def _reresolve_duplicates_of(self, document_id: str, now: datetime):
+        """
+        规范文档的正文变化后，它原先的重复文档可能不再与它相似：先断开这些链接，再按 ID 顺序用各自的签名重新查找规范文档。
+        不再是近似重复的文档重新排入向量化队列。
+        """
+        duplicates = self.db_session.query(DocumentSignature.document_id, DocumentSignature.signature).filter(
+            DocumentSignature.canonical_id == document_id
+        ).order_by(DocumentSignature.document_id).all()
+        if not duplicates:
+            return
+        duplicate_ids = [row.document_id for row in duplicates]
+        for start in range(0, len(duplicate_ids), self.batch_size):
+            self.db_session.query(DocumentSignature).filter(
+                DocumentSignature.document_id.in_(duplicate_ids[start:start + self.batch_size])
+            ).update({DocumentSignature.canonical_id: None, DocumentSignature.similarity: None},
+                     synchronize_session=False)
+        for duplicate_id, signature in duplicates:
+            self._delete_entries([duplicate_id])
+            self._insert_signature(duplicate_id, np.frombuffer(signature, dtype=np.uint32), now)
+        canonical_ids = self.canonical_ids(duplicate_ids)
+        self._queue_for_vectorization([
+            duplicate_id for duplicate_id in duplicate_ids if duplicate_id not in canonical_ids
+        ])
+
+    def _queue_for_vectorization(self, document_ids: List[str]):
+        """将文档标记为未向量化，由 update_vec_database 补齐向量 (向量已存在的文档只会被重新标记)"""
+        for start in range(0, len(document_ids), self.batch_size):
+            self.db_session.query(DocumentDB).filter(
+                DocumentDB.id.in_(document_ids[start:start + self.batch_size])
+            ).update({DocumentDB.is_Vectorlized: False}, synchronize_session=False)
+
+    def _delete_entries(self, document_ids: List[str]):
+        for start in range(0, len(document_ids), self.batch_size):
+            batch = document_ids[start:start + self.batch_size]
+            self.db_session.query(DocumentLshBand).filter(
+                DocumentLshBand.document_id.in_(batch)
+            ).delete(synchronize_session=False)
+            self.db_session.query(DocumentSignature).filter(
+                DocumentSignature.document_id.in_(batch)
+            ).delete(synchronize_session=False)
@@ -0,0 +1,50 @@
+# src/documentRepository/rule_storage.py
+from typing import TYPE_CHECKING, Optional
+
+from sqlalchemy.orm import Session
+
+from .database_models import RuleDB
+
+if TYPE_CHECKING:
+    from ..api.models.rule_models import RuleCreate
+
+# 新建规则时从请求模型复制到 rules 表的字段
+RULE_FIELDS = ('name', 'description', 'type', 'pattern_config', 'severity', 'is_active')
+
+class RuleStorage:
+    """
+    负责 rules 表的写入。
+
+    FileAssiant (同步会话) 和异步端点共用这一份实现，异步端点通过 AsyncSession.run_sync 调用：
+
+        db_rule = await db.run_sync(lambda session: RuleStorage(session).add_rule(rule))
+    """
+
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+
+    def add_rule(self, rule: "RuleCreate") -> RuleDB:
+        """新建规则并提交，返回已刷新 (带 ID 和时间戳) 的规则"""
+        db_rule = RuleDB(**{field: getattr(rule, field) for field in RULE_FIELDS})
+        try:
+            self.db_session.add(db_rule)
+            self.db_session.commit()
+        except Exception:
+            self.db_session.rollback()
+            raise
+        self.db_session.refresh(db_rule)
+        return db_rule
+
+    def set_rule_status(self, rule_name: str, is_active: bool) -> Optional[RuleDB]:
+        """
+        设置规则的激活状态并提交。
+
+        Returns:
+            更新后的规则；没有该名称的规则时为 None。
+        """
+        db_rule = self.db_session.query(RuleDB).filter(RuleDB.name == rule_name).first()
+        if db_rule is None:
+            return None
+        db_rule.is_active = is_active # type: ignore
+        self.db_session.commit()
+        return db_rule
@@ -3,38 +3,110 @@
 # user： ryan
 
 # 导入必要的库
+import copy
 import os
+import threading
+from typing import Iterable, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
 
 from numpy import emath
+from sqlalchemy.orm import Session
 
 # 导入必要工程内部模块
 from .purseContent.ingestion_coordinator import IngestionCoordinator
 from .purseContent.document_model import Document # 确保 Document 模型被导入
 from .purseContent.meta_content import extract_metadata
 from .norms_checker import NormsChecker
-from .documentRepository.database_models import SessionLocal,RuleDB, DocumentDB, DocumentDependency # 导入 DocumentDB 和 DocumentDependency
+from .documentRepository.database_models import SessionLocal,RuleDB, DocumentDB, DocumentSignature # 导入 DocumentDB
 from .documentRepository.document_storage import DocumentStorage
+from .documentRepository.dependency_storage import DependencyStorage, register_edge_listener
+from .documentRepository.near_duplicate_index import NearDuplicateIndex
+from .documentRepository.rule_storage import RuleStorage
 from .relationshipExtractor.dependency_builder_byMeta import DependencyBuilderByMeta
+from .relationshipExtractor.graph_centrality import PAGERANK, compute_centrality, get_centrality_scores
 from .ai_retrieval.ingestor import DocumentIngestor # 导入 DocumentIngestor
-from .ai_retrieval.vector_db_manager import VectorDBManager # 导入 VectorDBManager
+from .ai_retrieval.vector_db_manager import ChunkWriteBuffer, VectorDBManager # 导入 VectorDBManager
 from .ai_retrieval.retriever import Retriever # 导入 DocumentRetriever
 from .ai_retrieval.embedder import EmbeddingComponent
+from .ai_retrieval.cache import LRUCache, corpus_version
 
 from .api.models.rule_models import Rule, RuleCreate, RuleUpdate
-import re
+
+if TYPE_CHECKING:
+    from .service_container import ServiceContainer
+
+# 依赖检索排序时文档中心性所占的权重，默认 0 (只按向量距离排序)；调用时或在此处设为正数以启用中心性融合
+CENTRALITY_WEIGHT = 0.0
+# 是否跳过近似重复文档 (已链接到规范文档) 的向量化，避免重复内容挤占检索结果
+SKIP_NEAR_DUPLICATE_EMBEDDING = True
+# 检索结果缓存的容量，键包含语料版本号，向量数据库或依赖边写入后旧条目自动失效
+SEARCH_RESULT_CACHE_SIZE = 256
+# 批量向量化时每批汇集的文档数，这些文档的块按长度分桶后一起送入嵌入模型
+VECTORIZE_DOCUMENT_BATCH = 32
+
+_search_cache = LRUCache(max_size=SEARCH_RESULT_CACHE_SIZE)
+# 已注册语料版本监听器的数据库 URL
+_versioned_databases: Set[str] = set()
+_versioned_databases_lock = threading.Lock()
+
+def _track_corpus_version(db_session: Session):
+    """依赖边在 db_session 所在数据库中提交变更时递增语料版本号 (每个数据库只注册一次)"""
+    key = str(db_session.get_bind().url)
+    if key in _versioned_databases:
+        return
+    with _versioned_databases_lock:
+        if key not in _versioned_databases:
+            register_edge_listener(key, corpus_version)
+            _versioned_databases.add(key)
+
+def rule_added_message(db_rule: RuleDB) -> str:
+    return f"Rule '{db_rule.name}' added successfully."
+
+def rule_status_message(rule_name: str, is_active: bool, found: bool) -> str:
+    if not found:
+        return f"Rule with name: {rule_name} not found."
+    return f"Rule {rule_name} status updated to {is_active}."
+
+def search_cache_stats() -> dict:
+    """检索结果缓存的命中率等统计"""
+    return dict(_search_cache.stats(), corpus_version=corpus_version.value)
 
 class FileAssiant:
-    def __init__(self):
-        self._Ingeser = IngestionCoordinator()
+    def __init__(self, db_session: Optional[Session] = None, services: Optional["ServiceContainer"] = None):
+        """
+        Args:
+            db_session: 可选，请求级数据库会话，由调用方负责关闭；不传时自行创建。
+            services: 可选，进程级服务容器；传入时复用其中已加载的模型和客户端。
+        """
         self._checker = None
-        self._db = SessionLocal()
+        self._owns_db = db_session is None
+        self._db = db_session if db_session is not None else SessionLocal()
         self._document_storage = DocumentStorage(self._db) # 实例化 DocumentStorage
-        self._document_ingestor = DocumentIngestor() # 实例化 DocumentIngestor
-        self._vector_db_manager = VectorDBManager() # 实例化 VectorDBManager
-        # self._embedding_component = EmbeddingComponent() # 实例化 EmbeddingComponent
-        # self._retriever = Retriever(embedding_component=self._embedding_component, vector_db_manager=self._vector_db_manager) # 实例化 Retriever
-        self._embedding_component = None
-        self._retriever = None
+        _track_corpus_version(self._db)
+        if services is not None:
+            self._Ingeser = services.ingestion_coordinator
+            self._document_ingestor = services.document_ingestor
+            self._vector_db_manager = services.vector_db_manager
+            self._embedding_component = services.embedding_component
+            self._retriever = services.retriever
+        else:
+            self._Ingeser = IngestionCoordinator()
+            self._document_ingestor = DocumentIngestor() # 实例化 DocumentIngestor
+            self._vector_db_manager = self._document_ingestor.db_manager # 复用 DocumentIngestor 的 VectorDBManager
+            self._embedding_component = None
+            self._retriever = None
+
+    # 关闭自行创建的数据库会话
+    def close(self):
+        if self._owns_db:
+            self._db.close()
+
+    # 获取检索器，复用 DocumentIngestor 已加载的嵌入模型
+    def _get_retriever(self) -> Retriever:
+        if self._retriever is None:
+            self._embedding_component = self._document_ingestor.embedder
+            self._retriever = Retriever(embedding_component=self._embedding_component, vector_db_manager=self._vector_db_manager) # 实例化 Retriever
+        return self._retriever
+
     # 激活合规检查
     def activate_norms_checker(self):
         self._checker = NormsChecker(self._db)
@@ -91,42 +163,54 @@ class FileAssiant:
                     # 3. 将文档存储到数据库 (upsert)
                     document_storage.upsert_document(document)
                     print(f"Document '{document.title}' ({document.id}) stored successfully after norm check.")
-                    # 4. 触发依赖关系构建 (异步或同步)
-                    # 注意：依赖关系构建通常需要文档已经在数据库中，以便进行反向查找
-                    # 因此将其放在存储之后是合理的
-                    dependency_builder = DependencyBuilderByMeta(self._db)
-                    # 依赖构建器需要文档 ID
-                    dependency_builder.build_dependencies_for_document_byId(document.id)
-                    print(f"Dependency building triggered for {document.id}")
-                    # 构建向量
-                    try:
-                        document_metadata = document.metadata if isinstance(document.metadata, dict) else {}
-                        self._document_ingestor.ingest_document(
-                            document_text=document.cleaned_text,
-                            document_id=document.id,
-                            document_metadata=document_metadata
-                        )
-                        # 向量化成功后，更新数据库中的 is_Vectorlized 字段
-                        db_document = self._db.query(DocumentDB).filter(DocumentDB.id == document.id).first()
-                        if db_document:
-                            db_document.is_Vectorlized = True #type: ignore
-                            self._db.commit()
-                            print(f"Document '{document.id}' marked as vectorized in database.")
-                        else:
-                            print(f"Warning: Document '{document.id}' not found in database after vectorization.")
-
-                        print(f"Success: Document ingested, stored, dependencies built,vectorlize successfully after passing norm check.")
-                    except Exception as e:
-                        print(f"Error vectorizing document {document.id}: {e}")
-                        return "Success: Document ingested, stored, and dependencies built successfully after passing norm check.but vector build failed."
+                    return self._build_dependency_and_vector(document)
                 except Exception as e:
                 # 存储失败，回滚事务并抛出异常
                     self._db.rollback()
                     return f"Error: Failed to store document in database after norm check: {e}"
-                return ""
             else:
                 return "错误：文件不符合规范"
 
+    # 2'.文档入库之后：构建依赖关系 >> 生成向量 >> 标记已向量化
+    def _build_dependency_and_vector(self, document: Document) -> str:
+        # 4. 触发依赖关系构建 (异步或同步)
+        # 注意：依赖关系构建通常需要文档已经在数据库中，以便进行反向查找
+        # 因此将其放在存储之后是合理的
+        dependency_builder = DependencyBuilderByMeta(self._db)
+        # 依赖构建器需要文档 ID
+        dependency_builder.build_dependencies_for_document_byId(document.id)
+        print(f"Dependency building triggered for {document.id}")
+        # 近似重复文档在入库时已链接到规范文档，不再重复向量化
+        if SKIP_NEAR_DUPLICATE_EMBEDDING:
+            canonical_id = NearDuplicateIndex(self._db).canonical_ids([document.id]).get(document.id)
+            if canonical_id is not None:
+                # 文档此前可能已向量化 (例如被编辑成另一篇文档的副本)，旧正文的块不应再出现在检索结果中
+                self._drop_duplicate_vectors([document.id])
+                print(f"Document '{document.id}' is a near-duplicate of '{canonical_id}', skipping vectorization.")
+                return f"Success: Document ingested, stored, and dependencies built successfully; near-duplicate of {canonical_id}, vectorization skipped."
+        # 构建向量
+        try:
+            document_metadata = document.metadata if isinstance(document.metadata, dict) else {}
+            self._document_ingestor.ingest_document(
+                document_text=document.cleaned_text,
+                document_id=document.id,
+                document_metadata=document_metadata
+            )
+            # 向量化成功后，更新数据库中的 is_Vectorlized 字段
+            db_document = self._db.query(DocumentDB).filter(DocumentDB.id == document.id).first()
+            if db_document:
+                db_document.is_Vectorlized = True #type: ignore
+                self._db.commit()
+                print(f"Document '{document.id}' marked as vectorized in database.")
+            else:
+                print(f"Warning: Document '{document.id}' not found in database after vectorization.")
+
+            print(f"Success: Document ingested, stored, dependencies built,vectorlize successfully after passing norm check.")
+        except Exception as e:
+            print(f"Error vectorizing document {document.id}: {e}")
+            return "Success: Document ingested, stored, and dependencies built successfully after passing norm check.but vector build failed."
+        return ""
+
     # 2.1 上传文本
     def upload_text(self, text: str, title: str = "Untitled"):
         ref = extract_metadata(text)
@@ -162,19 +246,54 @@ class FileAssiant:
 
 
     # 3.批量上传
-    def batch_upload_files(self, directory_path: str):
+    def batch_upload_files(self, directory_path: str, batch_size: int = 200):
         results = {}
         if not os.path.isdir(directory_path):
             return f"错误：'{directory_path}' 不是一个有效的文件夹路径"
 
-        for root, _, files in os.walk(directory_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                print(f"Uploading file: {file_path}")
-                result = self.upload_file(source_type='local_file', source_identifier=file_path)
-                results[file_path] = result
-                print(f"Result for {file_path}: {result}")
+        def iter_documents():
+            for root, _, files in os.walk(directory_path):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    print(f"Uploading file: {file_path}")
+                    document = self._Ingeser.ingest('local_file', file_path)
+                    if document is None:
+                        results[file_path] = "错误：文件读取失败"
+                    elif not self.is_file_conform_rule(document):
+                        results[file_path] = "错误：文件不符合规范"
+                    else:
+                        yield document
+
+        self._bulk_store_documents(iter_documents(), results, batch_size)
+        return results
+
+    # 3.1 批量上传数据源（例如整个 Confluence 空间）
+    def batch_upload_source(self, source_type: str, source_identifier: str, batch_size: int = 200):
+        results = {}
+
+        def iter_documents():
+            for document in self._Ingeser.crawl(source_type, source_identifier):
+                if self.is_file_conform_rule(document):
+                    yield document
+                else:
+                    results[document.source_identifier] = "错误：文件不符合规范"
+
+        self._bulk_store_documents(iter_documents(), results, batch_size)
         return results
+
+    def _bulk_store_documents(self, documents, results: dict, batch_size: int):
+        """批量写入数据库，然后逐个构建依赖和向量，结果写入 results"""
+        document_storage = DocumentStorage(self._db)
+        for document, success, error in document_storage.upsert_documents(documents, batch_size=batch_size):
+            if not success:
+                results[document.source_identifier] = f"Error: Failed to store document in database after norm check: {error}"
+                continue
+            try:
+                results[document.source_identifier] = self._build_dependency_and_vector(document)
+            except Exception as e:
+                self._db.rollback()
+                results[document.source_identifier] = f"Error: Failed to build dependencies for document {document.id}: {e}"
+            print(f"Result for {document.source_identifier}: {results[document.source_identifier]}")
     
     #    4.增加检测规则
     #   {
@@ -193,33 +312,64 @@ class FileAssiant:
     #   }
     # 4.增加检测规则
     def add_rule(self, rule: dict) -> str:
-        rule_instance = RuleCreate(**rule)
-        db_rule = RuleDB(
-            name=rule_instance.name,
-            description=rule_instance.description,
-            type=rule_instance.type,
-            pattern_config=rule_instance.pattern_config,
-            severity=rule_instance.severity,
-            is_active=rule_instance.is_active       
-        )
-        self._db.add(db_rule)
-        self._db.commit()
-        return f"Rule '{db_rule.name}' added successfully."
+        db_rule = RuleStorage(self._db).add_rule(RuleCreate(**rule))
+        return rule_added_message(db_rule)
 
     # 4.1 设置规则的状态
     def set_rule_status(self, rule_name: str, is_active: bool) -> str:
-        rule = self._db.query(RuleDB).filter(RuleDB.name == rule_name).first()
-        if rule is None:
-            return f"Rule with name: {rule_name} not found."
-        setattr(rule, 'is_active', is_active) # 使用 setattr 函数进行赋值
-        self._db.commit()
-        return f"Rule {rule_name} status updated to {is_active}."
+        db_rule = RuleStorage(self._db).set_rule_status(rule_name, is_active)
+        return rule_status_message(rule_name, is_active, db_rule is not None)
 
     # 5.构建所有依赖
     def build_all_dependency(self) -> str:
         dependency_builder = DependencyBuilderByMeta(self._db)
-        dependency_builder.build_dependencies_for_all_documents()
-        return "All dependencies built successfully."
+        edge_count = dependency_builder.rebuild_all_dependencies()
+        return f"All dependencies built successfully ({edge_count} edges)."
+
+    # 5.1 计算依赖图中心性 (PageRank)，用于检索排序
+    def compute_centrality(self, personalize_by_source_type: bool = False) -> str:
+        counts = compute_centrality(self._db, personalize_by_source_type=personalize_by_source_type)
+        corpus_version.bump() # 中心性参与检索排序，重新计算后缓存的检索结果失效
+        if not counts:
+            return "Dependency graph is empty, no centrality scores computed."
+        return f"Centrality computed: {', '.join(f'{score_type}={count}' for score_type, count in counts.items())}."
+
+    # 5.2 删除文档：依赖边、全文索引和元数据引用索引随文档一起删除，再删除向量数据库中的块
+    def delete_document(self, document_id: str) -> str:
+        exists = self._db.query(DocumentDB.id).filter(DocumentDB.id == document_id).first()
+        if exists is None:
+            return f"Document {document_id} not found."
+        try:
+            DocumentStorage(self._db).delete_documents([document_id])
+        except Exception as e:
+            return f"Error: Failed to delete document {document_id}: {e}"
+        self._vector_db_manager.delete_chunks_by_document_id(document_id)
+        return f"Document {document_id} deleted."
+
+    # 5.3 重建近似重复索引 (为索引上线前已入库的文档回填)
+    def detect_duplicates(self) -> str:
+        duplicate_count = self._document_storage.rebuild_near_duplicate_index()
+        if SKIP_NEAR_DUPLICATE_EMBEDDING:
+            # 回填前已向量化的近似重复文档，删除它们的块
+            duplicate_ids = [row.document_id for row in self._db.query(DocumentSignature.document_id).filter(
+                DocumentSignature.canonical_id.isnot(None)
+            ).order_by(DocumentSignature.document_id)]
+            self._drop_duplicate_vectors(duplicate_ids)
+        return f"Near-duplicate detection complete: {duplicate_count} near-duplicate documents found."
+
+    def _drop_duplicate_vectors(self, document_ids: List[str]):
+        """删除近似重复文档在向量数据库中的块，并标记为未向量化 (重新成为规范文档时由 update_vec_database 补齐)"""
+        if not document_ids:
+            return
+        self._vector_db_manager.delete_chunks_by_document_ids(document_ids)
+        self._document_storage.mark_vectorized(document_ids, vectorized=False)
+
+    def _embedding_criteria(self) -> list:
+        """向量化时的文档过滤条件：开启 SKIP_NEAR_DUPLICATE_EMBEDDING 时排除近似重复文档"""
+        if not SKIP_NEAR_DUPLICATE_EMBEDDING:
+            return []
+        duplicates = self._db.query(DocumentSignature.document_id).filter(DocumentSignature.canonical_id.isnot(None))
+        return [~DocumentDB.id.in_(duplicates)]
 
     # 6.为数据库中的所有数据向量化
     # 根据ID判断，如果向量化数据库中记录了这个ID，则已经存在，否则进行向量话
@@ -228,86 +378,146 @@ class FileAssiant:
         遍历关系型数据库中的所有文档，如果文档尚未向量化，则进行向量化。
         """
         print("\n--- Starting vectorization of all documents ---")
-        # 从关系型数据库中获取所有文档的 ID 和内容
-        # 注意：这里需要从 DocumentDB 中获取 cleaned_text 和 document_metadata
-        # 假设 DocumentDB 包含这些字段
-        self._embedding_component = EmbeddingComponent() # 实例化 EmbeddingComponent
-        all_documents_in_db = self._db.query(DocumentDB).all()
-
+        # 从关系型数据库中流式读取文档的 ID、内容和元数据，不加载 raw_content 等大字段
         vectorized_count = 0
         skipped_count = 0
+        # 待向量化的文档，攒够 VECTORIZE_DOCUMENT_BATCH 篇后汇集所有块一起生成向量
+        pending_documents = []
 
-        for doc_db in all_documents_in_db:
-            document_id = doc_db.id
-            document_text = doc_db.cleaned_text
-            # 确保 document_metadata 是一个字典类型
-            document_metadata = doc_db.document_metadata if isinstance(doc_db.document_metadata, dict) else {}
+        documents = self._document_storage.iter_documents(DocumentDB.cleaned_text, DocumentDB.document_metadata,
+                                                          criteria=self._embedding_criteria())
+        # 各批文档的块先累积在写缓冲区中，跨文档合并成大批量写入向量数据库
+        with ChunkWriteBuffer(self._vector_db_manager) as writer:
+            for doc_row, in_vector_db in self._with_vector_presence(documents):
+                document_id = doc_row.id
+                # 确保 document_metadata 是一个字典类型
+                document_metadata = doc_row.document_metadata if isinstance(doc_row.document_metadata, dict) else {}
 
-            if self._vector_db_manager.document_exists_in_vector_db(str(document_id)):
-                print(f"Document '{document_id}' already exists in vector DB. Skipping.")
-                skipped_count += 1
-            else:
-                print(f"Vectorizing document: {document_id}")
-                try:
-                    # 使用 DocumentIngestor 进行向量化
-                    self._document_ingestor.ingest_document(
-                        document_text=str(document_text),
-                        document_id=str(document_id),
-                        document_metadata=document_metadata
-                    )
-                    vectorized_count += 1
-                except Exception as e:
-                    print(f"Error vectorizing document {document_id}: {e}")
-        
+                if in_vector_db:
+                    print(f"Document '{document_id}' already exists in vector DB. Skipping.")
+                    skipped_count += 1
+                    continue
+                pending_documents.append((str(doc_row.cleaned_text), str(document_id), document_metadata))
+                if len(pending_documents) >= VECTORIZE_DOCUMENT_BATCH:
+                    vectorized_count += len(self._vectorize_batch(pending_documents, writer)[0])
+                    pending_documents = []
+
+            vectorized_count += len(self._vectorize_batch(pending_documents, writer)[0])
         print(f"\n--- Vectorization complete. Total vectorized: {vectorized_count}, Skipped: {skipped_count} ---")
         return f"Vectorization complete. Total vectorized: {vectorized_count}, Skipped: {skipped_count}."
 
+    def _with_vector_presence(self, doc_rows: Iterable, batch_size: int = 500) -> Iterator[tuple]:
+        """
+        为流式读取的文档行附上是否已存在于向量数据库中，每 batch_size 行只查询一次向量数据库。
+
+        Returns:
+            (doc_row, in_vector_db)
+        """
+        batch = []
+        for doc_row in doc_rows:
+            batch.append(doc_row)
+            if len(batch) >= batch_size:
+                yield from self._mark_vector_presence(batch)
+                batch = []
+        yield from self._mark_vector_presence(batch)
+
+    def _mark_vector_presence(self, doc_rows: list) -> Iterator[tuple]:
+        if not doc_rows:
+            return
+        existing = self._vector_db_manager.existing_document_ids(str(doc_row.id) for doc_row in doc_rows)
+        for doc_row in doc_rows:
+            yield doc_row, str(doc_row.id) in existing
+
+    def _vectorize_batch(self, documents: List[tuple],
+                         writer: Optional[ChunkWriteBuffer] = None) -> Tuple[List[str], int]:
+        """
+        批量向量化一组文档 (document_text, document_id, document_metadata)。
+        整批失败时逐篇重试，只有出错的文档被跳过。
+        传入 writer 时块先累积在写缓冲区中，调用方需要在依赖写入结果之前 flush。
+
+        Returns:
+            (成功向量化的文档 ID, 失败的文档数)
+        """
+        if not documents:
+            return [], 0
+        print(f"Vectorizing {len(documents)} documents: {[document[1] for document in documents]}")
+        try:
+            return self._document_ingestor.ingest_documents(documents, writer=writer), 0
+        except Exception as e:
+            print(f"Error vectorizing batch, retrying documents one by one: {e}")
+        # 逐篇重试，单篇摄取按块 ID 与已有的块比较，整批失败前已写入的块不会重复
+        succeeded, failed_count = [], 0
+        for document_text, document_id, document_metadata in documents:
+            try:
+                self._document_ingestor.ingest_document(
+                    document_text=document_text,
+                    document_id=document_id,
+                    document_metadata=document_metadata
+                )
+                succeeded.append(document_id)
+            except Exception as e:
+                print(f"Error vectorizing document {document_id}: {e}")
+                failed_count += 1
+        return succeeded, failed_count
+
     # 6.1 更新向量化数据库
-    def update_vec_database(self) -> str:
+    def update_vec_database(self, batch_size: int = 500) -> str:
         """
         遍历关系型数据库中的所有文档，如果文档尚未向量化，则进行向量化。
         """
         
         print("\n--- Starting update vectorization of all documents ---")
-        self._embedding_component = EmbeddingComponent() # 实例化 EmbeddingComponent
 
-        # 查询所有 is_Vectorlized 为 False 的文档
-        documents_to_vectorize = self._db.query(DocumentDB).filter(DocumentDB.is_Vectorlized == False).all() # type: ignore
+        # 流式读取所有 is_Vectorlized 为 False 的文档，只加载向量化需要的列
+        documents_to_vectorize = self._document_storage.iter_documents(
+            DocumentDB.cleaned_text,
+            DocumentDB.document_metadata,
+            criteria=[DocumentDB.is_Vectorlized == False, *self._embedding_criteria()], # type: ignore
+            batch_size=batch_size
+        )
 
         vectorized_count = 0
         skipped_count = 0
         failed_count = 0
+        # 待标记为已向量化的文档 ID，攒够一批后一次性更新
+        pending_ids = []
+        pending_documents = []
+
+        writer = ChunkWriteBuffer(self._vector_db_manager)
 
-        for doc_db in documents_to_vectorize:
-            document_id = doc_db.id
-            document_text = doc_db.cleaned_text
-            document_metadata = doc_db.document_metadata if isinstance(doc_db.document_metadata, dict) else {}
+        def flush_documents():
+            nonlocal vectorized_count, failed_count, pending_documents
+            succeeded, failed = self._vectorize_batch(pending_documents, writer)
+            pending_ids.extend(succeeded)
+            vectorized_count += len(succeeded)
+            failed_count += failed
+            pending_documents = []
 
-            if self._vector_db_manager.document_exists_in_vector_db(str(document_id)):
+        for doc_row, in_vector_db in self._with_vector_presence(documents_to_vectorize, batch_size):
+            document_id = doc_row.id
+            document_metadata = doc_row.document_metadata if isinstance(doc_row.document_metadata, dict) else {}
+
+            if in_vector_db:
                 print(f"Document '{document_id}' already exists in vector DB. Skipping.")
                 # 如果向量数据库中已存在，但关系型数据库中 is_Vectorlized 为 False，则更新关系型数据库
-                if not doc_db.is_Vectorlized: # type: ignore
-                    doc_db.is_Vectorlized = True # type: ignore
-                    print(f"Updated is_Vectorlized for '{document_id}' to True.")
+                pending_ids.append(document_id)
+                print(f"Updated is_Vectorlized for '{document_id}' to True.")
                 skipped_count += 1
             else:
-                print(f"Vectorizing document: {document_id}")
-                try:
-                    self._document_ingestor.ingest_document(
-                        document_text=str(document_text),
-                        document_id=str(document_id),
-                        document_metadata=document_metadata
-                    )
-                    doc_db.is_Vectorlized = True # type: ignore
-                    vectorized_count += 1
-                except Exception as e:
-                    print(f"Error vectorizing document {document_id}: {e}")
-                    self._db.rollback()
-                    failed_count += 1
+                pending_documents.append((str(doc_row.cleaned_text), str(document_id), document_metadata))
+                if len(pending_documents) >= VECTORIZE_DOCUMENT_BATCH:
+                    flush_documents()
+
+            if len(pending_ids) >= batch_size:
+                # 先把缓冲的块写入向量数据库，再标记为已向量化
+                writer.flush()
+                self._document_storage.mark_vectorized(pending_ids)
+                pending_ids.clear()
         
-        self._db.commit()
+        flush_documents()
+        writer.flush()
+        self._document_storage.mark_vectorized(pending_ids)
         return f"Update vectorization complete. Total vectorized: {vectorized_count}, Skipped: {skipped_count}, Failed: {failed_count}."
-        return ""
     
     # 7.从向量数据库中检索
     def retrieve_from_vector_db(self, query_text: str, top_k: int = 5) -> list:
@@ -316,61 +526,72 @@ class FileAssiant:
         """
         if not query_text:
             return []
-        self._embedding_component = EmbeddingComponent() # 实例化 EmbeddingComponent
-        self._retriever = Retriever(embedding_component=self._embedding_component, vector_db_manager=self._vector_db_manager) # 实例化 Retriever
-        results = self._retriever.retrieve_relevant_chunks(query_text, top_k)
-        return results
+        return self._cached_search(
+            ("vector", " ".join(query_text.split()), top_k),
+            lambda: self._get_retriever().retrieve_relevant_chunks(query_text, top_k)
+        )
+
+    def _cached_search(self, key: tuple, compute) -> list:
+        """
+        按检索参数和语料版本号缓存检索结果，返回副本。
+        版本号在计算之前读取，计算期间发生的写入会递增版本号，旧结果不会被之后的请求命中。
+        """
+        key = key + (corpus_version.value,)
+        results = _search_cache.get(key)
+        if results is None:
+            results = compute()
+            _search_cache.put(key, results)
+        return copy.deepcopy(results)
 
     # 8. 结合依赖关系进行检索
-    def retrieve_with_dependencies(self, query_text: str, top_k: int = 3) -> list:
+    def retrieve_with_dependencies(self, query_text: str, top_k: int = 3,
+                                   centrality_weight: float = CENTRALITY_WEIGHT,
+                                   centrality_type: str = PAGERANK) -> list:
         """
         首先从向量数据库中检索相关内容，然后根据这些内容的文档依赖关系，
         在依赖文档的向量中再次搜索原始查询，并将所有结果整合返回。
+
+        排序分数 score = (1 - centrality_weight) * 相似度 + centrality_weight * 文档中心性，
+        相似度为 1 / (1 + distance)，中心性为预先计算并归一化的 PageRank (见 compute_centrality)，未计算时为 0。
+        centrality_weight 为 0 (默认) 时不读取中心性，结果按向量距离升序排列。
+        相同参数的检索在语料 (向量数据库、依赖边、中心性) 未变化时直接返回缓存的结果。
         """
         if not query_text:
             return []
-        self._embedding_component = EmbeddingComponent() # 实例化 EmbeddingComponent
-        self._retriever = Retriever(embedding_component=self._embedding_component, vector_db_manager=self._vector_db_manager) # 实例化 Retriever
+        return self._cached_search(
+            ("dependencies", " ".join(query_text.split()), top_k, centrality_weight, centrality_type),
+            lambda: self._retrieve_with_dependencies(query_text, top_k, centrality_weight, centrality_type)
+        )
+
+    def _retrieve_with_dependencies(self, query_text: str, top_k: int, centrality_weight: float,
+                                    centrality_type: str) -> list:
+        retriever = self._get_retriever()
+        vector_db_manager = retriever.vector_db_manager
+        # 查询向量只计算一次，初步检索和二次检索共用
+        query_embedding = retriever.embedding_component.embed_query(query_text)
+        if not query_embedding:
+            print("Warning: Could not generate embedding for the query.")
+            return []
         # 1. 初步检索
-        initial_results = self._retriever.retrieve_relevant_chunks(query_text, top_k)
+        initial_results = vector_db_manager.search_similar_chunks(query_embedding, top_k=top_k)
         all_results = list(initial_results) # 复制一份，避免修改原始迭代器
 
         # 提取初步检索结果中的文档ID
-        initial_document_ids = {re.sub(r'^[^:]+:', '', result['metadata'].get('document_id')) 
+        initial_document_ids = {result['metadata'].get('document_id')
                                 for result in initial_results 
                                 if result['metadata'].get('document_id')}
 
         # 2. 查询依赖关系并进行二次检索
-        dependent_doc_ids = set()
-        for doc_id in initial_document_ids:
-            # 查询该文档的所有依赖文档
-            dependencies = self._db.query(DocumentDependency).filter(
-                (DocumentDependency.source_document_id == doc_id) | 
-                (DocumentDependency.target_document_ids.contains(doc_id)) # 检查 doc_id 是否在 target_document_ids 列表中
-            ).all()
-
-            for dep in dependencies:
-                if bool(dep.source_document_id == doc_id):
-                    # dependent_doc_ids.update(dep.target_document_ids)
-                    pass
-                else:
-                    # 如果 doc_id 是 target，那么 source 也是其依赖
-                    dependent_doc_ids.add(dep.source_document_id)
+        # 通过 document_edges 的反向索引一次查出引用了这些文档的文档 (如果 doc_id 是 target，那么 source 也是其依赖)
+        dependency_storage = DependencyStorage(self._db)
+        dependent_doc_ids = {source_id for source_id, _, _, _ in dependency_storage.get_incoming_edges(initial_document_ids)}
         
         # 排除已经初步检索过的文档ID，避免重复检索
         dependent_doc_ids = dependent_doc_ids - initial_document_ids
 
-        for dep_doc_id in dependent_doc_ids:
-            # 对每个依赖文档进行二次检索
-            # 这里可以考虑对二次检索的 top_k 进行调整，或者只检索与依赖文档ID相关的块
-            # 为了简化，我们直接使用原始查询和 top_k 进行检索，并添加过滤条件
-            secondary_results = self._retriever.retrieve_relevant_chunks(
-                query_text=query_text,
-                top_k=1,
-                filter_metadata={'document_id': str(dep_doc_id)} # 过滤只检索特定文档的块
-            )
-            all_results.extend(secondary_results)
-            
+        # 所有依赖文档在一次带 $in 过滤的向量查询中完成二次检索，每个文档取最相似的一个块
+        all_results.extend(vector_db_manager.search_best_chunk_per_document(query_embedding, list(dependent_doc_ids)))
+
         # 对所有结果进行去重（如果需要）和排序（例如按距离）
         # 这里简单地将所有结果合并，实际应用中可能需要更复杂的去重和排序逻辑
         # 例如，可以根据 'id' 字段去重，并根据 'distance' 字段排序
@@ -378,7 +599,19 @@ class FileAssiant:
         for res in all_results:
             if res.get('id') not in unique_results or res.get('distance', float('inf')) < unique_results[res.get('id')].get('distance', float('inf')):
                 unique_results[res.get('id')] = res
-        
-        sorted_results = sorted(unique_results.values(), key=lambda x: x.get('distance', float('inf')))
+
+        if centrality_weight <= 0:
+            return sorted(unique_results.values(), key=lambda x: x.get('distance', float('inf')))
+
+        # 融合预先计算的中心性分数，检索时只查字典，不做图计算
+        centrality_scores = get_centrality_scores(self._db)
+        for res in unique_results.values():
+            distance = res.get('distance')
+            similarity = 1.0 / (1.0 + distance) if distance is not None else 0.0
+            centrality = centrality_scores.get(res['metadata'].get('document_id'), centrality_type)
+            res['centrality'] = centrality
+            res['score'] = (1.0 - centrality_weight) * similarity + centrality_weight * centrality
+
+        sorted_results = sorted(unique_results.values(), key=lambda x: x['score'], reverse=True)
 
         return sorted_results
\ No newline at end of file
@@ -1,21 +1,33 @@
 # server usage:
 # uvicorn main:app --reload  // uvicorn src.main:app --reload
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from src.api.routers import rules
 from src.api.routers import documents # 导入新的 documents 路由器
 from src.api.routers import file_assisant_router
+from src.api.routers import graph
+from src.service_container import get_service_container, shutdown_service_container
 
 # 导入数据库初始化函数 (如果需要)
 # from src.documentRepository.database_models import init_db
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时创建一次进程级服务（嵌入模型、向量数据库客户端等），关闭时释放
+    app.state.services = get_service_container()
+    yield
+    shutdown_service_container()
+
+app = FastAPI(lifespan=lifespan)
 
 # init_db() # 如果需要在这里初始化数据库
 
 app.include_router(rules.router)
 app.include_router(documents.router) # 包含新的 documents 路由器
 app.include_router(file_assisant_router.router)
+app.include_router(graph.router)
 
 @app.get("/")
 def read_root():
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator
 from ..document_model import Document
 
 class BaseConnector(ABC):
@@ -17,6 +17,12 @@ class BaseConnector(ABC):
     def parse_content(self, raw_content: Any) -> str:
         """解析内容的抽象方法"""
         pass
+
+    def iter_documents(self, identifier: str) -> Iterator[Document]:
+        """逐个产出标识符下的所有文档，默认只获取单个文档；支持批量遍历的连接器可以重写"""
+        document = self.fetch_content(identifier)
+        if document is not None:
+            yield document
         
     def generate_id(self, identifier: str) -> str:
         """生成内部ID"""
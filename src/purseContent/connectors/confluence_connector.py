@@ -1,5 +1,5 @@
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator
 import requests
 from .base_connector import BaseConnector
 from ..document_model import Document
@@ -12,6 +12,7 @@ class ConfluenceConnector(BaseConnector):
         self.base_url = os.getenv("CONFLUENCE_URL")
         self.username = os.getenv("CONFLUENCE_USERNAME")
         self.api_token = os.getenv("CONFLUENCE_API_TOKEN")
+        self.page_size = int(os.getenv("CONFLUENCE_PAGE_SIZE", "50"))
         
     def get_auth(self):
         """获取认证信息"""
@@ -36,7 +37,48 @@ class ConfluenceConnector(BaseConnector):
         if response.status_code != 200:
             return None
             
-        data = response.json()
+        return self._build_document(response.json())
+
+    def iter_documents(self, identifier: str) -> Iterator[Document]:
+        """
+        分页遍历 Confluence 空间下的所有页面。
+
+        Args:
+            identifier: 空间 key。
+        """
+        url = f"{self.base_url}/rest/api/content"
+        start = 0
+        while True:
+            params = {
+                "spaceKey": identifier,
+                "type": "page",
+                "start": start,
+                "limit": self.page_size,
+                "expand": "body.atlas_doc_format,space,version,history,history.lastUpdated"
+            }
+            response = requests.get(
+                url,
+                headers=self.get_headers(),
+                auth=self.get_auth(),
+                params=params
+            )
+            if response.status_code != 200:
+                print(f"Error crawling Confluence space {identifier} at offset {start}: HTTP {response.status_code}")
+                return
+
+            data = response.json()
+            pages = data.get('results', [])
+            for page in pages:
+                yield self._build_document(page)
+
+            # 没有下一页时结束
+            if not pages or 'next' not in data.get('_links', {}):
+                return
+            start += len(pages)
+
+    def _build_document(self, data: Dict[str, Any]) -> Document:
+        """将 Confluence content API 返回的页面数据转换为 Document"""
+        identifier = str(data.get('id', ''))
         raw_content = data.get('body', {}).get('atlas_doc_format', {}).get('value', {})
         cleaned_text = self.parse_content(raw_content)
         
@@ -2,7 +2,7 @@
 # user： ryan
 
 # 导入必要的库
-from typing import Optional, Dict, Type
+from typing import Optional, Dict, Type, Iterator
 # 导入必要工程内部模块
 from .document_model import Document
 from .connectors.base_connector import BaseConnector
@@ -36,3 +36,10 @@ class IngestionCoordinator:
         connector_class = self._connectors.get(source_type, self._connectors['default'])
         connector = connector_class()
         return connector.fetch_content(source_identifier)
+
+    # 批量读取并清洗数据（例如遍历整个 Confluence 空间）
+    def crawl(self, source_type: str, source_identifier: str) -> Iterator[Document]:
+        """逐个产出数据源标识符下的所有文档"""
+        connector_class = self._connectors.get(source_type, self._connectors['default'])
+        connector = connector_class()
+        return connector.iter_documents(source_identifier)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+
+from src.ai_retrieval.models import TextChunk
+from src.ai_retrieval.vector_db_manager import ChunkWriteBuffer
+
+
+class RecordingVectorDB:
+    def __init__(self):
+        self.writes = []
+
+    def add_embeddings(self, chunks, embeddings):
+        assert len(chunks) == len(embeddings)
+        self.writes.append([chunk.id for chunk in chunks])
+
+
+def _chunks(document_id, count):
+    chunks = [TextChunk(id=f"{document_id}:{index}", document_id=document_id, text=f"text {index}")
+              for index in range(count)]
+    return chunks, np.zeros((count, 4), dtype=np.float32)
+
+
+def test_flushes_when_max_chunks_is_reached():
+    db = RecordingVectorDB()
+    writer = ChunkWriteBuffer(db, max_chunks=5, max_delay=None)
+    writer.add(*_chunks("a", 3))
+    assert db.writes == [] and len(writer) == 3
+    writer.add(*_chunks("b", 2))
+    assert db.writes == [["a:0", "a:1", "a:2", "b:0", "b:1"]]
+    assert len(writer) == 0
+
+
+def test_flushes_remaining_chunks_on_exit():
+    db = RecordingVectorDB()
+    with ChunkWriteBuffer(db, max_chunks=5, max_delay=None) as writer:
+        writer.add(*_chunks("a", 6))
+        writer.add(*_chunks("b", 2))
+        assert db.writes == [["a:0", "a:1", "a:2", "a:3", "a:4", "a:5"]]
+    assert db.writes[1:] == [["b:0", "b:1"]]
+
+
+def test_flushes_after_max_delay(monkeypatch):
+    db = RecordingVectorDB()
+    clock = iter([100.0, 100.5, 111.0])
+    monkeypatch.setattr("src.ai_retrieval.vector_db_manager.time.monotonic", lambda: next(clock))
+    writer = ChunkWriteBuffer(db, max_chunks=100, max_delay=10.0)
+    writer.add(*_chunks("a", 1))
+    assert db.writes == []
+    writer.add(*_chunks("b", 1))
+    assert db.writes == [["a:0", "b:0"]]
+
+
+def test_empty_buffer_does_not_write():
+    db = RecordingVectorDB()
+    with ChunkWriteBuffer(db, max_chunks=5) as writer:
+        writer.add([], np.zeros((0, 4), dtype=np.float32))
+    assert db.writes == []
+    with pytest.raises(ValueError):
+        ChunkWriteBuffer(db, max_chunks=0)
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.documentRepository.database_models import Base
+from src.documentRepository.dependency_storage import DependencyStorage
+from src.relationshipExtractor.dependency_graph import DependencyGraph
+
+# a -> b -> c -> d，a -> e，f 孤立在另一条边 f -> g 上
+EDGES = [
+    ("a", "b", "link_confluence"),
+    ("b", "c", "mention_id"),
+    ("c", "d", "mention_title"),
+    ("a", "e", "meta_parent"),
+    ("f", "g", "mention_id"),
+]
+
+
+@pytest.fixture
+def graph_and_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'graph.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    DependencyStorage(session).insert_edges(EDGES)
+    graph = DependencyGraph(engine)
+    graph.load()
+    try:
+        yield graph, session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def test_neighborhood_respects_depth_and_direction(graph_and_session):
+    graph, _ = graph_and_session
+    assert graph.node_count == 7
+    assert graph.edge_count == 5
+    assert graph.neighborhood("a", depth=1) == {"b": 1, "e": 1}
+    assert graph.neighborhood("a", depth=2) == {"b": 1, "e": 1, "c": 2}
+    assert graph.neighborhood("c", depth=1, direction="in") == {"b": 1}
+    assert graph.neighborhood("c", depth=1, direction="both") == {"b": 1, "d": 1}
+    assert graph.neighborhood("missing") == {}
+
+
+def test_reverse_closure_collects_all_dependents(graph_and_session):
+    graph, _ = graph_and_session
+    assert graph.reverse_closure("d") == {"c": 1, "b": 2, "a": 3}
+    assert graph.reverse_closure("d", max_depth=1) == {"c": 1}
+
+
+def test_shortest_path(graph_and_session):
+    graph, _ = graph_and_session
+    assert graph.shortest_path("a", "d") == ["a", "b", "c", "d"]
+    assert graph.shortest_path("d", "a") is None
+    assert graph.shortest_path("d", "a", direction="in") == ["d", "c", "b", "a"]
+    assert graph.shortest_path("e", "c", direction="both") == ["e", "a", "b", "c"]
+    assert graph.shortest_path("a", "d", max_depth=2) is None
+    assert graph.shortest_path("a", "g") is None
+    assert graph.shortest_path("a", "a") == ["a"]
+    with pytest.raises(ValueError):
+        graph.shortest_path("a", "d", direction="sideways")
+
+
+def test_incremental_edge_changes_are_visible(graph_and_session):
+    graph, session = graph_and_session
+    DependencyStorage(session).replace_outgoing_edges(["b"], [("b", "d", "mention_id")])
+    graph.on_edges_changed({"b"}, {"c", "d"}, False)
+    assert graph.shortest_path("a", "d") == ["a", "b", "d"]
+    assert graph.reverse_closure("c") == {}
+    assert graph.edge_count == 5
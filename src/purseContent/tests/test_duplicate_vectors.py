@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pytest
+
+for module in ("chromadb", "sentence_transformers", "markitdown", "spacy"):
+    pytest.importorskip(module)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.documentRepository.database_models import Base, DocumentDB
+from src.documentRepository.document_storage import DocumentStorage
+from src.file_assiant import FileAssiant
+from src.purseContent.document_model import Document
+
+BASE_TEXT = " ".join(f"第{number}步：检查服务 service-{number} 的配置并重启。" for number in range(60))
+
+
+class RecordingIngestor:
+    def __init__(self, vector_db):
+        self.vector_db = vector_db
+
+    def ingest_document(self, document_text, document_id, document_metadata):
+        self.vector_db.chunks[document_id] = document_text
+
+
+class RecordingVectorDB:
+    """按文档记录块的内存向量库"""
+    def __init__(self):
+        self.chunks = {}
+
+    def delete_chunks_by_document_ids(self, document_ids):
+        for document_id in document_ids:
+            self.chunks.pop(document_id, None)
+
+
+@pytest.fixture
+def assistant(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'assistant.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    vector_db = RecordingVectorDB()
+    services = SimpleNamespace(
+        ingestion_coordinator=None, document_ingestor=RecordingIngestor(vector_db), vector_db_manager=vector_db,
+        embedding_component=None, retriever=None
+    )
+    try:
+        yield FileAssiant(db_session=session, services=services), session, vector_db
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _upload(assistant, source_identifier, text):
+    document = Document(id="", source_type="local", source_identifier=source_identifier,
+                        title=source_identifier, raw_content=text, cleaned_text=text)
+    DocumentStorage(assistant._db).upsert_document(document)
+    assistant._build_dependency_and_vector(document)
+    return document.id
+
+
+def test_embedded_document_edited_into_duplicate_loses_its_chunks(assistant):
+    file_assiant, session, vector_db = assistant
+    original_id = _upload(file_assiant, "guide.md", BASE_TEXT + " 原始版本")
+    edited_id = _upload(file_assiant, "notes.md", "这是一篇与部署无关的会议记录。" * 20)
+    assert set(vector_db.chunks) == {original_id, edited_id}
+    assert session.get(DocumentDB, edited_id).is_Vectorlized is True
+
+    _upload(file_assiant, "notes.md", BASE_TEXT + " 复制版本")
+
+    assert set(vector_db.chunks) == {original_id}
+    session.expire_all()
+    assert session.get(DocumentDB, edited_id).is_Vectorlized is False
+
+
+def test_detect_duplicates_drops_chunks_of_backfilled_duplicates(assistant):
+    file_assiant, session, vector_db = assistant
+    session.add_all([
+        DocumentDB(id="doc-a", cleaned_text=BASE_TEXT + " a", is_Vectorlized=True),
+        DocumentDB(id="doc-b", cleaned_text=BASE_TEXT + " b", is_Vectorlized=True),
+        DocumentDB(id="other", cleaned_text="完全不同的内容，" * 20, is_Vectorlized=True),
+    ])
+    session.commit()
+    vector_db.chunks = {"doc-a": "a", "doc-b": "b", "other": "other"}
+
+    file_assiant.detect_duplicates()
+
+    assert set(vector_db.chunks) == {"doc-a", "other"}
+    session.expire_all()
+    assert [row.id for row in session.query(DocumentDB).filter(DocumentDB.is_Vectorlized == False)] == ["doc-b"]
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("sentence_transformers")
+
+from src.ai_retrieval.cache import corpus_version
+from src.ai_retrieval.embedder import PlaceholderEmbeddingModel
+from src.ai_retrieval.ingestor import DocumentIngestor
+from src.ai_retrieval.vector_db_manager import VectorDBManager
+
+TEXT = "第一段讲部署。第二段讲配置。第三段讲监控。第四段讲告警。第五段讲回滚。"
+
+
+class RecordingEmbedder:
+    """记录送入模型的文本，不加载真实模型"""
+    def __init__(self):
+        self.model = PlaceholderEmbeddingModel(dimension=4)
+        self.embedded = []
+
+    def embed_texts(self, texts, batch_size=64):
+        self.embedded.append(list(texts))
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+class InMemoryVectorDB:
+    """只实现 ingest_document 用到的接口的内存向量库"""
+    chunk_metadata = staticmethod(VectorDBManager.chunk_metadata)
+
+    def __init__(self):
+        self.chunks = {}
+
+    def get_document_chunk_metadata(self, document_id):
+        return {chunk_id: metadata for chunk_id, (metadata, _) in self.chunks.items()
+                if metadata["document_id"] == document_id}
+
+    def add_embeddings(self, chunks, embeddings):
+        for chunk, embedding in zip(chunks, embeddings):
+            self.chunks[chunk.id] = (self.chunk_metadata(chunk), embedding)
+
+    def update_chunk_metadata(self, ids, metadatas):
+        for chunk_id, metadata in zip(ids, metadatas):
+            self.chunks[chunk_id] = (metadata, self.chunks[chunk_id][1])
+
+    def delete_chunks(self, ids):
+        for chunk_id in ids:
+            del self.chunks[chunk_id]
+
+
+@pytest.fixture
+def ingestor():
+    return DocumentIngestor(chunk_size=8, chunk_overlap=2, embedder=RecordingEmbedder(), db_manager=InMemoryVectorDB())
+
+
+def test_reingesting_unchanged_document_embeds_nothing(ingestor):
+    first = ingestor.ingest_document(TEXT, "doc", {"source_type": "wiki"})
+    assert first["added"] > 1 and first["removed"] == 0
+    ingestor.embedder.embedded.clear()
+
+    assert ingestor.ingest_document(TEXT, "doc", {"source_type": "wiki"}) == {
+        "added": 0, "removed": 0, "unchanged": first["added"]
+    }
+    assert ingestor.embedder.embedded == []
+
+
+def test_editing_one_sentence_embeds_only_changed_chunks(ingestor):
+    first = ingestor.ingest_document(TEXT, "doc", {})
+    ingestor.embedder.embedded.clear()
+
+    result = ingestor.ingest_document(TEXT.replace("第五段讲回滚。", "第五段讲灰度发布。"), "doc", {})
+    assert 0 < result["added"] < first["added"]
+    assert result["unchanged"] > 0
+    # 只有新增的块经过嵌入模型，保留的块直接沿用已有向量
+    assert [len(texts) for texts in ingestor.embedder.embedded] == [result["added"]]
+    assert any("灰度" in text for text in ingestor.embedder.embedded[0])
+    assert len(ingestor.db_manager.chunks) == result["added"] + result["unchanged"]
+
+
+def test_metadata_change_updates_without_embedding(ingestor):
+    ingestor.ingest_document(TEXT, "doc", {"source_type": "wiki"})
+    ingestor.embedder.embedded.clear()
+
+    result = ingestor.ingest_document(TEXT, "doc", {"source_type": "confluence"})
+    assert result["added"] == 0
+    assert ingestor.embedder.embedded == []
+    assert {metadata["source_type"] for metadata, _ in ingestor.db_manager.chunks.values()} == {"confluence"}
+
+
+def test_metadata_update_invalidates_cached_searches():
+    class Collection:
+        def update(self, ids, metadatas):
+            self.updated = ids
+
+    manager = VectorDBManager.__new__(VectorDBManager)
+    manager.collection = Collection()
+    version = corpus_version.value
+    manager.update_chunk_metadata([], [])
+    assert corpus_version.value == version
+    manager.update_chunk_metadata(["doc:0:abc"], [{"document_id": "doc", "source_type": "wiki"}])
+    assert manager.collection.updated == ["doc:0:abc"]
+    assert corpus_version.value == version + 1
@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("chromadb")
+
+from src.ai_retrieval.vector_db_manager import VectorDBManager
+
+_OPERATORS = {"$gt": lambda a, b: a > b, "$gte": lambda a, b: a >= b, "$lt": lambda a, b: a < b}
+
+
+def _matches(metadata, where):
+    if "$and" in where:
+        return all(_matches(metadata, clause) for clause in where["$and"])
+    (key, condition), = where.items()
+    value = metadata.get(key)
+    if isinstance(condition, dict):
+        (operator, operand), = condition.items()
+        return value is not None and _OPERATORS[operator](value, operand)
+    return value == condition
+
+
+class FakeCollection:
+    """按 Chroma 的 where 语法过滤的内存集合，记录每次 get 返回的行数"""
+    def __init__(self, rows):
+        self.rows = rows # [(id, text, metadata)]，顺序与 chunk_index 无关
+        self.returned = []
+
+    def get(self, where, include, limit=None):
+        rows = [row for row in self.rows if _matches(row[2], where)][:limit]
+        self.returned.append(len(rows))
+        return {
+            "ids": [row[0] for row in rows],
+            "metadatas": [row[2] for row in rows] if "metadatas" in include else None,
+            "documents": [row[1] for row in rows] if "documents" in include else None,
+        }
+
+
+def _manager(rows):
+    manager = VectorDBManager.__new__(VectorDBManager)
+    manager.collection = FakeCollection(rows)
+    return manager
+
+
+def _indexed_rows(count):
+    rows = [(f"doc:{index}:x", f"text {index}", {"document_id": "doc", "chunk_index": index})
+            for index in range(count)]
+    rows.append(("other:0:x", "other", {"document_id": "other", "chunk_index": 0}))
+    return list(reversed(rows))
+
+
+def test_pages_follow_chunk_index_and_read_only_the_page():
+    manager = _manager(_indexed_rows(23))
+    seen, cursor = [], None
+    while True:
+        manager.collection.returned.clear()
+        items, cursor = manager.list_chunks("doc", after=cursor, limit=10, include_text=True)
+        # 每页只读出本页的块，外加一次最多一行的“是否有下一页”查询
+        assert max(manager.collection.returned) <= 10 and sum(manager.collection.returned) <= 11
+        seen.extend(items)
+        if cursor is None:
+            break
+    assert [item["chunk_index"] for item in seen] == list(range(23))
+    assert seen[5]["text"] == "text 5"
+
+
+def test_exact_multiple_of_limit_has_no_trailing_cursor():
+    items, cursor = _manager(_indexed_rows(10)).list_chunks("doc", limit=10)
+    assert len(items) == 10 and cursor is None
+
+
+def test_legacy_chunks_without_index_fall_back_to_id_order():
+    manager = _manager([(f"doc_{index}", "t", {"document_id": "doc"}) for index in (3, 1, 2)])
+    first, cursor = manager.list_chunks("doc", limit=2)
+    assert [item["id"] for item in first] == ["doc_1", "doc_2"] and cursor == "doc_2"
+    rest, cursor = manager.list_chunks("doc", after=cursor, limit=2)
+    assert [item["id"] for item in rest] == ["doc_3"] and cursor is None
+    with pytest.raises(ValueError):
+        manager.list_chunks("doc", after="doc_9")
@@ -0,0 +1,27 @@
+from src.relationshipExtractor.meta_reference_index import MetaReferenceIndex
+
+
+def _keywords(*keywords):
+    return {"reference": {"keywords": list(keywords)}}
+
+
+def test_referencing_ids_finds_keywords_inside_the_title():
+    index = MetaReferenceIndex()
+    index.add_document("guide-fan", "Notes", None, _keywords("Deploy"))
+    index.add_document("cn-fan", "笔记", None, _keywords("部署指南"))
+    index.add_document("unrelated", "Other", None, _keywords("monitoring"))
+    index.add_document("cited", "Other", None, {"reference": {"citations": ["部署指南 Deploy Guide"]}})
+
+    assert index.referencing_ids("部署指南 Deploy Guide", None, []) == {"guide-fan", "cn-fan", "cited"}
+    assert index.referencing_ids("Monitoring dashboards", None, []) == {"unrelated"}
+
+
+def test_referencing_ids_forget_removed_and_replaced_keywords():
+    index = MetaReferenceIndex()
+    index.add_document("fan", "Notes", None, _keywords("deploy"))
+    index.add_document("other-fan", "Notes", None, _keywords("deploy"))
+    index.add_document("fan", "Notes", None, _keywords("rollback"))
+    index.remove_documents(["other-fan"])
+
+    assert index.referencing_ids("Deploy Guide", None, []) == set()
+    assert index.referencing_ids("Rollback Guide", None, []) == {"fan"}
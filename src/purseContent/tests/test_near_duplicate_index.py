@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.documentRepository.database_models import Base, DocumentDB, DocumentSignature
+from src.documentRepository.near_duplicate_index import NearDuplicateIndex
+
+BASE_TEXT = " ".join(f"第{number}步：检查服务 service-{number} 的配置并重启。" for number in range(60))
+
+
+def _variant(suffix: str) -> str:
+    return BASE_TEXT + f" 附注 {suffix}"
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'duplicates.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _add_documents(session, texts):
+    session.add_all([DocumentDB(id=document_id, cleaned_text=text, is_Vectorlized=True)
+                     for document_id, text in texts.items()])
+    session.commit()
+    canonical_ids = NearDuplicateIndex(session).index_documents(texts.items())
+    session.commit()
+    return canonical_ids
+
+
+def _vectorized(session, document_id):
+    return session.get(DocumentDB, document_id).is_Vectorlized
+
+
+def test_duplicates_link_to_first_document(session):
+    canonical_ids = _add_documents(session, {
+        "doc-a": _variant("a"), "doc-b": _variant("b"), "doc-c": _variant("c"), "other": "完全不同的内容，" * 20,
+    })
+    assert canonical_ids == {"doc-a": None, "doc-b": "doc-a", "doc-c": "doc-a", "other": None}
+
+
+def test_deleting_canonical_promotes_and_queues_lowest_duplicate(session):
+    _add_documents(session, {"doc-a": _variant("a"), "doc-b": _variant("b"), "doc-c": _variant("c")})
+    index = NearDuplicateIndex(session)
+
+    assert index.delete_documents(["doc-a"]) == ["doc-b"]
+    session.commit()
+
+    assert index.canonical_ids(["doc-a", "doc-b", "doc-c"]) == {"doc-c": "doc-b"}
+    assert _vectorized(session, "doc-b") is False
+    assert _vectorized(session, "doc-c") is True
+
+
+def test_reindexing_changed_canonical_releases_its_duplicates(session):
+    _add_documents(session, {"doc-a": _variant("a"), "doc-b": _variant("b"), "doc-c": _variant("c")})
+    index = NearDuplicateIndex(session)
+
+    assert index.index_documents([("doc-a", "改写后的正文与原来的步骤毫无关系。" * 20)]) == {"doc-a": None}
+    session.commit()
+
+    # doc-b 与 doc-a 不再相似，成为新的规范文档并重新排队向量化；doc-c 仍是 doc-b 的重复文档
+    assert index.canonical_ids(["doc-a", "doc-b", "doc-c"]) == {"doc-c": "doc-b"}
+    assert _vectorized(session, "doc-b") is False
+    assert _vectorized(session, "doc-c") is True
+    assert session.query(DocumentSignature).count() == 3
+
+
+def test_reindexing_unchanged_canonical_keeps_links(session):
+    _add_documents(session, {"doc-a": _variant("a"), "doc-b": _variant("b")})
+    index = NearDuplicateIndex(session)
+
+    assert index.index_documents([("doc-a", _variant("a"))]) == {"doc-a": None}
+    session.commit()
+
+    assert index.canonical_ids(["doc-b"]) == {"doc-b": "doc-a"}
+    assert _vectorized(session, "doc-b") is True
@@ -0,0 +1,44 @@
+import asyncio
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from src.api.models.rule_models import RuleCreate
+from src.documentRepository.database_models import Base, RuleDB
+from src.documentRepository.rule_storage import RuleStorage
+
+
+def _rule(name):
+    return RuleCreate(name=name, type="keyword_check", pattern_config={"keywords": ["机密"]}, severity="WARNING")
+
+
+def test_sync_and_async_sessions_share_one_implementation(tmp_path):
+    path = tmp_path / "rules.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    created = RuleStorage(session).add_rule(_rule("sync-rule"))
+    assert created.id is not None and created.is_active is True
+    assert RuleStorage(session).set_rule_status("missing", False) is None
+
+    async def through_async_session():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            async with async_sessionmaker(bind=async_engine, expire_on_commit=False)() as db:
+                db_rule = await db.run_sync(lambda sync_session: RuleStorage(sync_session).add_rule(_rule("async-rule")))
+                updated = await db.run_sync(
+                    lambda sync_session: RuleStorage(sync_session).set_rule_status("sync-rule", False)
+                )
+                return db_rule.id, db_rule.severity, updated.is_active
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(through_async_session())[1:] == ("WARNING", False)
+    session.expire_all()
+    assert [(rule.name, rule.is_active) for rule in session.query(RuleDB).order_by(RuleDB.id)] == [
+        ("sync-rule", False), ("async-rule", True)
+    ]
+    session.close()
+    engine.dispose()
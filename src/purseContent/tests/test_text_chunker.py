@@ -0,0 +1,77 @@
+import pytest
+
+from src.ai_retrieval.text_chunker import (
+    BaseTextSplitter, CharacterTextSplitter, SentenceTextSplitter, approximate_token_counts
+)
+
+TEXT = (
+    "# 部署指南\n"
+    "本文说明如何部署服务。首先准备配置文件；然后启动进程！\n\n"
+    "## 检查\n"
+    "Run the health check. Then verify the logs?  最后确认监控告警正常。\n"
+    + "这是一个没有标点的超长句子" * 40
+    + "\n结束。"
+)
+
+
+@pytest.mark.parametrize("splitter", [
+    SentenceTextSplitter(chunk_size=24, chunk_overlap=6),
+    SentenceTextSplitter(chunk_size=200, chunk_overlap=32),
+    CharacterTextSplitter(chunk_size=50, chunk_overlap=10),
+])
+def test_span_offsets_round_trip_to_source_text(splitter):
+    chunks = splitter.split_text(TEXT, "doc")
+    spans = list(splitter.iter_spans(TEXT))
+    assert chunks and len(chunks) == len(spans)
+    for index, (chunk, span) in enumerate(zip(chunks, spans)):
+        assert chunk.text == TEXT[span.start:span.end]
+        assert chunk.metadata["chunk_index"] == index
+        if "start_offset" in chunk.metadata:
+            assert (chunk.metadata["start_offset"], chunk.metadata["end_offset"]) == span
+    assert spans[0].start == 0
+    assert spans[-1].end == len(TEXT)
+
+
+def test_headings_start_new_chunks():
+    spans = list(SentenceTextSplitter(chunk_size=200, chunk_overlap=32).iter_spans(TEXT))
+    starts = {TEXT[span.start:span.end].split("\n", 1)[0] for span in spans}
+    assert {"# 部署指南", "## 检查"} <= starts
+
+
+def test_batch_length_function_is_called_once_per_document():
+    calls = []
+
+    def count(texts):
+        calls.append(len(texts))
+        return approximate_token_counts(texts)
+
+    batched = SentenceTextSplitter(chunk_size=24, chunk_overlap=6, batch_length_function=count)
+    per_sentence = SentenceTextSplitter(chunk_size=24, chunk_overlap=6)
+    assert list(batched.iter_spans(TEXT)) == list(per_sentence.iter_spans(TEXT))
+    assert len(calls) == 1 and calls[0] > 1
+
+
+def test_splitters_must_implement_iter_spans():
+    class SplitOnly(BaseTextSplitter):
+        def split_text(self, text, document_id, metadata=None):
+            return []
+
+    with pytest.raises(TypeError):
+        SplitOnly()
+
+
+def test_long_mixed_script_sentence_chunks_stay_within_token_bound():
+    # 没有句子边界的中英文混排长句：中文每个字符一个 token，英文每个词一个 token
+    sentence = "配置中心的服务发现机制" * 100 + " " + " ".join(["deployment"] * 600) + " 结尾说明" * 50
+    splitter = SentenceTextSplitter(chunk_size=200, chunk_overlap=32)
+    spans = list(splitter.iter_spans(sentence))
+    assert len(spans) > 1
+    assert spans[0].start == 0 and spans[-1].end == len(sentence)
+    for previous, span in zip(spans, spans[1:]):
+        # 相邻片段相接或重叠，重叠部分不超过 chunk_overlap
+        assert previous.start < span.start <= previous.end
+        assert approximate_token_counts([sentence[span.start:previous.end]])[0] <= 32
+    counts = approximate_token_counts([sentence[span.start:span.end] for span in spans])
+    assert max(counts) <= 200
+    # 窗口按实际 token 数填充，而不是按整句的平均比例估算
+    assert min(counts[:-1]) > 150
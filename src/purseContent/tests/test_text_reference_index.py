@@ -0,0 +1,82 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.documentRepository.database_models import Base, DocumentDB, DocumentEdge
+from src.relationshipExtractor.dependency_builder import DependencyBuilder
+from src.relationshipExtractor.text_reference_index import AhoCorasickAutomaton, TextReferenceIndex
+
+TARGET_ID = "local:5d41402abc4b2a76b9719d911017c592"
+
+
+def _index_with_corpus():
+    index = TextReferenceIndex()
+    index.add_document(TARGET_ID, "部署指南 Deployment Guide", "如何部署服务。")
+    index.add_document("local:0cc175b9c0f1b6a831c399e269772661", "Other", f"详见 {TARGET_ID} 中的步骤。")
+    index.add_document("local:92eb5ffee6ae2fec3ad71c777531578f", "Release Notes", "参考 部署指南 Deployment Guide。")
+    for number in range(20):
+        index.add_document(f"local:{number:032x}", f"Unrelated {number}", f"文档 {number} 的正文，与其他文档无关。")
+    return index
+
+
+def test_automaton_finds_overlapping_patterns():
+    automaton = AhoCorasickAutomaton()
+    automaton.add("he", "a")
+    automaton.add("she", "b")
+    automaton.add("hers", "c")
+    assert automaton.find_all("ushers") == {"he": {"a"}, "she": {"b"}, "hers": {"c"}}
+    automaton.discard("she", "b")
+    assert automaton.find_all("ushers") == {"he": {"a"}, "hers": {"c"}}
+
+
+def test_candidate_ids_for_generated_id_is_a_subset():
+    index = _index_with_corpus()
+    assert TextReferenceIndex._candidate_tokens(TARGET_ID)
+    candidates = index.candidate_ids(TARGET_ID)
+    assert "local:0cc175b9c0f1b6a831c399e269772661" in candidates
+    assert len(candidates) < len(index)
+
+
+def test_candidate_ids_for_title_is_a_subset():
+    index = _index_with_corpus()
+    candidates = index.candidate_ids("部署指南 Deployment Guide")
+    assert "local:92eb5ffee6ae2fec3ad71c777531578f" in candidates
+    assert len(candidates) < len(index)
+
+
+def test_candidate_ids_match_id_inside_longer_words():
+    index = TextReferenceIndex()
+    index.add_document("source", None, f"xx{TARGET_ID}yy")
+    index.add_document("other", None, "nothing here")
+    assert index.candidate_ids(TARGET_ID) == {"source"}
+
+
+def test_find_mentions_reports_ids_and_titles():
+    index = _index_with_corpus()
+    mentions = index.find_mentions(f"见 {TARGET_ID} 以及 部署指南 Deployment Guide")
+    assert mentions == [(TARGET_ID, "mention_id"), (TARGET_ID, "mention_title")]
+
+
+def test_rebuilding_a_document_drops_stale_text_edges(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'references.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        session.add_all([
+            DocumentDB(id="target", title="Deployment Guide", cleaned_text="how to deploy"),
+            DocumentDB(id="source", title="Runbook", cleaned_text="follow the Deployment Guide first"),
+        ])
+        session.commit()
+
+        builder = DependencyBuilder(session)
+        builder.build_dependencies_for_document("source")
+        edges = session.query(DocumentEdge.source_id, DocumentEdge.target_id, DocumentEdge.relation_type).all()
+        assert edges == [("source", "target", "mention_title")]
+
+        source = session.get(DocumentDB, "source")
+        source.cleaned_text = "no references any more"
+        session.commit()
+        builder.build_dependencies_for_document("source")
+        assert session.query(DocumentEdge).count() == 0
+    finally:
+        session.close()
+        engine.dispose()
@@ -3,10 +3,14 @@
 import re # 导入正则表达式模块
 from sqlalchemy.orm import Session
 # 导入正确的 SQLAlchemy 模型 DocumentDB
-from ..documentRepository.database_models import DocumentDependency, DocumentDB
+from ..documentRepository.database_models import DocumentDB
+from ..documentRepository.dependency_storage import DependencyStorage
+from .text_reference_index import MIN_TITLE_LENGTH, get_text_reference_index
 from sqlalchemy import or_ # 导入 or_ 用于构建 OR 条件
 from sqlalchemy import text # 导入 text 用于执行原生 SQL 或构建文本表达式
-from sqlalchemy.exc import IntegrityError # 导入 IntegrityError 处理唯一约束冲突
+
+# 由正文引用构建器写入的边类型，重新构建文档的依赖时只替换这些类型的出边
+TEXT_RELATION_TYPES = ('link_confluence', 'mention_id', 'mention_title')
 
 class DependencyBuilder:
     def __init__(self, db_session: Session):
@@ -42,13 +46,14 @@ class DependencyBuilder:
         # 步骤 4: 匹配潜在引用到数据库中的已有文档
         # 显式将 document.id 转换为 str 类型以满足类型检查器
         outgoing_dependencies = self._match_references_to_documents(str(document.id), outgoing_references)
+        # 正文中提及的其他文档标题和 ID 通过自动机一次扫描全部找出
+        outgoing_dependencies += self._identify_text_mentions(document)
 
         # 步骤 5: 执行“反向检查”：识别已有文档指向 doc_id 的引用 (Incoming Dependencies)
         incoming_dependencies = self._identify_incoming_references(document)
 
-        # 步骤 6: 存储识别出的依赖关系
-        all_dependencies = outgoing_dependencies + incoming_dependencies
-        self._store_dependencies(all_dependencies)
+        # 步骤 6: 替换该文档的正文引用出边，写入入边
+        self._store_dependencies(str(document.id), outgoing_dependencies, incoming_dependencies)
 
         print(f"完成为文档 {doc_id} 构建依赖关系。")
 
@@ -114,18 +119,6 @@ class DependencyBuilder:
                  references.append((doc_id_match, 'mention_id'))
                  print(f"  - 发现文本ID: {doc_id_match}")
 
-            # 示例：简单的标题提及模式 (这部分比较复杂，先留作基础示例)
-            # 查找在引号或特定短语后的文本，这需要更复杂的NLP或更精确的模式
-            # 这里只是一个非常简化的占位符，实际应用中需要更智能的方法
-            # 例如，查找被双引号括起来的文本
-            title_pattern_simple = re.compile(r'"([^"]+)"')
-            found_titles = title_pattern_simple.findall(str(text))
-            for title_match in found_titles:
-                 # 简单的过滤，避免匹配到太短或看起来不像标题的文本
-                 if len(title_match) > 5 and ' ' in title_match:
-                     references.append((title_match, 'mention_title_potential'))
-                     print(f"  - 发现潜在标题提及: {title_match}")
-
         print(f"文档 {document.id} 共识别出 {len(references)} 个潜在引用。")
         return references
 
@@ -191,16 +184,6 @@ class DependencyBuilder:
                     print(f"  - 匹配ID提及: {ref_value} -> {target_document.id}")
 
 
-            elif ref_type == 'mention_title_potential':
-                # 匹配潜在的标题提及，尝试精确匹配 documents.title
-                # 注意：标题匹配容易出现歧义，这里只做精确匹配
-                # 使用 DocumentDB 的属性
-                target_document = query.filter(DocumentDB.title == ref_value).first()
-                if target_document:
-                    relation_type = 'mention_title'
-                    print(f"  - 匹配标题提及: {ref_value} -> {target_document.id}")
-                # TODO: 处理标题模糊匹配和歧义的情况
-
 
             # 如果找到匹配的文档且不是来源文档本身
             # 明确检查 relation_type 是否不是 None，以满足类型检查器
@@ -215,6 +198,24 @@ class DependencyBuilder:
         print(f"文档 {source_doc_id} 共匹配到 {len(dependencies)} 条出站依赖。")
         return dependencies
 
+    def _identify_text_mentions(self, document: DocumentDB) -> list:
+        """
+        用正文引用索引的自动机扫描一次正文，找出其中提及的所有其他文档 (标题或 ID)。
+
+        Args:
+            document: 待分析的 DocumentDB 对象。
+
+        Returns:
+            一个列表，包含依赖关系元组 (source_doc_id, target_doc_id, relation_type)。
+        """
+        source_doc_id = str(document.id)
+        dependencies = []
+        for target_doc_id, relation_type in get_text_reference_index(self.db_session).find_mentions(document.cleaned_text):
+            if target_doc_id != source_doc_id:
+                dependencies.append((source_doc_id, target_doc_id, relation_type))
+                print(f"  - 匹配正文提及 ({relation_type}): -> {target_doc_id}")
+        return dependencies
+
     def _identify_incoming_references(self, document: DocumentDB) -> list: # 修改参数类型提示为 DocumentDB
         """
         在已有文档中查找对当前文档的引用（反向检查）。
@@ -229,120 +230,66 @@ class DependencyBuilder:
         dependencies = []
 
         # 获取当前文档的 ID 和标题，用于在其他文档中搜索
-        target_doc_id = document.id
+        target_doc_id = str(document.id)
         target_doc_title = document.title
 
-        # 确定搜索关键词
-        search_terms = [target_doc_id]
-        if target_doc_title is not None and len(str(target_doc_title)) > 3: # 避免搜索过短或空的标题
-             search_terms.append(target_doc_title)
-
-        if not search_terms:
-             print(f"  - 文档 {target_doc_id} 没有可搜索的 ID 或标题，跳过反向检查。")
-             return dependencies
-
-        print(f"  - 搜索关键词: {search_terms}")
-
-        # 步骤 5a: 选择检查范围
-        # 基础版本：扫描所有文档（除了当前文档本身）
-        # TODO: 优化：限制检查范围，例如只检查最近更新的文档，或同源/同空间文档
-        # query = self.db_session.query(DocumentDB).filter(DocumentDB.id != target_doc_id).limit(1000) # 示例：限制1000条
-        # 使用 DocumentDB 模型进行查询
-        query = self.db_session.query(DocumentDB).filter(DocumentDB.id != target_doc_id) # 扫描所有文档
-
-        # 步骤 5b: 扫描已有文档内容，查找新文档的标识符
-        # 注意：直接在 cleaned_text 上使用 LIKE 或字符串查找对于大量数据效率很低
-        # 强烈建议使用全文搜索索引 (如 PostgreSQL 的 full-text search, Elasticsearch 等)
-        # 这里的实现是一个简单的文本包含检查示例
-
-        # 构建搜索条件 (使用 ORM 的 filter 或原生 SQL)
-        # ORM 示例 (可能效率不高):
-        # search_conditions = []
-        # for term in search_terms:
-        #     # 使用 ilike 进行不区分大小写的模糊匹配，使用 DocumentDB 的 cleaned_text 属性
-        #     search_conditions.append(DocumentDB.cleaned_text.ilike(f'%{term}%'))
-        # if search_conditions:
-        #     query = query.filter(or_(*search_conditions))
-
-        # 原生 SQL 示例 (可能更灵活，取决于数据库支持的全文搜索功能)
-        # 假设使用 PostgreSQL 的 plainto_tsquery 和 @@ 操作符
-        # search_query_text = " | ".join([f"'{term}'" for term in search_terms]) # 示例：'ID' | '标题'
-        # query = query.filter(
-        #     text("to_tsvector('english', cleaned_text) @@ plainto_tsquery('english', :search_terms)").bindparams(search_terms=" ".join(search_terms))
-        # )
-        # TODO: 根据实际数据库类型和是否使用全文搜索来选择或实现查询方式
-
-        # 简化实现：直接在 Python 中加载文本并查找 (非常低效，仅为演示概念)
-        # 实际应用中应避免这种方式，而是在数据库层面完成搜索
-        potential_referencing_docs = query.all()
-        print(f"  - 检查 {len(potential_referencing_docs)} 个已有文档...")
-
-        for doc_b in potential_referencing_docs:
-            if doc_b.cleaned_text is not None:
-                found_reference = False
-                relation_type = None
-
-                # 检查是否包含目标文档的 ID
-                if target_doc_id in doc_b.cleaned_text:
-                    dependencies.append((doc_b.id, target_doc_id, 'referenced_by_id'))
-                    print(f"    - 文档 {doc_b.id} 引用了 ID {target_doc_id}")
-                    found_reference = True
-
-                # 检查是否包含目标文档的标题 (如果标题存在且未通过 ID 找到)
-                # 避免重复添加依赖，如果已经通过ID找到，就不再通过标题添加同源依赖
-                if target_doc_title is not None and target_doc_title in doc_b.cleaned_text and not found_reference:
-                     dependencies.append((doc_b.id, target_doc_id, 'referenced_by_title'))
-                     print(f"    - 文档 {doc_b.id} 引用了标题 '{target_doc_title}'")
-                     found_reference = True
-
-                # TODO: 可以添加更复杂的匹配逻辑，例如正则表达式，或者查找特定格式的引用
-
+        # 确定搜索关键词，与正文引用索引的自动机模式保持一致
+        search_terms = [(target_doc_id, 'mention_id')]
+        if target_doc_title is not None and len(str(target_doc_title)) >= MIN_TITLE_LENGTH: # 避免搜索过短或空的标题
+            search_terms.append((str(target_doc_title), 'mention_title'))
+
+        print(f"  - 搜索关键词: {[term for term, _ in search_terms]}")
+
+        # 步骤 5a: 通过正文词元倒排表找出可能包含 ID 或标题的候选文档，避免扫描整张表
+        text_index = get_text_reference_index(self.db_session)
+        candidate_ids = set()
+        for term, _ in search_terms:
+            candidate_ids |= text_index.candidate_ids(term)
+        candidate_ids.discard(target_doc_id)
+
+        # 步骤 5b: 只加载候选文档的正文，精确确认引用
+        candidate_ids = list(candidate_ids)
+        print(f"  - 检查 {len(candidate_ids)} 个候选文档...")
+        for start in range(0, len(candidate_ids), 500):
+            for doc_b in (
+                self.db_session.query(DocumentDB.id, DocumentDB.cleaned_text)
+                .filter(DocumentDB.id.in_(candidate_ids[start:start + 500]))
+                .all()
+            ):
+                if doc_b.cleaned_text is None:
+                    continue
+                for term, relation_type in search_terms:
+                    if term in doc_b.cleaned_text:
+                        dependencies.append((doc_b.id, target_doc_id, relation_type))
+                        print(f"    - 文档 {doc_b.id} 提及了 '{term}' ({relation_type})")
 
         print(f"文档 {target_doc_id} 共识别出 {len(dependencies)} 条入站依赖。")
         return dependencies
 
-    def _store_dependencies(self, dependencies: list):
+    def _store_dependencies(self, doc_id: str, outgoing_dependencies: list, incoming_dependencies: list):
         """
-        将识别出的依赖关系存储到 document_dependencies 表。
+        在一个事务中存储识别出的依赖关系：用新识别出的出边替换 doc_id 原有的正文引用出边
+        (正文不再提及的文档对应的旧边被删除)，入边批量写入。
 
         Args:
-            dependencies: 识别出的依赖关系列表，格式为 (source_doc_id, target_doc_id, relation_type)。
+            doc_id: 本次构建的文档 ID。
+            outgoing_dependencies: doc_id 的出边，格式为 (source_doc_id, target_doc_id, relation_type)。
+            incoming_dependencies: 指向 doc_id 的入边，格式同上。
         """
-        print(f"存储识别出的 {len(dependencies)} 条依赖关系...")
-
-        new_dependency_objects = []
-        for source_id, target_id, relation_type in dependencies:
-            # 创建 DocumentDependency 对象
-            new_dependency = DocumentDependency(
-                source_document_id=source_id,
-                target_document_id=target_id,
-                relation_type=relation_type
-            )
-            new_dependency_objects.append(new_dependency)
-
-        if not new_dependency_objects:
-            print("  - 没有新的依赖关系需要存储。")
-            return
+        print(f"存储识别出的 {len(outgoing_dependencies) + len(incoming_dependencies)} 条依赖关系...")
 
         try:
-            # 批量添加对象到会话
-            self.db_session.add_all(new_dependency_objects)
-            # 提交会话，数据库的唯一约束会自动处理重复项，并抛出 IntegrityError
+            dependency_storage = DependencyStorage(self.db_session)
+            # 只替换正文引用类型的出边，元数据构建器写入的边保持不变
+            count = dependency_storage.replace_outgoing_edges(
+                [doc_id], outgoing_dependencies, relation_types=TEXT_RELATION_TYPES, commit=False
+            )
+            # 入边由其他文档的正文决定，这里只能找到提及 doc_id 的 ID 和标题，因此只写入不替换
+            count += dependency_storage.insert_edges(incoming_dependencies, commit=False)
             self.db_session.commit()
-            print(f"  - 成功存储 {len(new_dependency_objects)} 条依赖关系。")
-
-        except IntegrityError:
-            # 如果发生 IntegrityError，说明尝试插入了重复的依赖关系
-            # 在这里可以选择回滚并处理，或者使用数据库特定的 ON CONFLICT DO NOTHING
-            # 对于简单的批量插入，回滚是常见的处理方式，然后可以考虑逐条插入或使用更高级的批量操作
-            # 简单的处理：回滚并打印警告
-            self.db_session.rollback()
-            print("  - 存储依赖关系时发生唯一约束冲突，部分或全部依赖关系可能已存在。")
-            # TODO: 对于生产环境，考虑更优雅的重复处理方式，例如 ON CONFLICT DO NOTHING
-            # 或者在插入前先查询是否存在，但这会降低批量插入的效率。
-
+            print(f"  - 成功存储 {count} 条依赖关系。")
         except Exception as e:
-            # 处理其他可能的数据库错误
+            # 处理可能的数据库错误
             self.db_session.rollback()
             print(f"  - 存储依赖关系时发生错误: {e}")
             raise # 重新抛出异常以便上层调用者处理
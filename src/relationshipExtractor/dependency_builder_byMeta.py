@@ -1,14 +1,15 @@
 # dependency_builder_byMeta.py
 
-import re
 from sqlalchemy.orm import Session
-from ..documentRepository.database_models import DocumentDependency, DocumentDB
-from sqlalchemy import or_
-from sqlalchemy.exc import IntegrityError
-import json
-from datetime import datetime
-from typing import List, Dict
-from collections import defaultdict
+from ..documentRepository.database_models import DocumentDB
+from ..documentRepository.document_storage import DocumentStorage
+from ..documentRepository.dependency_storage import DependencyStorage
+from .meta_reference_index import MetaReferenceIndex, extract_meta_references, get_meta_reference_index, normalize_term
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+# 由元数据构建器写入的边类型，重建时只替换这些类型的边
+META_RELATION_TYPES = ('reference', 'meta_keyword', 'meta_legacy')
 
 class DependencyBuilderByMeta:
     def __init__(self, db_session: Session):
@@ -24,10 +25,54 @@ class DependencyBuilderByMeta:
         """
         为所有文档构建并存储依赖关系。
         """
-        print("====================开始为所有文档根据元数据构建依赖关系...====================")
-        all_documents = self.db_session.query(DocumentDB).all()
-        for document in all_documents:
-            self.build_dependencies_for_document(document)
+        # 逐个文档构建会为每个文档单独查询和提交，改为单次遍历的全量重建
+        return self.rebuild_all_dependencies()
+
+    def rebuild_all_dependencies(self, progress_every: int = 1000) -> int:
+        """
+        全量重建所有文档的元数据依赖 (单次遍历)。
+
+        1. 一次流式读取所有文档的标题、source_identifier 和元数据，同时构建一个新的元数据引用索引；
+        2. 在内存中计算全部出边，每个不同的关键词只查找一次；
+        3. 在一个事务中删除旧的元数据边并批量写入新边。
+
+        Args:
+            progress_every: 每处理多少个文档打印一次进度。
+
+        Returns:
+            写入的边数量。
+        """
+        print("====================开始全量重建元数据依赖关系...====================")
+        started = time.perf_counter()
+
+        # 1. 加载引用元数据 (只读取一次)，索引基于同一份快照构建
+        reference_index = MetaReferenceIndex()
+        documents: List[Tuple[str, dict]] = []
+        for row in DocumentStorage(self.db_session).iter_documents(
+            DocumentDB.title, DocumentDB.source_identifier, DocumentDB.document_metadata
+        ):
+            reference_index.add_document(row.id, row.title, row.source_identifier, row.document_metadata)
+            references = extract_meta_references(row.document_metadata)
+            if any(references.values()):
+                documents.append((row.id, references))
+        loaded = time.perf_counter()
+        print(f"已加载 {len(reference_index)} 个文档的元数据 ({len(documents)} 个包含引用)，耗时 {loaded - started:.2f}s。")
+
+        # 2. 在内存中计算全部出边
+        edges = []
+        keyword_cache: Dict[str, Tuple[Set[str], Set[str]]] = {}
+        for position, (document_id, references) in enumerate(documents, start=1):
+            edges.extend(self._collect_meta_dependencies(document_id, references, reference_index, keyword_cache))
+            if position % progress_every == 0:
+                print(f"  - 已匹配 {position}/{len(documents)} 个文档，累计 {len(edges)} 条边...")
+        matched = time.perf_counter()
+        print(f"匹配完成，共 {len(edges)} 条边 ({len(keyword_cache)} 个不同关键词)，耗时 {matched - loaded:.2f}s。")
+
+        # 3. 单个事务中整体替换
+        count = DependencyStorage(self.db_session).replace_all_edges(edges, relation_types=META_RELATION_TYPES)
+        finished = time.perf_counter()
+        print(f"已写入 {count} 条元数据依赖边，耗时 {finished - matched:.2f}s；全量重建总耗时 {finished - started:.2f}s。")
+        return count
 
     def build_dependencies_for_document_byId(self, doc_id: str):
         document = self._load_document(doc_id)
@@ -38,30 +83,41 @@ class DependencyBuilderByMeta:
 
     def build_dependencies_for_document(self, document: DocumentDB):
         """
-        根据文档的元数据为指定文档构建并存储依赖关系。
+        根据文档的元数据增量维护与该文档相关的依赖关系：
+        重新计算它的出边，以及因它的标题、关键词和 URL 而受影响的入边，其他文档之间的边保持不变。
 
         Args:
-            doc_id: 待分析文档的 ID。
+            document: 待分析的文档 (需要 id、title、source_identifier 和 document_metadata)。
         """
         print(f"====================开始为文档 {document.id} 根据元数据构建依赖关系...====================")
         print(f"成功加载文档: {document.title} (ID: {document.id})")
+        doc_id = str(document.id)
 
         # 1. 从文档元数据中提取引用信息
         meta_references = self._extract_references_from_metadata(document)
 
         # 2. 匹配出站引用到数据库中的已有文档
-        outgoing_dependencies = self._match_meta_references_to_documents(str(document.id), meta_references)
+        outgoing_dependencies = self._match_meta_references_to_documents(doc_id, meta_references)
 
-        # 3. 执行“反向检查”：识别已有文档指向 doc_id 的引用 (Incoming Dependencies)
-        #    这部分可能需要更复杂的逻辑，例如基于关键词的匹配
-        # incoming_dependencies = self._identify_incoming_references_by_meta(document)
+        # 3. 执行“反向检查”：通过元数据引用索引找到引用 doc_id 的已有文档 (Incoming Dependencies)
+        incoming_dependencies = self._identify_incoming_references_by_meta(document)
 
-        # 4. 存储识别出的依赖关系
-        # all_dependencies = outgoing_dependencies + incoming_dependencies
-        all_dependencies = outgoing_dependencies
-        self._store_dependencies(all_dependencies)
+        # 4. 在一个事务中替换该文档的元数据出边和入边
+        try:
+            dependency_storage = DependencyStorage(self.db_session)
+            dependency_storage.replace_outgoing_edges(
+                [doc_id], outgoing_dependencies, relation_types=META_RELATION_TYPES, commit=False
+            )
+            dependency_storage.replace_incoming_edges(
+                [doc_id], incoming_dependencies, relation_types=META_RELATION_TYPES, commit=False
+            )
+            self.db_session.commit()
+        except Exception as e:
+            self.db_session.rollback()
+            print(f"Error storing dependencies: {e}")
+            raise
 
-        print(f"完成为文档 {document.id} 根据元数据构建依赖关系。")
+        print(f"完成为文档 {document.id} 根据元数据构建依赖关系 (出边 {len(outgoing_dependencies)} 条，入边 {len(incoming_dependencies)} 条)。")
 
     def _load_document(self, doc_id: str) -> DocumentDB | None:
         """
@@ -74,172 +130,87 @@ class DependencyBuilderByMeta:
         """
         从文档的 document_metadata 中提取 reference 信息。
         """
-        references = {
-            'keywords': [],
-            'urls': [],
-            'citations': []
-        }
-        if document.document_metadata is not None and isinstance(document.document_metadata, dict):
-            meta_data = document.document_metadata.get('reference', {})
-            if isinstance(meta_data, dict):
-                references['keywords'] = meta_data.get('keywords', [])
-                references['urls'] = meta_data.get('urls', [])
-                references['citations'] = meta_data.get('citations', [])
+        references = extract_meta_references(document.document_metadata)
         print(f"  - 从元数据中提取到引用: {references}")
         return references
 
     def _match_meta_references_to_documents(self, source_doc_id: str, meta_references: dict) -> list:
         """
         将从元数据中提取的引用匹配到数据库中的已有文档。
+        匹配全部通过内存中的元数据引用索引完成，不访问数据库。
         """
         print(f"匹配文档 {source_doc_id} 的元数据引用到已有文档...")
+        dependencies = self._collect_meta_dependencies(
+            source_doc_id, meta_references, get_meta_reference_index(self.db_session)
+        )
+        for _, target_id, relation_type in dependencies:
+            print(f"  - 匹配元数据引用 ({relation_type}): -> {target_id}")
+        print(f"文档 {source_doc_id} 共匹配到 {len(dependencies)} 条出站元数据依赖。")
+        return dependencies
+
+    @staticmethod
+    def _collect_meta_dependencies(source_doc_id: str, meta_references: dict, reference_index: MetaReferenceIndex,
+                                   keyword_cache: Optional[Dict[str, Tuple[Set[str], Set[str]]]] = None) -> list:
+        """
+        用元数据引用索引将引用匹配为 (source_id, target_id, relation_type) 列表。
+
+        Args:
+            source_doc_id: 引用方文档 ID。
+            meta_references: _extract_references_from_metadata 的结果。
+            reference_index: 元数据引用索引。
+            keyword_cache: 关键词 -> 目标文档 ID 的缓存，全量重建时在文档之间共享，每个不同的关键词只查找一次。
+        """
         dependencies = []
-        query = self.db_session.query(DocumentDB)
 
-        # 匹配 URLs
+        # 匹配 URLs (source_identifier 精确匹配)
+        # TODO: 添加其他 URL 类型的匹配逻辑 (例如从 URL 中解析 Confluence pageId)
         for url in meta_references.get('urls', []):
-            # 这里想找出URL中的pageId 来在数据库中匹配
-            # confluence_page_id_match = re.search(r'pageId=(\d+)', url)
-            # if confluence_page_id_match:
-            #     confluence_id = confluence_page_id_match.group(1)
-            #     target_document = query.filter(
-            #         DocumentDB.source_type == 'confluence',
-            #         DocumentDB.source_identifier == confluence_id
-            #     ).first()
-            #     if target_document and target_document.id != source_doc_id:
-            #         dependencies.append((source_doc_id, target_document.id, 'meta_link_confluence'))
-            #         print(f"  - 匹配元数据链接(Confluence ID): {url} -> {target_document.id}")
-            # TODO: 添加其他 URL 类型的匹配逻辑
-            target_document = query.filter(
-                    DocumentDB.source_identifier == url
-            ).first()
-            if target_document is not None and bool(target_document.id != source_doc_id):
-                dependencies.append((source_doc_id, target_document.id, 'reference'))
-                print(f"  - 匹配元数据链接(Confluence ID): {url} -> {target_document.id}")
-
-        # 匹配 Citations (假设 citations 可能是文档标题或 ID)
+            for target_id in reference_index.ids_by_source_identifier(url):
+                dependencies.append((source_doc_id, target_id, 'reference'))
+
+        # 匹配 Citations (文档标题)
         for citation in meta_references.get('citations', []):
-            # # 尝试匹配文档 ID
-            # target_document_by_id = query.filter(DocumentDB.id == citation).first()
-            # if target_document_by_id and target_document_by_id.id != source_doc_id:
-            #     dependencies.append((source_doc_id, target_document_by_id.id, 'meta_citation_id'))
-            #     print(f"  - 匹配元数据引用(ID): {citation} -> {target_document_by_id.id}")
-            #     continue
-            # 尝试匹配文档标题
-            target_document_by_title = query.filter(DocumentDB.title == citation).first()
-            if target_document_by_title is not None and bool(target_document_by_title.id != source_doc_id):
-                dependencies.append((source_doc_id, target_document_by_title.id, 'reference'))
-                print(f"  - 匹配元数据引用(标题): {citation} -> {target_document_by_title.id}")
+            for target_id in reference_index.ids_by_title(citation):
+                dependencies.append((source_doc_id, target_id, 'reference'))
 
+        # 关键词匹配标题 (子串) 和其他文档的元数据关键词，两种匹配各算一次权重
         for keyword in meta_references.get('keywords', []):
-        # 使用 like 进行模糊匹配，并获取所有匹配的文档
-            target_documents_by_titles = query.filter(DocumentDB.title.like(f'%{keyword}%')).all()
-            for target_document_by_title in target_documents_by_titles:
-                if target_document_by_title is not None and bool(target_document_by_title.id != source_doc_id):
-                    dependencies.append((source_doc_id, target_document_by_title.id, 'meta_keyword'))
-                    print(f"  - 在标题匹配元数据关键词: {keyword} -> {target_document_by_title.id}")
-
-            target_documents_by_keywords = query.filter(DocumentDB.document_metadata.like(f'%{keyword}%')).all()
-            for target_documents_by_keyword in target_documents_by_keywords:
-                if target_documents_by_keyword is not None and bool(target_documents_by_keyword.id != source_doc_id):
-                    dependencies.append((source_doc_id, target_documents_by_keyword.id, 'meta_keyword'))
-                    print(f"  - 匹配元数据关键词: {keyword} -> {target_documents_by_keyword.id}")
+            key = normalize_term(keyword)
+            if keyword_cache is not None and key in keyword_cache:
+                matches = keyword_cache[key]
+            else:
+                matches = (reference_index.ids_by_title_substring(key), reference_index.ids_by_keyword(key))
+                if keyword_cache is not None:
+                    keyword_cache[key] = matches
+            for target_ids in matches:
+                for target_id in target_ids:
+                    dependencies.append((source_doc_id, target_id, 'meta_keyword'))
 
-        print(f"文档 {source_doc_id} 共匹配到 {len(dependencies)} 条出站元数据依赖。")
-        return dependencies
+        return [dependency for dependency in dependencies if dependency[1] != source_doc_id]
 
     def _identify_incoming_references_by_meta(self, document: DocumentDB) -> list:
         """
-        在已有文档中查找对当前文档的引用（反向检查），主要基于关键词匹配。
+        在已有文档中查找对当前文档的引用（反向检查）。
+
+        先用元数据引用索引找出 urls / citations / keywords 可能指向当前文档的候选文档，
+        再对每个候选按出边相同的规则重新匹配并只保留指向当前文档的边，保证与全量重建的结果一致。
         """
-        print(f"执行反向检查，查找引用文档 {document.id} 的已有文档 (基于元数据关键词)...")
-        dependencies = []
-        target_doc_id = document.id
-        target_doc_title = document.title
+        print(f"执行反向检查，查找引用文档 {document.id} 的已有文档 (基于元数据引用索引)...")
+        target_doc_id = str(document.id)
+        reference_index = get_meta_reference_index(self.db_session)
         target_keywords = self._extract_references_from_metadata(document).get('keywords', [])
 
-        if not target_keywords and not bool(target_doc_title):
-            print(f"  - 文档 {target_doc_id} 没有可搜索的关键词或标题，跳过反向检查。")
-            return dependencies
-
-        print(f"  - 搜索关键词: {target_keywords}, 目标标题: {target_doc_title}")
-
-        # 扫描所有文档（除了当前文档本身）
-        potential_referencing_docs = self.db_session.query(DocumentDB).filter(DocumentDB.id != target_doc_id).all()
-        print(f"  - 检查 {len(potential_referencing_docs)} 个已有文档...")
-
-        for doc_b in potential_referencing_docs:
-            if doc_b.document_metadata is not None and isinstance(doc_b.document_metadata, dict):
-                doc_b_meta_data = doc_b.document_metadata.get('reference', {})
-                doc_b_keywords = doc_b_meta_data.get('keywords', [])
-                doc_b_urls = doc_b_meta_data.get('urls', [])
-                doc_b_citations = doc_b_meta_data.get('citations', [])
-
-                found_reference = False
-
-                # 检查 doc_b 的元数据中是否包含目标文档的 ID 或标题
-                if target_doc_id in doc_b_citations:
-                    dependencies.append((doc_b.id, target_doc_id, 'meta_referenced_by_citation_id'))
-                    print(f"    - 文档 {doc_b.id} 的引用中包含目标 ID {target_doc_id}")
-                    found_reference = True
-                elif target_doc_title is not None and target_doc_title in doc_b_citations:
-                    dependencies.append((doc_b.id, target_doc_id, 'meta_referenced_by_citation_title'))
-                    print(f"    - 文档 {doc_b.id} 的引用中包含目标标题 '{target_doc_title}'")
-                    found_reference = True
-
-                # 检查 doc_b 的元数据中是否包含目标文档的 URL
-                for url in doc_b_urls:
-                    confluence_page_id_match = re.search(r'pageId=(\d+)', url)
-                    if confluence_page_id_match and confluence_page_id_match.group(1) == target_doc_id:
-                        dependencies.append((doc_b.id, target_doc_id, 'meta_referenced_by_url'))
-                        print(f"    - 文档 {doc_b.id} 的 URL 中包含目标 ID {target_doc_id}")
-                        found_reference = True
-                        break
-
-                # 检查 doc_b 的关键词是否与目标文档的关键词有重叠
-                # 这是一个更宽松的匹配，可能需要根据实际需求调整阈值
-                if target_keywords and doc_b_keywords:
-                    common_keywords = set(target_keywords).intersection(set(doc_b_keywords))
-                    if common_keywords:
-                        # 避免重复添加，如果已经通过其他方式找到引用，则不再添加关键词引用
-                        if not found_reference:
-                            dependencies.append((doc_b.id, target_doc_id, 'meta_referenced_by_keyword_overlap'))
-                            print(f"    - 文档 {doc_b.id} 与目标文档 {target_doc_id} 有关键词重叠: {common_keywords}")
-                            found_reference = True
+        candidates = reference_index.referencing_ids(document.title, document.source_identifier, target_keywords)
+        candidates.discard(target_doc_id)
+        print(f"  - 检查 {len(candidates)} 个候选文档...")
+
+        dependencies = []
+        for source_doc_id in candidates:
+            for dependency in self._collect_meta_dependencies(
+                source_doc_id, reference_index.references(source_doc_id), reference_index
+            ):
+                if dependency[1] == target_doc_id:
+                    dependencies.append(dependency)
 
         print(f"文档 {target_doc_id} 共识别出 {len(dependencies)} 条入站元数据依赖。")
         return dependencies
-
-    def _store_dependencies(self, dependencies: List[Dict]):
-        # 按 source_id 分组依赖关系
-        grouped_dependencies = defaultdict(list)
-        for source_id, target_id, relation_type in dependencies:
-            if target_id and source_id != target_id:
-                grouped_dependencies[source_id].append(target_id)
-
-        for source_id, target_ids in grouped_dependencies.items():
-            # 将 target_ids 列表转换为 JSON 字符串
-            target_ids_json = json.dumps(list(set(target_ids))) # 使用 set 去重
-
-            # 尝试查找现有依赖关系
-            existing_dependency = self.db_session.query(DocumentDependency).filter_by(
-                source_document_id=source_id
-            ).first()
-
-            if existing_dependency:
-                # 如果存在，则更新 target_document_ids
-                existing_dependency.target_document_ids = target_ids_json # type: ignore
-                existing_dependency.updated_at = datetime.utcnow() # type: ignore
-            else:
-                # 如果不存在，则创建新的依赖关系
-                new_dependency = DocumentDependency(
-                    source_document_id=source_id,
-                    target_document_ids=target_ids_json # type: ignore
-                )
-                self.db_session.add(new_dependency)
-        try:
-            self.db_session.commit()
-        except Exception as e:
-            self.db_session.rollback()
-            print(f"Error storing dependencies: {e}")
-            raise
\ No newline at end of file
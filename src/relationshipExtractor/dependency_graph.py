@@ -0,0 +1,350 @@
+# dependency_graph.py
+# 进程内依赖图：以整数编号的文档为节点，正反两个方向的 CSR 邻接数组，支持多跳邻居、反向依赖闭包和最短路径查询
+
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from ..documentRepository.dependency_storage import DependencyStorage, register_edge_listener
+
+# 查询方向：out = 该文档依赖的文档，in = 依赖该文档的文档，both = 两者
+DIRECTIONS = ("out", "in", "both")
+
+# 邻接表: (邻居编号数组, 权重数组)
+Adjacency = Tuple[np.ndarray, np.ndarray]
+
+class DependencyGraph:
+    """
+    依赖图引擎。
+
+    - 节点是出现在 document_edges 中的文档，文档 ID 映射为连续的整数编号；
+    - 邻接关系保存为正向 (出边) 和反向 (入边) 两组 CSR 数组 (indptr / indices / weights)，
+      同一对文档之间不同类型的边合并为一条，权重累加；
+    - 边的增量变更 (DependencyStorage 提交后通知) 先记录为待刷新的文档，在下一次查询前从数据库重新加载这些文档的边，
+      以逐节点覆盖的方式叠加在 CSR 之上，覆盖的节点过多时再整体压缩回 CSR。
+    """
+
+    def __init__(self, bind, compact_threshold: int = 1000):
+        """
+        Args:
+            bind: 数据库引擎，用于加载和刷新边 (图自己创建会话，不依赖调用方的会话)。
+            compact_threshold: 覆盖的节点数超过该值 (或超过节点总数的 10%) 时重建 CSR。
+        """
+        self._bind = bind
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._numbers: Dict[str, int] = {}
+        self._csr: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._overrides: Dict[str, Dict[int, Adjacency]] = {"out": {}, "in": {}}
+        self._pending_sources: Set[str] = set()
+        self._pending_targets: Set[str] = set()
+        self._reload_all = True
+
+    @property
+    def node_count(self) -> int:
+        return len(self._ids)
+
+    @property
+    def edge_count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return sum(len(self._neighbors(node, "out")[0]) for node in range(self.node_count))
+
+    # ---------------- 加载与增量更新 ----------------
+
+    def load(self):
+        """从 document_edges 表完整加载依赖图"""
+        started = time.perf_counter()
+        with self._lock:
+            self._ids = []
+            self._numbers = {}
+            sources: List[int] = []
+            targets: List[int] = []
+            weights: List[float] = []
+            with Session(bind=self._bind) as db:
+                for source_id, target_id, _, weight in DependencyStorage(db).iter_edges():
+                    sources.append(self._number(source_id))
+                    targets.append(self._number(target_id))
+                    weights.append(weight or 1.0)
+            self._build_csr(
+                np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64),
+                np.asarray(weights, dtype=np.float64)
+            )
+            self._pending_sources.clear()
+            self._pending_targets.clear()
+            self._reload_all = False
+        print(f"Dependency graph loaded: {self.node_count} nodes, {len(sources)} edges in {time.perf_counter() - started:.2f}s.")
+
+    def on_edges_changed(self, source_ids: Set[str], target_ids: Set[str], all_edges: bool):
+        """DependencyStorage 监听器接口：只记录变更，下一次查询前再刷新"""
+        with self._lock:
+            if all_edges:
+                self._reload_all = True
+            self._pending_sources |= source_ids
+            self._pending_targets |= target_ids
+
+    def _refresh(self):
+        """应用待刷新的变更 (调用方需持有锁)"""
+        if self._reload_all:
+            self.load()
+            return
+        if not self._pending_sources and not self._pending_targets:
+            return
+        source_ids, self._pending_sources = self._pending_sources, set()
+        target_ids, self._pending_targets = self._pending_targets, set()
+        with Session(bind=self._bind) as db:
+            storage = DependencyStorage(db)
+            outgoing = storage.get_outgoing_edges(source_ids)
+            incoming = storage.get_incoming_edges(target_ids)
+        for node, adjacency in self._group(source_ids, outgoing, "out").items():
+            self._replace_adjacency(node, adjacency, "out")
+        for node, adjacency in self._group(target_ids, incoming, "in").items():
+            self._replace_adjacency(node, adjacency, "in")
+        if len(self._overrides["out"]) + len(self._overrides["in"]) > max(self.compact_threshold, self.node_count // 10):
+            self._compact()
+
+    def _group(self, document_ids: Iterable[str], edges: List[tuple], direction: str) -> Dict[int, Adjacency]:
+        """将重新加载的边按 (source 或 target) 节点分组并合并为邻接表"""
+        merged: Dict[int, Dict[int, float]] = {self._number(document_id): {} for document_id in document_ids}
+        for source_id, target_id, _, weight in edges:
+            node, neighbor = (source_id, target_id) if direction == "out" else (target_id, source_id)
+            neighbors = merged.setdefault(self._number(node), {})
+            neighbor_number = self._number(neighbor)
+            neighbors[neighbor_number] = neighbors.get(neighbor_number, 0.0) + (weight or 1.0)
+        return {
+            node: (np.fromiter(neighbors.keys(), dtype=np.int64, count=len(neighbors)),
+                   np.fromiter(neighbors.values(), dtype=np.float64, count=len(neighbors)))
+            for node, neighbors in merged.items()
+        }
+
+    def _replace_adjacency(self, node: int, adjacency: Adjacency, direction: str):
+        """替换一个节点某个方向的邻接表，并同步更新另一个方向上受影响节点的邻接表"""
+        opposite = "in" if direction == "out" else "out"
+        old_neighbors, _ = self._neighbors(node, direction)
+        new_neighbors, new_weights = adjacency
+        self._overrides[direction][node] = adjacency
+
+        new_weight_of = dict(zip(new_neighbors.tolist(), new_weights.tolist()))
+        for neighbor in set(old_neighbors.tolist()) | set(new_weight_of):
+            neighbors, weights = self._neighbors(neighbor, opposite)
+            keep = neighbors != node
+            neighbors, weights = neighbors[keep], weights[keep]
+            if neighbor in new_weight_of:
+                neighbors = np.append(neighbors, node)
+                weights = np.append(weights, new_weight_of[neighbor])
+            self._overrides[opposite][neighbor] = (neighbors, weights)
+
+    def _compact(self):
+        """把覆盖的邻接表合并回 CSR"""
+        sources, targets, weights = [], [], []
+        for node in range(self.node_count):
+            neighbors, node_weights = self._neighbors(node, "out")
+            sources.append(np.full(len(neighbors), node, dtype=np.int64))
+            targets.append(neighbors)
+            weights.append(node_weights)
+        self._build_csr(
+            np.concatenate(sources) if sources else np.empty(0, dtype=np.int64),
+            np.concatenate(targets) if targets else np.empty(0, dtype=np.int64),
+            np.concatenate(weights) if weights else np.empty(0, dtype=np.float64),
+        )
+
+    def _build_csr(self, sources: np.ndarray, targets: np.ndarray, weights: np.ndarray):
+        """由边数组构建正反两个方向的 CSR，重复的 (source, target) 合并"""
+        node_count = self.node_count
+        if len(sources):
+            # 合并同一对文档之间不同类型的边
+            keys = sources * max(node_count, 1) + targets
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            weights = np.bincount(inverse, weights=weights)
+            sources, targets = np.divmod(unique_keys, max(node_count, 1))
+        for direction, rows, cols in (("out", sources, targets), ("in", targets, sources)):
+            order = np.argsort(rows, kind="stable")
+            indptr = np.zeros(node_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=node_count), out=indptr[1:])
+            self._csr[direction] = (indptr, cols[order].astype(np.int64), weights[order].astype(np.float64))
+        self._overrides = {"out": {}, "in": {}}
+
+    def _number(self, document_id: str) -> int:
+        """文档 ID 对应的节点编号，新文档分配新编号"""
+        number = self._numbers.get(document_id)
+        if number is None:
+            number = len(self._ids)
+            self._ids.append(document_id)
+            self._numbers[document_id] = number
+        return number
+
+    # ---------------- 邻接访问 ----------------
+
+    def _neighbors(self, node: int, direction: str) -> Adjacency:
+        """节点某个方向的邻居和权重"""
+        override = self._overrides[direction].get(node)
+        if override is not None:
+            return override
+        indptr, indices, weights = self._csr[direction]
+        if node + 1 >= len(indptr):
+            # 上次构建 CSR 之后才出现的节点
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        start, end = indptr[node], indptr[node + 1]
+        return indices[start:end], weights[start:end]
+
+    def _expand(self, frontier: np.ndarray, direction: str) -> np.ndarray:
+        """一跳扩展：返回 frontier 中所有节点的邻居 (可能重复)；CSR 中的节点一次性向量化取出"""
+        directions = ("out", "in") if direction == "both" else (direction,)
+        parts = []
+        for current in directions:
+            indptr, indices, _ = self._csr[current]
+            overrides = self._overrides[current]
+            in_csr = frontier < len(indptr) - 1
+            if overrides:
+                in_csr &= np.fromiter((node not in overrides for node in frontier.tolist()), dtype=bool, count=len(frontier))
+                for node in frontier[~in_csr].tolist():
+                    parts.append(self._neighbors(node, current)[0])
+            nodes = frontier[in_csr]
+            starts, ends = indptr[nodes], indptr[nodes + 1]
+            lengths = ends - starts
+            total = int(lengths.sum())
+            if total:
+                # 把每个节点的 [start, end) 区间展开成一个下标数组
+                offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+                parts.append(indices[offsets + np.arange(total)])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    # ---------------- 查询 ----------------
+
+    def neighborhood(self, document_id: str, depth: int = 1, direction: str = "out",
+                     limit: Optional[int] = None) -> Dict[str, int]:
+        """
+        k 跳邻居。
+
+        Args:
+            document_id: 起点文档 ID。
+            depth: 最大跳数。
+            direction: out (依赖的文档) / in (依赖它的文档) / both。
+            limit: 最多返回的文档数量 (按距离由近到远)。
+
+        Returns:
+            {document_id: 距离}，不包含起点本身。
+        """
+        self._check_direction(direction)
+        with self._lock:
+            self._refresh()
+            start = self._numbers.get(document_id)
+            if start is None:
+                return {}
+            distances = self._bfs(start, direction, depth)
+            result: Dict[str, int] = {}
+            for node, distance in sorted(distances.items(), key=lambda item: (item[1], self._ids[item[0]])):
+                if node == start:
+                    continue
+                result[self._ids[node]] = distance
+                if limit is not None and len(result) >= limit:
+                    break
+            return result
+
+    def reverse_closure(self, document_id: str, max_depth: Optional[int] = None) -> Dict[str, int]:
+        """
+        反向依赖闭包：直接或间接依赖该文档的所有文档 (影响分析)。
+
+        Returns:
+            {document_id: 距离}，不包含起点本身。
+        """
+        return self.neighborhood(document_id, depth=max_depth if max_depth is not None else -1, direction="in")
+
+    def shortest_path(self, source_id: str, target_id: str, direction: str = "out",
+                      max_depth: Optional[int] = None) -> Optional[List[str]]:
+        """
+        两个文档之间的最短路径 (按跳数)。
+
+        Returns:
+            路径上的文档 ID 列表 (包含两端)；不可达时为 None。
+        """
+        self._check_direction(direction)
+        with self._lock:
+            self._refresh()
+            source, target = self._numbers.get(source_id), self._numbers.get(target_id)
+            if source is None or target is None:
+                return [source_id] if source_id == target_id else None
+            if source == target:
+                return [source_id]
+            directions = ("out", "in") if direction == "both" else (direction,)
+            parents = {source: source}
+            frontier = [source]
+            depth = 0
+            while frontier and (max_depth is None or depth < max_depth):
+                depth += 1
+                next_frontier = []
+                for node in frontier:
+                    for current in directions:
+                        for neighbor in self._neighbors(node, current)[0].tolist():
+                            if neighbor in parents:
+                                continue
+                            parents[neighbor] = node
+                            if neighbor == target:
+                                path = [target]
+                                while path[-1] != source:
+                                    path.append(parents[path[-1]])
+                                return [self._ids[node] for node in reversed(path)]
+                            next_frontier.append(neighbor)
+                frontier = next_frontier
+            return None
+
+    def to_csr(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """
+        导出压缩后的正向 CSR (供 PageRank 等批处理使用)。
+
+        Returns:
+            (文档 ID 列表, indptr, indices, weights)
+        """
+        with self._lock:
+            self._refresh()
+            if self._overrides["out"] or self._overrides["in"] or len(self._csr["out"][0]) != self.node_count + 1:
+                self._compact()
+            indptr, indices, weights = self._csr["out"]
+            return list(self._ids), indptr, indices, weights
+
+    def _bfs(self, start: int, direction: str, depth: int) -> Dict[int, int]:
+        """按层扩展，depth < 0 表示不限层数"""
+        visited = np.zeros(self.node_count, dtype=bool)
+        visited[start] = True
+        distances = {start: 0}
+        frontier = np.array([start], dtype=np.int64)
+        level = 0
+        while len(frontier) and (depth < 0 or level < depth):
+            level += 1
+            neighbors = np.unique(self._expand(frontier, direction))
+            neighbors = neighbors[~visited[neighbors]]
+            visited[neighbors] = True
+            for node in neighbors.tolist():
+                distances[node] = level
+            frontier = neighbors
+        return distances
+
+    @staticmethod
+    def _check_direction(direction: str):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction '{direction}', expected one of {DIRECTIONS}.")
+
+
+# 每个数据库一个依赖图实例，键为数据库 URL
+_graphs: Dict[str, DependencyGraph] = {}
+_graphs_lock = threading.Lock()
+
+def get_dependency_graph(db_session: Session) -> DependencyGraph:
+    """获取 db_session 所在数据库的进程级依赖图，首次调用时加载并注册为依赖边变更监听器"""
+    bind = db_session.get_bind()
+    key = str(bind.url)
+    graph = _graphs.get(key)
+    if graph is None:
+        with _graphs_lock:
+            graph = _graphs.get(key)
+            if graph is None:
+                graph = DependencyGraph(bind)
+                # 先注册监听器再加载：加载期间提交的变更会在下一次查询前刷新
+                register_edge_listener(key, graph)
+                graph.load()
+                _graphs[key] = graph
+    return graph
@@ -0,0 +1,160 @@
+# graph_centrality.py
+# 依赖图中心性 (PageRank) 的离线批量计算，以及检索时使用的内存分数表
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from ..documentRepository.centrality_storage import CentralityStorage
+from ..documentRepository.database_models import DocumentDB
+from ..documentRepository.document_storage import DocumentStorage
+from .dependency_graph import get_dependency_graph
+
+# 全局 PageRank 的分数类型；按来源类型个性化的分数类型为 "pagerank:<source_type>"
+PAGERANK = "pagerank"
+
+def personalized_score_type(source_type: str) -> str:
+    """按来源类型个性化的 PageRank 分数类型"""
+    return f"{PAGERANK}:{source_type}"
+
+def pagerank(indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray, damping: float = 0.85,
+             personalization: Optional[np.ndarray] = None, tol: float = 1e-10, max_iter: int = 100) -> np.ndarray:
+    """
+    加权 PageRank，幂迭代的每一步都是对整条边数组的向量化运算 (bincount)。
+
+    Args:
+        indptr, indices, weights: 正向 (出边) CSR 邻接数组。
+        damping: 阻尼系数。
+        personalization: 随机跳转的分布 (长度为节点数，非负)；None 表示均匀分布。
+        tol: 收敛阈值 (按节点平均的 L1 变化量)。
+        max_iter: 最大迭代次数。
+
+    Returns:
+        每个节点的分数，总和为 1。
+    """
+    node_count = len(indptr) - 1
+    if node_count == 0:
+        return np.empty(0, dtype=np.float64)
+    sources = np.repeat(np.arange(node_count), np.diff(indptr))
+    out_weight = np.bincount(sources, weights=weights, minlength=node_count)
+    # 每条边转移的概率 = 边权重 / 源节点的出边权重和
+    transition = weights / out_weight[sources]
+    dangling = out_weight == 0
+
+    if personalization is None:
+        teleport = np.full(node_count, 1.0 / node_count)
+    else:
+        teleport = np.asarray(personalization, dtype=np.float64)
+        teleport = teleport / teleport.sum()
+
+    rank = teleport.copy()
+    for _ in range(max_iter):
+        # 沿出边传播；没有出边的节点的分数按随机跳转分布重新分配
+        spread = np.bincount(indices, weights=rank[sources] * transition, minlength=node_count)
+        new_rank = damping * (spread + rank[dangling].sum() * teleport) + (1.0 - damping) * teleport
+        delta = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if delta < tol * node_count:
+            break
+    return rank
+
+def compute_centrality(db_session: Session, personalize_by_source_type: bool = False,
+                       damping: float = 0.85) -> Dict[str, int]:
+    """
+    在依赖图上计算 PageRank 并整体替换 document_centrality 表中的分数。
+
+    Args:
+        db_session: 数据库会话。
+        personalize_by_source_type: 是否同时为每种来源类型计算个性化 PageRank (随机跳转只落在该类型的文档上)。
+        damping: 阻尼系数。
+
+    Returns:
+        {score_type: 写入的文档数}
+    """
+    print("====================开始计算依赖图中心性...====================")
+    started = time.perf_counter()
+    document_ids, indptr, indices, weights = get_dependency_graph(db_session).to_csr()
+    if not document_ids:
+        print("依赖图为空，跳过中心性计算。")
+        return {}
+
+    scores = {PAGERANK: pagerank(indptr, indices, weights, damping=damping)}
+    if personalize_by_source_type:
+        numbers = {document_id: number for number, document_id in enumerate(document_ids)}
+        source_types = np.empty(len(document_ids), dtype=object)
+        for row in DocumentStorage(db_session).iter_documents(DocumentDB.source_type):
+            number = numbers.get(row.id)
+            if number is not None:
+                source_types[number] = row.source_type
+        for source_type in sorted({value for value in source_types if value is not None}):
+            personalization = (source_types == source_type).astype(np.float64)
+            scores[personalized_score_type(source_type)] = pagerank(
+                indptr, indices, weights, damping=damping, personalization=personalization
+            )
+    computed = time.perf_counter()
+
+    # 图中可能残留已删除文档的编号 (没有任何边的节点)，只为仍然存在的文档写入分数
+    existing = set()
+    for start in range(0, len(document_ids), 500):
+        existing.update(row.id for row in db_session.query(DocumentDB.id).filter(
+            DocumentDB.id.in_(document_ids[start:start + 500])
+        ))
+    CentralityStorage(db_session).replace_scores({
+        score_type: [(document_id, score) for document_id, score in zip(document_ids, values.tolist())
+                     if document_id in existing]
+        for score_type, values in scores.items()
+    })
+    get_centrality_scores(db_session).reload(db_session)
+    print(f"完成中心性计算: {len(document_ids)} 个节点，{len(scores)} 种分数，"
+          f"计算耗时 {computed - started:.2f}s，总耗时 {time.perf_counter() - started:.2f}s。")
+    return {score_type: len(existing) for score_type in scores}
+
+class CentralityScores:
+    """
+    内存中的中心性分数表，检索排序时直接查字典，不做任何图计算。
+    分数按类型归一化到 [0, 1] (除以该类型的最大分数)。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scores: Dict[str, Dict[str, float]] = {}
+
+    def reload(self, db_session: Session):
+        """从 document_centrality 表重新加载全部分数"""
+        scores = CentralityStorage(db_session).load_scores()
+        normalized = {}
+        for score_type, values in scores.items():
+            max_score = max(values.values()) if values else 0.0
+            normalized[score_type] = {
+                document_id: (score / max_score if max_score > 0 else 0.0) for document_id, score in values.items()
+            }
+        with self._lock:
+            self._scores = normalized
+
+    def get(self, document_id: str, score_type: str = PAGERANK) -> float:
+        """文档的归一化分数，没有分数时为 0"""
+        return self._scores.get(score_type, {}).get(document_id, 0.0)
+
+    def score_types(self) -> List[str]:
+        return sorted(self._scores)
+
+
+# 每个数据库一个分数表实例，键为数据库 URL
+_scores: Dict[str, CentralityScores] = {}
+_scores_lock = threading.Lock()
+
+def get_centrality_scores(db_session: Session) -> CentralityScores:
+    """获取 db_session 所在数据库的进程级中心性分数表，首次调用时从数据库加载"""
+    key = str(db_session.get_bind().url)
+    scores = _scores.get(key)
+    if scores is None:
+        with _scores_lock:
+            scores = _scores.get(key)
+            if scores is None:
+                scores = CentralityScores()
+                scores.reload(db_session)
+                _scores[key] = scores
+    return scores
@@ -0,0 +1,241 @@
+# meta_reference_index.py
+# 元数据引用的内存倒排索引，供 DependencyBuilderByMeta 用字典查找代替逐条数据库查询
+
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..documentRepository.database_models import DocumentDB
+from ..documentRepository.document_storage import DocumentStorage, register_document_listener
+from .text_reference_index import AhoCorasickAutomaton
+
+# 标题子串查找使用的 n-gram 长度
+TITLE_GRAM_SIZE = 2
+
+def normalize_term(term: Any) -> str:
+    """关键词/标题的归一化形式：去掉首尾空白并忽略大小写"""
+    return str(term).strip().casefold()
+
+def extract_meta_references(metadata: Optional[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """从 document_metadata 中提取 reference 信息 (keywords / urls / citations)"""
+    references: Dict[str, List[str]] = {'keywords': [], 'urls': [], 'citations': []}
+    if isinstance(metadata, dict):
+        meta_data = metadata.get('reference', {})
+        if isinstance(meta_data, dict):
+            for key in references:
+                values = meta_data.get(key) or []
+                if isinstance(values, (list, tuple, set)):
+                    references[key] = [str(value) for value in values if value is not None and str(value).strip()]
+    return references
+
+def _title_grams(title: str) -> Set[str]:
+    """标题的字符 n-gram 集合 (标题短于 n 时为标题本身)"""
+    if len(title) <= TITLE_GRAM_SIZE:
+        return {title} if title else set()
+    return {title[i:i + TITLE_GRAM_SIZE] for i in range(len(title) - TITLE_GRAM_SIZE + 1)}
+
+class MetaReferenceIndex:
+    """
+    文档元数据的内存倒排索引：
+
+    - 关键词 -> 文档 ID (元数据 reference.keywords，忽略大小写)，另建一个关键词的 Aho-Corasick 自动机，
+      一次扫描标题即可找到其中出现的全部关键词
+    - 精确标题 -> 文档 ID (匹配 citations)
+    - source_identifier / URL -> 文档 ID (匹配 urls)
+    - 标题 n-gram -> 文档 ID (关键词在标题中的子串匹配，先取候选再校验)
+    - 反向：被引用的 URL / 标题 -> 引用方文档 ID (增量维护入边时查找受影响的文档)
+
+    一次流式遍历 documents 表构建，之后通过 DocumentStorage 的监听器随文档写入/删除增量更新。
+    所有读写都在锁内进行，可以在线程池中的多个请求之间共享。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Tuple[str, str, Set[str]]] = {} # id -> (归一化标题, source_identifier, 归一化关键词)
+        self._references: Dict[str, Dict[str, List[str]]] = {} # id -> 元数据中的原始引用
+        self._keyword_index: Dict[str, Set[str]] = defaultdict(set)
+        self._keyword_automaton = AhoCorasickAutomaton()
+        self._title_index: Dict[str, Set[str]] = defaultdict(set)
+        self._source_index: Dict[str, Set[str]] = defaultdict(set)
+        self._title_gram_index: Dict[str, Set[str]] = defaultdict(set)
+        self._url_refs: Dict[str, Set[str]] = defaultdict(set)
+        self._citation_refs: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def build(self, db_session: Session):
+        """清空索引并一次流式遍历 documents 表重建"""
+        print("Building meta reference index...")
+        with self._lock:
+            self._entries.clear()
+            self._keyword_index.clear()
+            self._keyword_automaton = AhoCorasickAutomaton()
+            self._title_index.clear()
+            self._source_index.clear()
+            self._title_gram_index.clear()
+            self._references.clear()
+            self._url_refs.clear()
+            self._citation_refs.clear()
+            for row in DocumentStorage(db_session).iter_documents(
+                DocumentDB.title, DocumentDB.source_identifier, DocumentDB.document_metadata
+            ):
+                self.add_document(row.id, row.title, row.source_identifier, row.document_metadata)
+        print(f"Meta reference index built with {len(self._entries)} documents.")
+
+    def update_documents(self, rows: Iterable[Dict[str, Any]]):
+        """用 documents 表的行 (dict) 更新索引条目"""
+        with self._lock:
+            for row in rows:
+                self.add_document(row['id'], row.get('title'), row.get('source_identifier'), row.get('document_metadata'))
+
+    def add_document(self, document_id: str, title: Optional[str], source_identifier: Optional[str],
+                     metadata: Optional[Dict[str, Any]]):
+        """写入或替换单个文档的索引条目"""
+        with self._lock:
+            self._remove(document_id)
+            self._add(document_id, title, source_identifier, metadata)
+
+    def remove_documents(self, document_ids: Iterable[str]):
+        """从索引中移除文档"""
+        with self._lock:
+            for document_id in document_ids:
+                self._remove(document_id)
+
+    def ids_by_source_identifier(self, source_identifier: str) -> Set[str]:
+        """source_identifier (URL、文件路径等) 精确匹配的文档 ID"""
+        with self._lock:
+            return set(self._source_index.get(str(source_identifier).strip(), ()))
+
+    def ids_by_title(self, title: str) -> Set[str]:
+        """标题精确匹配 (忽略大小写) 的文档 ID"""
+        with self._lock:
+            return set(self._title_index.get(normalize_term(title), ()))
+
+    def ids_by_keyword(self, keyword: str) -> Set[str]:
+        """元数据关键词中包含该关键词 (忽略大小写) 的文档 ID"""
+        with self._lock:
+            return set(self._keyword_index.get(normalize_term(keyword), ()))
+
+    def ids_by_title_substring(self, term: str) -> Set[str]:
+        """标题中包含 term (忽略大小写) 的文档 ID"""
+        term = normalize_term(term)
+        if not term:
+            return set()
+        with self._lock:
+            if len(term) < TITLE_GRAM_SIZE:
+                candidates: Iterable[str] = self._entries.keys()
+            else:
+                # 从最短的倒排列表开始求交集，得到候选后再校验真实子串
+                postings = sorted((self._title_gram_index.get(gram, set()) for gram in _title_grams(term)), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:]) if postings else set()
+            return {doc_id for doc_id in candidates if term in self._entries[doc_id][0]}
+
+    def references(self, document_id: str) -> Dict[str, List[str]]:
+        """文档元数据中的引用 (keywords / urls / citations)，文档不在索引中时为空"""
+        with self._lock:
+            references = self._references.get(document_id)
+            return {key: list(values) for key, values in references.items()} if references else \
+                {'keywords': [], 'urls': [], 'citations': []}
+
+    def referencing_ids(self, title: Optional[str], source_identifier: Optional[str],
+                        keywords: Iterable[str]) -> Set[str]:
+        """
+        查找元数据引用可能指向具有这些属性的文档的文档 ID (入边候选)：
+        urls 包含 source_identifier、citations 包含标题、关键词与 keywords 相同或是标题的子串。
+        """
+        normalized_title = normalize_term(title) if title else ""
+        with self._lock:
+            candidates: Set[str] = set()
+            if source_identifier:
+                candidates |= self._url_refs.get(str(source_identifier).strip(), set())
+            if normalized_title:
+                candidates |= self._citation_refs.get(normalized_title, set())
+                # 扫描一次标题找出其中出现的所有已声明关键词，开销与标题长度相关，与关键词总数无关
+                for ids in self._keyword_automaton.find_all(normalized_title).values():
+                    candidates |= ids
+            for keyword in keywords:
+                candidates |= self._keyword_index.get(normalize_term(keyword), set())
+            return candidates
+
+    def _add(self, document_id: str, title: Optional[str], source_identifier: Optional[str],
+             metadata: Optional[Dict[str, Any]]):
+        normalized_title = normalize_term(title) if title else ""
+        source = str(source_identifier).strip() if source_identifier else ""
+        references = extract_meta_references(metadata)
+        keywords = {normalize_term(keyword) for keyword in references['keywords']}
+        keywords.discard("")
+        self._entries[document_id] = (normalized_title, source, keywords)
+        if any(references.values()):
+            self._references[document_id] = references
+        for url in references['urls']:
+            self._url_refs[url.strip()].add(document_id)
+        for citation in references['citations']:
+            self._citation_refs[normalize_term(citation)].add(document_id)
+        if normalized_title:
+            self._title_index[normalized_title].add(document_id)
+            for gram in _title_grams(normalized_title):
+                self._title_gram_index[gram].add(document_id)
+        if source:
+            self._source_index[source].add(document_id)
+        for keyword in keywords:
+            self._keyword_index[keyword].add(document_id)
+            self._keyword_automaton.add(keyword, document_id)
+
+    def _remove(self, document_id: str):
+        entry = self._entries.pop(document_id, None)
+        if entry is None:
+            return
+        normalized_title, source, keywords = entry
+        if normalized_title:
+            self._discard(self._title_index, normalized_title, document_id)
+            for gram in _title_grams(normalized_title):
+                self._discard(self._title_gram_index, gram, document_id)
+        if source:
+            self._discard(self._source_index, source, document_id)
+        for keyword in keywords:
+            self._discard(self._keyword_index, keyword, document_id)
+            self._keyword_automaton.discard(keyword, document_id)
+        references = self._references.pop(document_id, None)
+        if references:
+            for url in references['urls']:
+                self._discard(self._url_refs, url.strip(), document_id)
+            for citation in references['citations']:
+                self._discard(self._citation_refs, normalize_term(citation), document_id)
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], key: str, document_id: str):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(document_id)
+            if not ids:
+                del index[key]
+
+    # DocumentStorage 监听器接口
+    def on_documents_upserted(self, rows: List[Dict[str, Any]]):
+        self.update_documents(rows)
+
+    def on_documents_deleted(self, document_ids: List[str]):
+        self.remove_documents(document_ids)
+
+
+# 每个数据库一个索引实例，键为数据库 URL
+_indexes: Dict[str, MetaReferenceIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_meta_reference_index(db_session: Session) -> MetaReferenceIndex:
+    """获取 db_session 所在数据库的进程级元数据引用索引，首次调用时构建并注册为文档写入监听器"""
+    key = str(db_session.get_bind().url)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = MetaReferenceIndex()
+                # 先注册监听器再构建：构建期间的写入会在锁上等待构建完成后再应用，不会丢失
+                register_document_listener(key, index)
+                index.build(db_session)
+                _indexes[key] = index
+    return index
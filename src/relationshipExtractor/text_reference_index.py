@@ -0,0 +1,318 @@
+# text_reference_index.py
+# 正文引用索引：所有文档标题和 ID 的 Aho-Corasick 自动机 + 正文词元倒排表，供 DependencyBuilder 使用
+
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..documentRepository.database_models import DocumentDB
+from ..documentRepository.document_storage import DocumentStorage, register_document_listener
+
+# 短于该长度的标题不作为提及模式，避免大量误匹配
+MIN_TITLE_LENGTH = 4
+# 不短于该长度的英文/数字词额外以前缀和后缀作为倒排表的键 (例如文档 ID 中的 md5)
+AFFIX_LENGTH = 8
+
+# 英文/数字词元与中日韩字符
+_WORD_PATTERN = re.compile(r'[0-9a-z_]+')
+_CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯]+')
+
+def tokenize(text: str) -> Set[str]:
+    """
+    将文本切分为用于倒排表的词元：英文/数字按词 (小写)，中日韩文本按相邻两字 (单字文本取单字)。
+    一个字符串出现在文本中时，它的词元基本都出现在文本的词元中，例外情况见 TextReferenceIndex._candidate_tokens。
+    """
+    text = text.lower()
+    tokens = set(_WORD_PATTERN.findall(text))
+    for run in _CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.add(run)
+        else:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def index_tokens(text: str) -> Set[str]:
+    """
+    正文写入倒排表的键：tokenize 的词元，加上长词的前缀键 ('^' + 前 AFFIX_LENGTH 个字符) 和后缀键 ('$' + 后 AFFIX_LENGTH 个字符)。
+    检索词首尾的词在正文中可能与相邻字符连成更长的词，但该词仍是正文词的后缀 (首词) 或前缀 (尾词)，可以通过这两种键查找。
+    """
+    tokens = tokenize(text)
+    affixes = set()
+    for token in tokens:
+        if len(token) >= AFFIX_LENGTH and _WORD_PATTERN.fullmatch(token):
+            affixes.add('^' + token[:AFFIX_LENGTH])
+            affixes.add('$' + token[-AFFIX_LENGTH:])
+    tokens |= affixes
+    return tokens
+
+class AhoCorasickAutomaton:
+    """
+    多模式字符串匹配自动机，一次扫描文本找出其中出现的全部模式。
+
+    模式可以随时增删：新增模式只插入字典树，失败链接在下一次扫描前惰性重建；
+    删除模式只清除终止标记，不需要重建。
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._terminal: List[Optional[str]] = [None] # 节点对应的完整模式 (非终止节点为 None)
+        self._fail: List[int] = [0]
+        self._output_link: List[int] = [0] # 沿失败链接最近的终止节点
+        self._values: Dict[str, Set[str]] = {} # 模式 -> 关联的值 (文档 ID)
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, pattern: str, value: str):
+        """添加模式及其关联值"""
+        if not pattern:
+            return
+        values = self._values.get(pattern)
+        if values is not None:
+            values.add(value)
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._terminal.append(None)
+                self._fail.append(0)
+                self._output_link.append(0)
+            node = next_node
+        self._terminal[node] = pattern
+        self._values[pattern] = {value}
+        self._dirty = True
+
+    def discard(self, pattern: str, value: str):
+        """移除模式的一个关联值，模式没有关联值后不再匹配"""
+        values = self._values.get(pattern)
+        if values is None:
+            return
+        values.discard(value)
+        if values:
+            return
+        del self._values[pattern]
+        node = 0
+        for char in pattern:
+            node = self._goto[node][char]
+        self._terminal[node] = None
+
+    def find_all(self, text: str) -> Dict[str, Set[str]]:
+        """
+        扫描文本一次，返回出现的模式及其关联值。
+
+        Returns:
+            {pattern: values}
+        """
+        if self._dirty:
+            self._build_links()
+        goto, fail, terminal, output_link = self._goto, self._fail, self._terminal, self._output_link
+        found: Set[str] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            node = state if terminal[state] is not None else output_link[state]
+            while node:
+                pattern = terminal[node]
+                if pattern is not None:
+                    found.add(pattern)
+                node = output_link[node]
+        return {pattern: set(self._values[pattern]) for pattern in found if pattern in self._values}
+
+    def _build_links(self):
+        """按层 (BFS) 重建失败链接和输出链接"""
+        queue = list(self._goto[0].values())
+        for child in queue:
+            self._fail[child] = 0
+            self._output_link[child] = 0
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self._goto[node].items():
+                state = self._fail[node]
+                while state and char not in self._goto[state]:
+                    state = self._fail[state]
+                fail = self._goto[state].get(char, 0)
+                self._fail[child] = fail
+                self._output_link[child] = fail if self._terminal[fail] is not None else self._output_link[fail]
+                queue.append(child)
+        self._dirty = False
+
+class TextReferenceIndex:
+    """
+    文档正文引用索引：
+
+    - 标题和文档 ID 的 Aho-Corasick 自动机：一次扫描一篇正文即可找到它提及的所有文档 (出边)；
+    - 正文词元 -> 文档的倒排表：新文档的标题/ID 被哪些文档提及 (入边)，只需对倒排表求交集得到候选再校验。
+
+    一次流式遍历 documents 表构建，之后通过 DocumentStorage 的监听器随文档写入/删除增量更新。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._automaton = AhoCorasickAutomaton()
+        self._patterns: Dict[str, List[Tuple[str, str]]] = {} # id -> [(pattern, relation_type)]
+        self._doc_numbers: Dict[str, int] = {} # 文档 ID -> 倒排表中使用的整数编号
+        self._doc_ids: List[Optional[str]] = []
+        self._free_numbers: List[int] = [] # 已删除文档释放的编号，新文档优先复用
+        self._doc_tokens: Dict[int, Set[str]] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def build(self, db_session: Session):
+        """清空索引并一次流式遍历 documents 表重建"""
+        print("Building text reference index...")
+        with self._lock:
+            self._automaton = AhoCorasickAutomaton()
+            self._patterns.clear()
+            self._doc_numbers.clear()
+            self._doc_ids.clear()
+            self._free_numbers.clear()
+            self._doc_tokens.clear()
+            self._postings.clear()
+            for row in DocumentStorage(db_session).iter_documents(DocumentDB.title, DocumentDB.cleaned_text):
+                self.add_document(row.id, row.title, row.cleaned_text)
+        print(f"Text reference index built with {len(self._patterns)} documents and {len(self._postings)} tokens.")
+
+    def add_document(self, document_id: str, title: Optional[str], cleaned_text: Optional[str]):
+        """写入或替换单个文档的模式和正文词元"""
+        with self._lock:
+            self._remove(document_id)
+            patterns = [(document_id, 'mention_id')]
+            if title is not None and len(str(title)) >= MIN_TITLE_LENGTH:
+                patterns.append((str(title), 'mention_title'))
+            for pattern, _ in patterns:
+                self._automaton.add(pattern, document_id)
+            self._patterns[document_id] = patterns
+
+            if self._free_numbers:
+                number = self._free_numbers.pop()
+                self._doc_ids[number] = document_id
+            else:
+                number = len(self._doc_ids)
+                self._doc_ids.append(document_id)
+            self._doc_numbers[document_id] = number
+            tokens = index_tokens(cleaned_text) if cleaned_text else set()
+            self._doc_tokens[number] = tokens
+            for token in tokens:
+                self._postings[token].add(number)
+
+    def remove_documents(self, document_ids: Iterable[str]):
+        """从索引中移除文档"""
+        with self._lock:
+            for document_id in document_ids:
+                self._remove(document_id)
+
+    def find_mentions(self, text: Optional[str]) -> List[Tuple[str, str]]:
+        """
+        扫描正文，返回其中提及的文档。
+
+        Returns:
+            [(target_id, relation_type)]，relation_type 为 'mention_id' 或 'mention_title'。
+        """
+        if not text:
+            return []
+        with self._lock:
+            matches = self._automaton.find_all(text)
+            mentions = set()
+            for pattern, document_ids in matches.items():
+                for document_id in document_ids:
+                    for own_pattern, relation_type in self._patterns.get(document_id, ()):
+                        if own_pattern == pattern:
+                            mentions.add((document_id, relation_type))
+            return sorted(mentions)
+
+    def candidate_ids(self, term: str) -> Set[str]:
+        """
+        正文可能包含 term 的文档 ID (候选集合，调用方需要用原文校验)。
+        term 首尾的英文词在正文中可能是更长词的一部分，不能按完整词元查找，长词改用后缀/前缀键。
+        term 没有可用的键时 (例如只有一个短英文词) 返回全部文档。
+        """
+        with self._lock:
+            tokens = self._candidate_tokens(term)
+            if not tokens:
+                numbers: Iterable[int] = self._doc_tokens.keys()
+            else:
+                postings = sorted((self._postings.get(token, set()) for token in tokens), key=len)
+                numbers = set(postings[0]).intersection(*postings[1:])
+            return {self._doc_ids[number] for number in numbers if self._doc_ids[number] is not None}
+
+    @staticmethod
+    def _candidate_tokens(term: str) -> Set[str]:
+        term = term.lower()
+        # 单个中日韩字符在正文中可能属于更长的连续文本，只会产生双字词元
+        tokens = {token for token in tokenize(term) if len(token) > 1 or not _CJK_PATTERN.fullmatch(token)}
+        words = _WORD_PATTERN.findall(term)
+        if words:
+            # 首尾的词可能在正文中与相邻字符连成更长的词 (例如 "api" 出现在 "rapid" 中)，不能要求正文包含完整词元
+            first, last = words[0], words[-1]
+            starts, ends = term.startswith(first), term.endswith(last)
+            if starts:
+                tokens.discard(first)
+            if ends:
+                tokens.discard(last)
+            # 首词只可能向左延伸，它仍是正文中某个词的后缀；尾词同理是前缀。
+            # 只有一个词且它就是整个 term 时两端都可能延伸，无法使用这两种键
+            single = len(words) == 1 and starts and ends
+            if starts and not single and len(first) >= AFFIX_LENGTH:
+                tokens.add('$' + first[-AFFIX_LENGTH:])
+            if ends and not single and len(last) >= AFFIX_LENGTH:
+                tokens.add('^' + last[:AFFIX_LENGTH])
+        return tokens
+
+    def _remove(self, document_id: str):
+        patterns = self._patterns.pop(document_id, None)
+        if patterns is not None:
+            for pattern, _ in patterns:
+                self._automaton.discard(pattern, document_id)
+        number = self._doc_numbers.pop(document_id, None)
+        if number is not None:
+            self._doc_ids[number] = None
+            self._free_numbers.append(number)
+            for token in self._doc_tokens.pop(number, ()):
+                ids = self._postings.get(token)
+                if ids is not None:
+                    ids.discard(number)
+                    if not ids:
+                        del self._postings[token]
+
+    # DocumentStorage 监听器接口
+    def on_documents_upserted(self, rows: List[Dict[str, Any]]):
+        with self._lock:
+            for row in rows:
+                self.add_document(row['id'], row.get('title'), row.get('cleaned_text'))
+
+    def on_documents_deleted(self, document_ids: List[str]):
+        self.remove_documents(document_ids)
+
+
+# 每个数据库一个索引实例，键为数据库 URL
+_indexes: Dict[str, TextReferenceIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_text_reference_index(db_session: Session) -> TextReferenceIndex:
+    """获取 db_session 所在数据库的进程级正文引用索引，首次调用时构建并注册为文档写入监听器"""
+    key = str(db_session.get_bind().url)
+    index = _indexes.get(key)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = TextReferenceIndex()
+                # 先注册监听器再构建：构建期间的写入会在锁上等待构建完成后再应用，不会丢失
+                register_document_listener(key, index)
+                index.build(db_session)
+                _indexes[key] = index
+    return index
@@ -0,0 +1,90 @@
+# service_container.py 进程级服务容器
+# 负责：每个进程只创建一次重量级对象（嵌入模型、Chroma 客户端、摄取器），并按请求提供数据库会话
+
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from .documentRepository.database_models import SessionLocal, engine
+from .documentRepository.dependency_storage import DependencyStorage
+from .documentRepository.document_storage import DocumentStorage
+from .purseContent.ingestion_coordinator import IngestionCoordinator
+from .ai_retrieval.embedder import EmbeddingComponent
+from .ai_retrieval.vector_db_manager import VectorDBManager
+from .ai_retrieval.ingestor import DocumentIngestor
+from .ai_retrieval.retriever import Retriever
+from .relationshipExtractor.dependency_graph import get_dependency_graph
+from .file_assiant import FileAssiant
+
+class ServiceContainer:
+    """
+    进程级服务容器。
+
+    重量级、线程安全的对象 (包括内存中的依赖图) 在这里创建一次并在请求之间共享；
+    数据库会话不是线程安全的，因此每个请求通过 session() / file_assiant() 获取自己的会话。
+    """
+    def __init__(self):
+        print("Initializing service container...")
+        self.ingestion_coordinator = IngestionCoordinator()
+        self.vector_db_manager = VectorDBManager()
+        self.embedding_component = EmbeddingComponent()
+        # 嵌入模型由进程级注册表加载一次，启动时预热，第一个请求不再承担初始化开销
+        self.embedding_component.warm_up()
+        self.document_ingestor = DocumentIngestor(
+            embedder=self.embedding_component,
+            db_manager=self.vector_db_manager
+        )
+        self.retriever = Retriever(
+            embedding_component=self.embedding_component,
+            vector_db_manager=self.vector_db_manager
+        )
+        # 将旧 document_dependencies 表中的依赖迁移到 document_edges (只执行一次)
+        with self.session() as db:
+            DependencyStorage(db).migrate_legacy_dependencies()
+            # 全文索引表在启动时创建 (首次创建时回填已有文档)，检索请求中不再触发建表和回填
+            DocumentStorage(db).fulltext_index()
+            # 依赖图常驻内存，之后随依赖边的写入增量刷新
+            self.dependency_graph = get_dependency_graph(db)
+        print("Service container initialized.")
+
+    @contextmanager
+    def session(self) -> Iterator[Session]:
+        """提供一个请求级数据库会话，使用结束后自动关闭"""
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def file_assiant(self) -> Iterator[FileAssiant]:
+        """提供一个绑定请求级会话、复用共享服务的 FileAssiant"""
+        with self.session() as db:
+            yield FileAssiant(db_session=db, services=self)
+
+    def close(self):
+        """释放容器持有的资源"""
+        engine.dispose()
+
+
+_container: Optional[ServiceContainer] = None
+_container_lock = threading.Lock()
+
+def get_service_container() -> ServiceContainer:
+    """获取进程级服务容器，首次调用时创建"""
+    global _container
+    if _container is None:
+        with _container_lock:
+            if _container is None:
+                _container = ServiceContainer()
+    return _container
+
+def shutdown_service_container():
+    """关闭并丢弃进程级服务容器"""
+    global _container
+    with _container_lock:
+        if _container is not None:
+            _container.close()
+            _container = None
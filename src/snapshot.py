@@ -0,0 +1,398 @@
+# snapshot.py 知识库快照的导出与导入
+# 负责：把文档、依赖边、规则、块文本和嵌入向量导出为一个带版本号的快照目录，
+# 并在新副本上直接批量导入 (不加载嵌入模型、不重新解析和切分文档)。
+#
+# 用法：
+#   python -m src.snapshot export <snapshot_dir>
+#   python -m src.snapshot import <snapshot_dir> [--allow-model-mismatch]
+#
+# 快照目录结构：
+#   manifest.json       格式版本、创建时间、嵌入模型、各文件的行数和 sha256
+#   documents.jsonl.gz  documents 表的全部列，每行一个文档 (按 ID 排序)
+#   edges.npz           依赖边的列式数组：source/target 为文档在 documents.jsonl.gz 中的序号，
+#                       relation 为 manifest 中 relation_types 的下标，weight 为 float32
+#   rules.jsonl.gz      rules 表的全部列
+#   chunks.jsonl.gz     块 ID、文本和元数据，每行一个块
+#   embeddings.f32      与 chunks.jsonl.gz 逐行对齐的 float32 嵌入矩阵 (行优先，无文件头)
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert # 导入 PostgreSQL 的 ON CONFLICT 语法
+from sqlalchemy.orm import Session
+
+from .documentRepository.database_models import DocumentDB, RuleDB, SessionLocal
+from .documentRepository.dependency_storage import DependencyStorage
+from .documentRepository.document_storage import DocumentStorage
+from .ai_retrieval.embedder import EMBEDDING_MODEL_CONFIG
+from .ai_retrieval.vector_db_manager import VectorDBManager, CHROMA_COLLECTION_NAME
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+DOCUMENTS_FILE = "documents.jsonl.gz"
+EDGES_FILE = "edges.npz"
+RULES_FILE = "rules.jsonl.gz"
+CHUNKS_FILE = "chunks.jsonl.gz"
+EMBEDDINGS_FILE = "embeddings.f32"
+
+# 快照记录并校验的嵌入模型配置项 (推理设备不影响向量，不参与比较)
+_MODEL_KEYS = ("provider", "model_name")
+
+# 需要在 JSON 中以 ISO 字符串保存的时间列
+_DATETIME_COLUMNS = {'ingestion_timestamp', 'updated_date', 'created_at', 'updated_at'}
+
+def _embedding_model() -> Dict[str, Any]:
+    return {key: EMBEDDING_MODEL_CONFIG.get(key) for key in _MODEL_KEYS}
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _encode_row(row: Dict[str, Any]) -> str:
+    return json.dumps(
+        {key: (value.isoformat() if isinstance(value, datetime) else value) for key, value in row.items()},
+        ensure_ascii=False
+    )
+
+def _decode_row(line: str) -> Dict[str, Any]:
+    row = json.loads(line)
+    for key in _DATETIME_COLUMNS:
+        if row.get(key):
+            row[key] = datetime.fromisoformat(row[key])
+    return row
+
+def _read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield _decode_row(line)
+
+class SnapshotExporter:
+    """
+    将知识库导出为快照目录。
+
+    关系数据库部分在同一个只读事务中读取，保证文档、依赖边和规则彼此一致；
+    在该事务结束前分页读取 Chroma，只保留属于快照中文档的块。
+    服务进程可能在导出期间写入 Chroma，因此每个块都与同一事务中读到的文档正文核对：
+    块文本须等于 cleaned_text[start_offset:end_offset]，同一文档的 chunk_index 不能重复 (重新摄取进行到一半)。
+    核对失败时放弃本次导出；在没有写入的时段 (暂停上传和向量化) 导出可以避免失败。
+    快照先写入临时目录，全部完成后再改名，中途失败不会留下不完整的快照。
+    """
+
+    def __init__(self, db_session: Session, vector_db_manager: VectorDBManager, batch_size: int = 500):
+        self.db_session = db_session
+        self.vector_db_manager = vector_db_manager
+        self.batch_size = batch_size
+
+    def export(self, directory: str) -> Dict[str, Any]:
+        """
+        导出快照。
+
+        Args:
+            directory: 快照目录，必须不存在。
+
+        Returns:
+            写入的 manifest。
+        """
+        if os.path.exists(directory):
+            raise FileExistsError(f"Snapshot directory already exists: {directory}")
+        print(f"====================开始导出快照到 {directory}...====================")
+        started = time.perf_counter()
+        partial = directory.rstrip(os.sep) + ".partial"
+        shutil.rmtree(partial, ignore_errors=True)
+        os.makedirs(partial)
+        try:
+            self._begin_consistent_read()
+            try:
+                document_ids = self._export_documents(os.path.join(partial, DOCUMENTS_FILE))
+                edge_count, relation_types = self._export_edges(os.path.join(partial, EDGES_FILE), document_ids)
+                rule_count = self._export_rules(os.path.join(partial, RULES_FILE))
+                # 块在只读事务结束前导出，并与事务中读到的文档正文逐块核对
+                chunk_count, dimension = self._export_chunks(
+                    os.path.join(partial, CHUNKS_FILE), os.path.join(partial, EMBEDDINGS_FILE), set(document_ids)
+                )
+            finally:
+                self.db_session.rollback() # 结束只读事务
+
+            manifest = {
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "created_at": datetime.utcnow().isoformat(),
+                "embedding_model": _embedding_model(),
+                "embedding_dim": dimension,
+                "collection_name": CHROMA_COLLECTION_NAME,
+                "relation_types": relation_types,
+                "counts": {
+                    "documents": len(document_ids),
+                    "edges": edge_count,
+                    "rules": rule_count,
+                    "chunks": chunk_count,
+                },
+                "files": {
+                    name: _sha256(os.path.join(partial, name))
+                    for name in (DOCUMENTS_FILE, EDGES_FILE, RULES_FILE, CHUNKS_FILE, EMBEDDINGS_FILE)
+                },
+            }
+            with open(os.path.join(partial, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(partial, directory)
+        except Exception:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        print(f"完成快照导出: {manifest['counts']}，耗时 {time.perf_counter() - started:.2f}s。")
+        return manifest
+
+    def _begin_consistent_read(self):
+        """开启一个覆盖后续全部查询的只读事务 (数据库快照)"""
+        dialect = self.db_session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            self.db_session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        elif dialect == 'sqlite':
+            # pysqlite 不会为 SELECT 自动开启事务，显式 BEGIN 后读取的都是同一个数据库快照
+            self.db_session.connection().exec_driver_sql("BEGIN")
+
+    def _export_documents(self, path: str) -> List[str]:
+        columns = [column for column in DocumentDB.__table__.columns if column.name != 'id']
+        document_ids = []
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for row in DocumentStorage(self.db_session).iter_documents(
+                *(getattr(DocumentDB, column.key) for column in columns), batch_size=self.batch_size
+            ):
+                document_ids.append(row.id)
+                f.write(_encode_row(dict(row._mapping)) + "\n")
+        return document_ids
+
+    def _export_edges(self, path: str, document_ids: List[str]):
+        numbers = {document_id: number for number, document_id in enumerate(document_ids)}
+        relation_codes: Dict[str, int] = {}
+        sources, targets, relations, weights = [], [], [], []
+        for source_id, target_id, relation_type, weight in DependencyStorage(self.db_session).iter_edges():
+            source, target = numbers.get(source_id), numbers.get(target_id)
+            if source is None or target is None:
+                continue # 指向已删除文档的残留边
+            sources.append(source)
+            targets.append(target)
+            relations.append(relation_codes.setdefault(relation_type, len(relation_codes)))
+            weights.append(weight)
+        np.savez_compressed(
+            path,
+            source=np.asarray(sources, dtype=np.int32),
+            target=np.asarray(targets, dtype=np.int32),
+            relation=np.asarray(relations, dtype=np.int16),
+            weight=np.asarray(weights, dtype=np.float32),
+        )
+        return len(sources), list(relation_codes)
+
+    def _export_rules(self, path: str) -> int:
+        count = 0
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for rule in self.db_session.query(RuleDB).order_by(RuleDB.id):
+                row = {column.name: getattr(rule, column.key) for column in RuleDB.__table__.columns}
+                f.write(_encode_row(row) + "\n")
+                count += 1
+        return count
+
+    def _export_chunks(self, chunks_path: str, embeddings_path: str, document_ids: set):
+        count, dimension = 0, None
+        seen_indexes: Dict[str, Set[int]] = {}
+        with gzip.open(chunks_path, 'wt', encoding='utf-8') as chunks_file, open(embeddings_path, 'wb') as vectors_file:
+            for batch in self.vector_db_manager.iter_chunks(batch_size=self.batch_size):
+                keep = [i for i, metadata in enumerate(batch["metadatas"])
+                        if (metadata or {}).get('document_id') in document_ids]
+                if not keep:
+                    continue
+                self._check_chunks(batch, keep, seen_indexes)
+                embeddings = batch["embeddings"][keep]
+                if dimension is None:
+                    dimension = int(embeddings.shape[1])
+                elif embeddings.shape[1] != dimension:
+                    raise ValueError(f"Inconsistent embedding dimension in collection: {embeddings.shape[1]} != {dimension}")
+                for i in keep:
+                    chunks_file.write(json.dumps(
+                        {"id": batch["ids"][i], "text": batch["documents"][i], "metadata": batch["metadatas"][i]},
+                        ensure_ascii=False
+                    ) + "\n")
+                np.ascontiguousarray(embeddings, dtype=np.float32).tofile(vectors_file)
+                count += len(keep)
+        return count, dimension
+
+    def _check_chunks(self, batch: Dict[str, Any], keep: List[int], seen_indexes: Dict[str, Set[int]]):
+        """
+        核对一批块与只读事务中的文档正文是否一致，不一致说明导出期间有文档被重新摄取。
+        没有偏移量的旧块只检查 chunk_index 是否重复。
+        """
+        batch_document_ids = list({batch["metadatas"][i]['document_id'] for i in keep})
+        texts = dict(self.db_session.query(DocumentDB.id, DocumentDB.cleaned_text).filter(
+            DocumentDB.id.in_(batch_document_ids)
+        ).all())
+        for i in keep:
+            metadata = batch["metadatas"][i]
+            document_id = metadata['document_id']
+            chunk_index = metadata.get('chunk_index')
+            if chunk_index is not None:
+                indexes = seen_indexes.setdefault(document_id, set())
+                if chunk_index in indexes:
+                    raise RuntimeError(
+                        f"Document '{document_id}' has two chunks with index {chunk_index}; it was being re-ingested "
+                        f"during the export. Retry the export while no uploads or vectorization are running."
+                    )
+                indexes.add(chunk_index)
+            start, end = metadata.get('start_offset'), metadata.get('end_offset')
+            if start is not None and end is not None and (texts.get(document_id) or "")[start:end] != batch["documents"][i]:
+                raise RuntimeError(
+                    f"Chunk '{batch['ids'][i]}' does not match the exported text of document '{document_id}'; "
+                    f"it changed during the export. Retry the export while no uploads or vectorization are running."
+                )
+
+class SnapshotImporter:
+    """
+    从快照目录批量导入知识库。
+
+    写入任何数据之前先校验格式版本和每个文件的 sha256；
+    文档按原样写入 (保留 ID、时间戳和向量化状态)，依赖边整体替换，规则按名称覆盖，
+    块和嵌入直接写入 Chroma，整个过程不加载嵌入模型。
+    """
+
+    def __init__(self, db_session: Session, vector_db_manager: VectorDBManager, batch_size: int = 500):
+        self.db_session = db_session
+        self.vector_db_manager = vector_db_manager
+        self.batch_size = batch_size
+
+    def import_snapshot(self, directory: str, allow_model_mismatch: bool = False) -> Dict[str, Any]:
+        """
+        导入快照。
+
+        Args:
+            directory: 快照目录。
+            allow_model_mismatch: 快照的嵌入模型与当前配置不同时是否仍然导入 (否则报错)。
+
+        Returns:
+            快照的 manifest。
+        """
+        print(f"====================开始从 {directory} 导入快照...====================")
+        started = time.perf_counter()
+        manifest = self.verify(directory)
+        if manifest["embedding_model"] != _embedding_model():
+            message = (f"Snapshot embedding model {manifest['embedding_model']} differs from "
+                       f"configured model {_embedding_model()}")
+            if not allow_model_mismatch:
+                raise ValueError(message)
+            print(f"Warning: {message}; query embeddings will not match imported chunks.")
+
+        document_count = DocumentStorage(self.db_session).import_rows(
+            _read_jsonl(os.path.join(directory, DOCUMENTS_FILE)), batch_size=self.batch_size
+        )
+        print(f"Imported {document_count} documents.")
+        edge_count = self._import_edges(directory, manifest)
+        print(f"Imported {edge_count} edges.")
+        rule_count = self._import_rules(os.path.join(directory, RULES_FILE))
+        print(f"Imported {rule_count} rules.")
+        chunk_count = self._import_chunks(directory, manifest)
+        print(f"Imported {chunk_count} chunks.")
+        print(f"完成快照导入，耗时 {time.perf_counter() - started:.2f}s。"
+              f"中心性分数不包含在快照中，如有需要请重新计算。")
+        return manifest
+
+    @staticmethod
+    def verify(directory: str) -> Dict[str, Any]:
+        """读取 manifest 并校验格式版本和文件校验和"""
+        with open(os.path.join(directory, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+        for name, checksum in manifest["files"].items():
+            if _sha256(os.path.join(directory, name)) != checksum:
+                raise ValueError(f"Checksum mismatch for snapshot file: {name}")
+        return manifest
+
+    def _import_edges(self, directory: str, manifest: Dict[str, Any]) -> int:
+        document_ids = [row['id'] for row in _read_jsonl(os.path.join(directory, DOCUMENTS_FILE))]
+        relation_types = manifest["relation_types"]
+        with np.load(os.path.join(directory, EDGES_FILE)) as arrays:
+            edges = [
+                (document_ids[source], document_ids[target], relation_types[relation], weight)
+                for source, target, relation, weight in zip(
+                    arrays["source"].tolist(), arrays["target"].tolist(),
+                    arrays["relation"].tolist(), arrays["weight"].tolist()
+                )
+            ]
+        return DependencyStorage(self.db_session).replace_all_edges(edges)
+
+    def _import_rules(self, path: str) -> int:
+        rows = [{key: value for key, value in row.items() if key != 'id'} for row in _read_jsonl(path)]
+        if not rows:
+            return 0
+        insert_stmt = insert(RuleDB).values(rows)
+        upsert_stmt = insert_stmt.on_conflict_do_update(
+            index_elements=['name'],
+            set_={key: insert_stmt.excluded[key] for key in rows[0] if key != 'name'}
+        )
+        try:
+            self.db_session.execute(upsert_stmt)
+            self.db_session.commit()
+        except Exception as e:
+            self.db_session.rollback()
+            print(f"Error importing rules: {str(e)}")
+            raise
+        return len(rows)
+
+    def _import_chunks(self, directory: str, manifest: Dict[str, Any]) -> int:
+        count = manifest["counts"]["chunks"]
+        if count == 0:
+            return 0
+        embeddings = np.memmap(os.path.join(directory, EMBEDDINGS_FILE), dtype=np.float32, mode='r',
+                               shape=(count, manifest["embedding_dim"]))
+        ids, texts, metadatas = [], [], []
+        offset = 0
+        with gzip.open(os.path.join(directory, CHUNKS_FILE), 'rt', encoding='utf-8') as f:
+            for line in f:
+                chunk = json.loads(line)
+                ids.append(chunk["id"])
+                texts.append(chunk["text"])
+                metadatas.append(chunk["metadata"])
+                if len(ids) == self.batch_size:
+                    self.vector_db_manager.upsert_embeddings(ids, embeddings[offset:offset + len(ids)], texts, metadatas)
+                    offset += len(ids)
+                    ids, texts, metadatas = [], [], []
+        if ids:
+            self.vector_db_manager.upsert_embeddings(ids, embeddings[offset:offset + len(ids)], texts, metadatas)
+            offset += len(ids)
+        return offset
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Export or import a knowledge base snapshot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export documents, edges, rules, chunks and embeddings.")
+    export_parser.add_argument("directory")
+    import_parser = subparsers.add_parser("import", help="Bulk-load a snapshot without running the embedding model.")
+    import_parser.add_argument("directory")
+    import_parser.add_argument("--allow-model-mismatch", action="store_true",
+                               help="Import even if the snapshot was embedded with a different model.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        vector_db_manager = VectorDBManager()
+        if args.command == "export":
+            SnapshotExporter(db, vector_db_manager, batch_size=args.batch_size).export(args.directory)
+        else:
+            SnapshotImporter(db, vector_db_manager, batch_size=args.batch_size).import_snapshot(
+                args.directory, allow_model_mismatch=args.allow_model_mismatch
+            )
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from mcp.server.fastmcp import FastMCP
-from src.file_assiant import FileAssiant
+from src.service_container import get_service_container
 import asyncio
 import os
 
@@ -22,8 +22,8 @@ def upload_file(source_type: str, file_path: str) -> str:
     Returns:
         str: 文件检测结果报告+文件是否成功加入知识库【信息】
     """
-    assiant = FileAssiant()
-    return assiant.upload_file(source_type, file_path)
+    with get_service_container().file_assiant() as assiant:
+        return assiant.upload_file(source_type, file_path)
 
 @mcp.tool(name='upload_text')
 def upload_text(text_content: str ,title: str) -> str:
@@ -41,8 +41,8 @@ def upload_text(text_content: str ,title: str) -> str:
     Returns:
         str containing the result of "文字是否成功加入知识库【信息】"
     """
-    assiant = FileAssiant()
-    return assiant.upload_text(text_content,title)
+    with get_service_container().file_assiant() as assiant:
+        return assiant.upload_text(text_content,title)
 
 @mcp.tool()
 def check_file(source_type: str, file_path: str) -> str:
@@ -58,8 +58,8 @@ def check_file(source_type: str, file_path: str) -> str:
     Returns:
         文件检测结果报告
     """
-    assiant = FileAssiant()
-    return assiant.check_file_type(source_type, file_path)
+    with get_service_container().file_assiant() as assiant:
+        return assiant.check_file_type(source_type, file_path)
 
 @mcp.tool()
 def upload_rule(rule: dict) -> str:
@@ -89,8 +89,8 @@ def upload_rule(rule: dict) -> str:
     Returns:
         str : 规则是否成功加入数据库【信息】
     """
-    assiant = FileAssiant()
-    return assiant.add_rule(rule)
+    with get_service_container().file_assiant() as assiant:
+        return assiant.add_rule(rule)
 
 @mcp.tool()
 def set_rule_status(rule_name: str, is_active: bool) -> str:
@@ -111,8 +111,8 @@ def set_rule_status(rule_name: str, is_active: bool) -> str:
     Returns:
         str: 规则是否成功设置激活状态【信息】
     """
-    assiant = FileAssiant()
-    return assiant.set_rule_status(rule_name, is_active)
+    with get_service_container().file_assiant() as assiant:
+        return assiant.set_rule_status(rule_name, is_active)
 
 @mcp.tool()
 def build_dependency() -> str:
@@ -127,8 +127,8 @@ def build_dependency() -> str:
     Returns:
         数据库中所有数据的依赖关系【信息】
     """
-    assiant = FileAssiant()
-    return assiant.build_all_dependency()
+    with get_service_container().file_assiant() as assiant:
+        return assiant.build_all_dependency()
 
 @mcp.tool()
 def build_vector_db() -> str:
@@ -143,8 +143,8 @@ def build_vector_db() -> str:
     Returns:
         向量数据库是否成功建立【信息】
     """
-    assiant = FileAssiant()
-    return assiant.vectorize_all_documents()
+    with get_service_container().file_assiant() as assiant:
+        return assiant.vectorize_all_documents()
 
 @mcp.tool()
 def update_vector_db() -> str:
@@ -159,8 +159,8 @@ def update_vector_db() -> str:
     Returns:
         向量数据库是否成功更新【信息】
     """
-    assiant = FileAssiant()
-    return assiant.update_vec_database()
+    with get_service_container().file_assiant() as assiant:
+        return assiant.update_vec_database()
 
 @mcp.tool()
 def search(query: str) -> list:
@@ -175,10 +175,12 @@ def search(query: str) -> list:
     Returns:
         搜索结果
     """
-    assiant = FileAssiant()
-    return assiant.retrieve_with_dependencies(query)
+    with get_service_container().file_assiant() as assiant:
+        return assiant.retrieve_with_dependencies(query)
 
 async def main():
+    # 启动时加载一次进程级服务，避免第一个工具调用承担模型加载时间
+    get_service_container()
     transport = os.getenv("TRANSPORT", "sse")
     if transport == "sse":
         # Run the MCP server with sse transport